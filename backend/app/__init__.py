@@ -25,6 +25,18 @@ def create_app(test_config=None):
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=1)
     app.config['JWT_REFRESH_TOKEN_EXPIRES'] = timedelta(days=30)
     
+    # Cache of authenticated doctor identities shared by all routes
+    from .services.identity import init_identity_cache
+    init_identity_cache(app)
+    
+    # In-memory patient x diagnosis matrices for similar-patient lookups
+    from .services.patient_similarity import init_patient_similarity
+    init_patient_similarity(app)
+    
+    # Cached listing totals, invalidated by committed writes
+    from .services.counts import init_count_cache
+    init_count_cache(app)
+    
     # Import and register blueprints
     # Import here to avoid circular imports
     from .routes.patients import patients_bp
@@ -35,6 +47,7 @@ def create_app(test_config=None):
     from .routes.statistics import statistics_bp
     from .routes.notes import notes_bp
     from .routes.doctors import doctors_bp
+    from .routes.audit import audit_bp
     
     app.register_blueprint(patients_bp, url_prefix='/api')
     app.register_blueprint(appointments_bp, url_prefix='/api')
@@ -44,9 +57,39 @@ def create_app(test_config=None):
     app.register_blueprint(statistics_bp, url_prefix='/api')
     app.register_blueprint(notes_bp, url_prefix='/api')
     app.register_blueprint(doctors_bp, url_prefix='/api')
+    app.register_blueprint(audit_bp, url_prefix='/api')
+    
+    # Keep statistics rollups current on every flush
+    from .services import rollups  # noqa: F401
+    
+    # Keep diagnosis/medicine co-occurrence counts current on every flush
+    from .services import cooccurrence  # noqa: F401
+    
+    # Keep patient search tokens current on every flush
+    from .services import patient_search  # noqa: F401
+    
+    # Keep MinHash signatures and LSH buckets current on every flush
+    from .services import patient_lsh  # noqa: F401
+    
+    # Full-text search structures are created alongside the notes table
+    from .services import note_search  # noqa: F401
+    
+    # Register CLI commands
+    from .cli import register_cli
+    register_cli(app)
     
     # Create database tables
     with app.app_context():
         db.create_all()
     
+    # In-memory catalog search indexes, kept in sync on commit
+    from .services.search_index import init_search_indexes
+    init_search_indexes(app)
+    
+    # Batched audit trail written off the request path into monthly partitions
+    from .services.activity_partitions import init_activity_partitions
+    from .services.audit import init_audit
+    init_activity_partitions(app)
+    init_audit(app)
+    
     return app
\ No newline at end of file
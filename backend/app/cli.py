@@ -0,0 +1,143 @@
+import click
+from flask.cli import AppGroup
+
+stats_cli = AppGroup('stats', help='Statistics maintenance commands.')
+
+@stats_cli.command('rebuild-rollups')
+@click.option('--doctor-id', type=int, default=None, help='Only rebuild rollups for this doctor id.')
+def rebuild_rollups_command(doctor_id):
+    """Recompute the daily statistics rollups from the fact tables"""
+    from app.services.rollups import rebuild_rollups
+    
+    written = rebuild_rollups(doctor_id)
+    click.echo(f"Rebuilt {written} rollup rows")
+
+@stats_cli.command('rebuild-cooccurrence')
+def rebuild_cooccurrence_command():
+    """Recompute the diagnosis/medicine co-occurrence counts behind medicine recommendations"""
+    from app.services.cooccurrence import rebuild_pair_counts
+    
+    written = rebuild_pair_counts()
+    click.echo(f"Rebuilt {written} co-occurrence rows")
+
+patients_cli = AppGroup('patients', help='Patient maintenance commands.')
+
+@patients_cli.command('rebuild-search-index')
+@click.option('--doctor-id', type=int, default=None, help='Only rebuild search tokens for this doctor id.')
+def rebuild_patient_search_command(doctor_id):
+    """Recompute the patient search tokens from the patients table"""
+    from app.services.patient_search import rebuild_patient_search_tokens
+    
+    written = rebuild_patient_search_tokens(doctor_id)
+    click.echo(f"Rebuilt {written} patient search tokens")
+
+@patients_cli.command('rebuild-similarity-index')
+@click.option('--doctor-id', type=int, default=None, help='Only rebuild signatures for this doctor id.')
+def rebuild_similarity_index_command(doctor_id):
+    """Recompute the MinHash signatures and LSH buckets from the patient diagnoses"""
+    from app.services.patient_lsh import rebuild_patient_signatures
+    
+    indexed = rebuild_patient_signatures(doctor_id)
+    click.echo(f"Indexed {indexed} patients")
+
+@patients_cli.command('benchmark-similarity')
+@click.option('--doctor-id', type=int, required=True, help='Doctor whose patients are sampled.')
+@click.option('--samples', type=int, default=100, help='Number of patients to query.')
+@click.option('--limit', type=int, default=10, help='Number of similar patients per query.')
+def benchmark_similarity_command(doctor_id, samples, limit):
+    """Compare approximate (LSH) similar-patient lookups with the exact ones"""
+    from app.services.patient_lsh import benchmark_lsh
+    
+    result = benchmark_lsh(doctor_id, samples, limit)
+    click.echo(f"Patients: {result['patients']}, samples: {result['samples']}, top {result['limit']}")
+    click.echo(f"Recall: {result['recall']:.3f}")
+    click.echo(f"Exact: {result['exact_ms']:.2f} ms/query, approximate: {result['approximate_ms']:.2f} ms/query")
+
+notes_cli = AppGroup('notes', help='Clinical note maintenance commands.')
+
+@notes_cli.command('rebuild-search-index')
+def rebuild_note_search_command():
+    """Create the note full-text search index if missing and reindex all notes"""
+    from app.services.note_search import rebuild_note_search_index
+    
+    rebuild_note_search_index()
+    click.echo("Rebuilt note search index")
+
+indexes_cli = AppGroup('indexes', help='Database index maintenance commands.')
+
+@indexes_cli.command('ensure')
+def ensure_indexes_command():
+    """Create the indexes declared on the models that are missing from the database"""
+    from app.extensions import db
+    
+    created = 0
+    with db.engine.begin() as connection:
+        inspector = db.inspect(connection)
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(connection)
+                    click.echo(f"Created index {index.name}")
+                    created += 1
+    
+    click.echo(f"Created {created} missing indexes")
+
+audit_cli = AppGroup('audit', help='Activity log maintenance commands.')
+
+@audit_cli.command('partitions')
+def list_partitions_command():
+    """List the monthly activity log partitions"""
+    from app.extensions import db
+    from app.services.activity_partitions import get_activity_partitions
+    
+    with db.engine.connect() as connection:
+        for month, name in get_activity_partitions().partitions(connection):
+            click.echo(f"{name}\t{month:%Y-%m}")
+
+@audit_cli.command('ensure-partitions')
+@click.option('--months-ahead', type=int, default=2, help='Also create partitions for this many future months.')
+def ensure_partitions_command(months_ahead):
+    """Create the activity log partitions of the current and upcoming months"""
+    from datetime import date
+    from app.extensions import db
+    from app.services.activity_partitions import get_activity_partitions, month_start, next_month
+    
+    month = month_start(date.today())
+    with db.engine.begin() as connection:
+        for _ in range(months_ahead + 1):
+            click.echo(f"Ensured partition {get_activity_partitions().ensure(connection, month)}")
+            month = next_month(month)
+
+@audit_cli.command('archive')
+@click.option('--retention-months', type=int, default=None,
+              help='Months of activity to keep, including the current one (default: ACTIVITY_LOG_RETENTION_MONTHS).')
+@click.option('--directory', default=None, help='Archive directory (default: ACTIVITY_LOG_ARCHIVE_DIR).')
+@click.option('--dry-run', is_flag=True, help='Only report what would be archived.')
+def archive_activity_command(retention_months, directory, dry_run):
+    """Move activity older than the retention period into compressed archive files"""
+    from flask import current_app
+    from app.services.activity_partitions import archive_activity_logs, retention_cutoff
+    
+    if retention_months is None:
+        retention_months = current_app.config.get('ACTIVITY_LOG_RETENTION_MONTHS', 12)
+    if directory is None:
+        directory = current_app.config.get('ACTIVITY_LOG_ARCHIVE_DIR', 'archive/activity_logs')
+    
+    cutoff = retention_cutoff(retention_months)
+    archived = archive_activity_logs(cutoff, directory, dry_run=dry_run)
+    
+    for month, rows in archived:
+        click.echo(f"{'Would archive' if dry_run else 'Archived'} {month:%Y-%m}: {rows} rows")
+    click.echo(f"{'Would archive' if dry_run else 'Archived'} {sum(rows for _, rows in archived)} rows "
+               f"older than {cutoff:%Y-%m-%d}")
+
+def register_cli(app):
+    """Register maintenance commands with the Flask CLI"""
+    app.cli.add_command(stats_cli)
+    app.cli.add_command(patients_cli)
+    app.cli.add_command(notes_cli)
+    app.cli.add_command(indexes_cli)
+    app.cli.add_command(audit_cli)
@@ -14,6 +14,59 @@ DEBUG = os.getenv('FLASK_DEBUG', 'False').lower() in ('true', '1', 't')
 
 # JWT configuration
 JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'dev-jwt-secret')
+# Sign the doctor's id and active flag into access tokens; they can only narrow access
+JWT_EMBED_DOCTOR_CLAIMS = os.getenv('JWT_EMBED_DOCTOR_CLAIMS', 'True').lower() in ('true', '1', 't')
+
+# Doctor identity cache (resolved JWT identities). Deleted or deactivated
+# doctors are seen by other workers once their entry expires.
+DOCTOR_IDENTITY_CACHE_SIZE = int(os.getenv('DOCTOR_IDENTITY_CACHE_SIZE', 1024))
+DOCTOR_IDENTITY_CACHE_TTL = int(os.getenv('DOCTOR_IDENTITY_CACHE_TTL', 300))  # seconds
+
+# Total count strategy for paginated listings: exact, cached or estimate (PostgreSQL planner).
+# Cached totals are only invalidated by writes of the same process; other
+# workers can serve totals up to COUNT_CACHE_TTL old, so opt endpoints in.
+COUNT_STRATEGY = os.getenv('COUNT_STRATEGY', 'exact')
+# Per-endpoint overrides keyed by endpoint name, e.g. {'notes.get_notes': 'estimate'}
+COUNT_STRATEGIES = {}
+COUNT_CACHE_SIZE = int(os.getenv('COUNT_CACHE_SIZE', 4096))
+COUNT_CACHE_TTL = int(os.getenv('COUNT_CACHE_TTL', 60))  # seconds
+
+# Working hours used by the availability finder
+SCHEDULE_DAY_START = os.getenv('SCHEDULE_DAY_START', '09:00')
+SCHEDULE_DAY_END = os.getenv('SCHEDULE_DAY_END', '17:00')
+SCHEDULE_SLOT_STEP = int(os.getenv('SCHEDULE_SLOT_STEP', 15))  # minutes
+SCHEDULE_WORKING_DAYS = (0, 1, 2, 3, 4)  # Monday to Friday
+
+# Extra weight of a doctor's own prescriptions in medicine recommendations (0 = clinic-wide counts only)
+RECOMMENDATION_DOCTOR_WEIGHT = float(os.getenv('RECOMMENDATION_DOCTOR_WEIGHT', 1.0))
+
+# Seconds before a similar-patient matrix is reloaded to pick up other workers' writes
+PATIENT_SIMILARITY_TTL = int(os.getenv('PATIENT_SIMILARITY_TTL', 300))
+
+# Most appointments a single bulk/recurring request may create
+BULK_APPOINTMENT_LIMIT = int(os.getenv('BULK_APPOINTMENT_LIMIT', 5000))
+
+# Load the in-memory catalog search indexes at startup instead of on first search
+SEARCH_INDEX_PRELOAD = os.getenv('SEARCH_INDEX_PRELOAD', 'True').lower() in ('true', '1', 't')
+
+# Seconds before a catalog search index is rebuilt to pick up other processes' writes
+MEDICINE_SEARCH_INDEX_TTL = int(os.getenv('MEDICINE_SEARCH_INDEX_TTL', 300))
+DIAGNOSIS_SEARCH_INDEX_TTL = int(os.getenv('DIAGNOSIS_SEARCH_INDEX_TTL', 300))
+
+# Audit trail: events are queued and written in batches by a background thread.
+# AUDIT_DURABILITY is 'async' (return once queued) or 'sync' (wait for the batch commit)
+AUDIT_REQUESTS = os.getenv('AUDIT_REQUESTS', 'False').lower() in ('true', '1', 't')
+AUDIT_BACKGROUND_WRITER = os.getenv('AUDIT_BACKGROUND_WRITER', 'True').lower() in ('true', '1', 't')
+AUDIT_DURABILITY = os.getenv('AUDIT_DURABILITY', 'async')
+AUDIT_QUEUE_SIZE = int(os.getenv('AUDIT_QUEUE_SIZE', 10000))
+AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', 500))
+AUDIT_FLUSH_INTERVAL = float(os.getenv('AUDIT_FLUSH_INTERVAL', 1.0))  # seconds
+AUDIT_OVERFLOW = os.getenv('AUDIT_OVERFLOW', 'block')  # 'block' (up to AUDIT_ENQUEUE_TIMEOUT) or 'drop'
+AUDIT_ENQUEUE_TIMEOUT = float(os.getenv('AUDIT_ENQUEUE_TIMEOUT', 1.0))  # seconds
+
+# Activity log retention: older monthly partitions are moved to gzipped archives
+ACTIVITY_LOG_RETENTION_MONTHS = int(os.getenv('ACTIVITY_LOG_RETENTION_MONTHS', 12))
+ACTIVITY_LOG_ARCHIVE_DIR = os.getenv('ACTIVITY_LOG_ARCHIVE_DIR', 'archive/activity_logs')
 
 # File storage configuration
 UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', 'uploads')
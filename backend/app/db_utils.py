@@ -1,6 +1,13 @@
 from app.extensions import db
+from sqlalchemy import and_, or_, tuple_
 from sqlalchemy.exc import SQLAlchemyError
-from flask import current_app
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
+from flask import current_app, request
+from app.services.counts import count_query, count_strategy
+from datetime import datetime, date, time
+import base64
+import json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -43,11 +50,191 @@ def delete_from_db(obj):
         logger.error(f"Error deleting from database: {str(e)}")
         return False
 
-def get_paginated_results(query, page, per_page=None):
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor can't be decoded"""
+
+# Type tags for cursor values JSON can't represent natively
+_CURSOR_TYPES = {
+    'dt': (datetime, datetime.isoformat, datetime.fromisoformat),
+    'd': (date, date.isoformat, date.fromisoformat),
+    't': (time, time.isoformat, time.fromisoformat)
+}
+
+def encode_cursor(values):
+    """
+    Encode the sort key values of the last row of a page as an opaque cursor
+    """
+    encoded = []
+    for value in values:
+        for tag, (value_type, dump, _) in _CURSOR_TYPES.items():
+            if isinstance(value, value_type):
+                value = {tag: dump(value)}
+                break
+        encoded.append(value)
+    
+    raw = json.dumps(encoded, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor back into sort key values
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        encoded = json.loads(raw)
+        values = []
+        for value in encoded:
+            if isinstance(value, dict):
+                (tag, text), = value.items()
+                value = _CURSOR_TYPES[tag][2](text)
+            values.append(value)
+        return values
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        raise InvalidCursor(str(e))
+
+def check_cursor_values(values, columns):
+    """
+    Check decoded cursor values against the columns they are compared with,
+    so a crafted cursor can't reach the query with the wrong types
     """
-    Helper function to get paginated results from a query
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise InvalidCursor("Cursor does not match the sort order")
+    
+    for value, column in zip(values, columns):
+        if value is None:
+            continue
+        try:
+            expected = column.type.python_type
+        except NotImplementedError:
+            expected = object
+        if expected is float:
+            expected = (int, float)
+        if isinstance(value, bool) or not isinstance(value, expected):
+            raise InvalidCursor(f"Invalid cursor value for {column.key}")
+
+def _sort_key(expression):
+    """Split an ORDER BY expression into (column, descending)"""
+    if isinstance(expression, UnaryExpression) and expression.modifier in (operators.desc_op, operators.asc_op):
+        return expression.element, expression.modifier is operators.desc_op
+    return expression, False
+
+def keyset_filter(sort_keys, values):
+    """
+    Condition selecting the rows sorted after the given key values.
+    Keys sharing one direction use a row-value comparison; mixed directions
+    expand to (a > x) OR (a = x AND b > y) ...
+    """
+    directions = {descending for _, descending in sort_keys}
+    columns = [column for column, _ in sort_keys]
+    
+    if len(directions) == 1:
+        if directions.pop():
+            return tuple_(*columns) < tuple_(*values)
+        return tuple_(*columns) > tuple_(*values)
+    
+    conditions = []
+    for i, (column, descending) in enumerate(sort_keys):
+        after = column < values[i] if descending else column > values[i]
+        conditions.append(and_(*[columns[j] == values[j] for j in range(i)], after))
+    return or_(*conditions)
+
+class CursorPagination:
+    """
+    One page of keyset pagination.
+    The total is only counted when requested, since the COUNT(*) is what
+    gets slower as tables grow.
+    """
+    def __init__(self, items, per_page, next_cursor, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.has_next = next_cursor is not None
+        self.total = total
+
+def get_cursor_results(query, order_by, cursor='', per_page=None, with_total=False):
+    """
+    Helper function to get a page of results after a cursor.
+    `order_by` must end with a unique column (usually the id) so the sort
+    key identifies each row; an empty cursor starts at the first page.
     """
     if per_page is None:
         per_page = current_app.config.get('ITEMS_PER_PAGE', 20)
+    per_page = max(per_page, 1)
+    
+    sort_keys = [_sort_key(expression) for expression in order_by]
+    total = count_query(query) if with_total else None
+    
+    if cursor:
+        values = decode_cursor(cursor)
+        check_cursor_values(values, [column for column, _ in sort_keys])
+        query = query.filter(keyset_filter(sort_keys, values))
+    
+    rows = query.order_by(*order_by).limit(per_page + 1).all()
+    items = rows[:per_page]
+    
+    next_cursor = None
+    if len(rows) > per_page:
+        last = items[-1]
+        next_cursor = encode_cursor([getattr(last, column.key) for column, _ in sort_keys])
+    
+    return CursorPagination(items, per_page, next_cursor, total)
+
+def get_paginated_results(query, page, per_page=None, order_by=None, cursor=None, with_total=False):
+    """
+    Helper function to get paginated results from a query.
+    Passing a cursor (empty for the first page) switches to keyset pagination
+    over `order_by`; otherwise classic page/offset pagination is used.
+    """
+    if cursor is not None and order_by is not None:
+        return get_cursor_results(query, order_by, cursor, per_page, with_total)
+    
+    if per_page is None:
+        per_page = current_app.config.get('ITEMS_PER_PAGE', 20)
+    
+    if order_by is not None:
+        query = query.order_by(*order_by)
+    
+    # Totals come from the endpoint's count strategy (exact, cached or estimate)
+    strategy = count_strategy()
+    if strategy == 'exact':
+        return query.paginate(page=page, per_page=per_page, error_out=False)
+    
+    pagination = query.paginate(page=page, per_page=per_page, error_out=False, count=False)
+    pagination.total = count_query(query, strategy)
+    pagination.total_estimated = strategy == 'estimate'
+    return pagination
+
+def cursor_args():
+    """
+    Keyset pagination arguments of the current request (?cursor=...&include_total=true)
+    """
+    return {
+        "cursor": request.args.get('cursor'),
+        "with_total": request.args.get('include_total', 'false').lower() in ('true', '1')
+    }
+
+def pagination_info(pagination):
+    """
+    Pagination metadata for list responses (offset or cursor based)
+    """
+    if isinstance(pagination, CursorPagination):
+        info = {
+            "per_page": pagination.per_page,
+            "has_next": pagination.has_next,
+            "next_cursor": pagination.next_cursor
+        }
+        if pagination.total is not None:
+            info["total"] = pagination.total
+        return info
     
-    return query.paginate(page=page, per_page=per_page, error_out=False)
\ No newline at end of file
+    info = {
+        "total": pagination.total,
+        "pages": pagination.pages,
+        "page": pagination.page,
+        "per_page": pagination.per_page,
+        "has_next": pagination.has_next,
+        "has_prev": pagination.has_prev
+    }
+    if getattr(pagination, 'total_estimated', False):
+        info["total_estimated"] = True
+    return info
\ No newline at end of file
@@ -61,6 +61,13 @@ class Patient(db.Model):
     diagnoses = db.relationship('PatientDiagnosis', backref='patient', lazy=True)
     notes = db.relationship('Note', backref='patient', lazy=True)
     
+    __table_args__ = (
+        # Patient listing / search results: doctor_id = ? ORDER BY last_name, first_name
+        db.Index('ix_patients_doctor_name', 'doctor_id', 'last_name', 'first_name'),
+        # Exports and new-patient ranges: doctor_id = ? AND created_at BETWEEN ...
+        db.Index('ix_patients_doctor_created_at', 'doctor_id', 'created_at'),
+    )
+    
     def __repr__(self):
         return f'<Patient {self.first_name} {self.last_name}>'
 
@@ -85,6 +92,13 @@ class Appointment(db.Model):
     # Relationships
     prescription = db.relationship('Prescription', backref='appointment', lazy=True, uselist=False)
     
+    __table_args__ = (
+        # Listings, calendar and conflict checks: doctor_id = ? AND date ... ORDER BY date, start_time
+        db.Index('ix_appointments_doctor_date', 'doctor_id', 'date', 'start_time'),
+        # Patient-filtered listings
+        db.Index('ix_appointments_patient_date', 'patient_id', 'date'),
+    )
+    
     def __repr__(self):
         return f'<Appointment {self.id} - {self.date} {self.start_time}>'
 
@@ -144,6 +158,15 @@ class PatientDiagnosis(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        # Patient diagnosis lists and duplicate checks
+        db.Index('ix_patient_diagnoses_patient_diagnosis', 'patient_id', 'diagnosis_id'),
+        # Diagnosis usage and deletion checks
+        db.Index('ix_patient_diagnoses_diagnosis', 'diagnosis_id'),
+        # Eager loading of prescription diagnoses
+        db.Index('ix_patient_diagnoses_prescription', 'prescription_id'),
+    )
+    
     def __repr__(self):
         return f'<PatientDiagnosis {self.id}>'
 
@@ -167,6 +190,13 @@ class Prescription(db.Model):
     items = db.relationship('PrescriptionItem', backref='prescription', lazy=True, cascade="all, delete-orphan")
     diagnoses = db.relationship('PatientDiagnosis', backref='prescription', lazy=True, cascade="all, delete-orphan")
     
+    __table_args__ = (
+        # Listings and statistics: doctor_id = ? ORDER BY issue_date DESC
+        db.Index('ix_prescriptions_doctor_issue_date', 'doctor_id', 'issue_date'),
+        # Patient prescription history
+        db.Index('ix_prescriptions_patient_issue_date', 'patient_id', 'issue_date'),
+    )
+    
     def __repr__(self):
         return f'<Prescription {self.id}>'
 
@@ -185,6 +215,13 @@ class PrescriptionItem(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        # Eager loading of prescription items
+        db.Index('ix_prescription_items_prescription', 'prescription_id'),
+        # Top medicines and medicine deletion checks
+        db.Index('ix_prescription_items_medicine', 'medicine_id'),
+    )
+    
     def __repr__(self):
         return f'<PrescriptionItem {self.id}>'
 
@@ -206,6 +243,14 @@ class Note(db.Model):
     
     # Relationships
     tags = db.relationship('NoteTag', backref='note', lazy=True)
+    appointment = db.relationship('Appointment', lazy=True)
+    
+    __table_args__ = (
+        # Listings: doctor_id = ? ORDER BY created_at DESC
+        db.Index('ix_notes_doctor_created_at', 'doctor_id', 'created_at'),
+        # Patient-filtered listings
+        db.Index('ix_notes_patient_created_at', 'patient_id', 'created_at'),
+    )
     
     def __repr__(self):
         return f'<Note {self.id}>'
@@ -236,6 +281,13 @@ class NoteTag(db.Model):
     tag_id = db.Column(db.Integer, db.ForeignKey('tags.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        # Eager loading of note tags
+        db.Index('ix_note_tags_note', 'note_id'),
+        # Tag filters: tag_id = ? joined to notes
+        db.Index('ix_note_tags_tag_note', 'tag_id', 'note_id'),
+    )
+    
     def __repr__(self):
         return f'<NoteTag {self.id}>'
 
@@ -257,5 +309,100 @@ class ActivityLog(db.Model):
     # Relationship
     doctor = db.relationship('Doctor', backref='activity_logs')
     
+    __table_args__ = (
+        # Per-doctor activity history
+        db.Index('ix_activity_logs_doctor_timestamp', 'doctor_id', 'timestamp'),
+        # History of one entity
+        db.Index('ix_activity_logs_entity', 'entity_type', 'entity_id', 'timestamp'),
+    )
+    
+    def __repr__(self):
+        return f'<ActivityLog {self.id}>'
+
+class DailyStatRollup(db.Model):
+    """Per-doctor daily counters kept current incrementally for the statistics endpoints"""
+    __tablename__ = 'daily_stat_rollups'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
+    metric = db.Column(db.String(30), nullable=False)  # appointments, prescriptions, new_patients, diagnoses
+    day = db.Column(db.Date, nullable=False)
+    dimension = db.Column(db.String(50), nullable=False, default='')  # appointment status, diagnosis id, etc.
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('doctor_id', 'metric', 'day', 'dimension', name='uq_daily_stat_rollup'),
+    )
+    
+    def __repr__(self):
+        return f'<DailyStatRollup {self.metric} {self.day} {self.dimension}: {self.count}>'
+
+
+
+class DiagnosisMedicineStat(db.Model):
+    """How often each doctor prescribed a medicine together with a diagnosis, kept current incrementally"""
+    __tablename__ = 'diagnosis_medicine_stats'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    diagnosis_id = db.Column(db.Integer, db.ForeignKey('diagnoses.id'), nullable=False)
+    medicine_id = db.Column(db.Integer, db.ForeignKey('medicines.id'), nullable=False)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    last_seen = db.Column(db.Date)  # latest issue date of a prescription with the pair
+    
+    __table_args__ = (
+        db.UniqueConstraint('diagnosis_id', 'medicine_id', 'doctor_id', name='uq_diagnosis_medicine_stat'),
+    )
+    
+    def __repr__(self):
+        return f'<DiagnosisMedicineStat {self.diagnosis_id}-{self.medicine_id}: {self.count}>'
+
+
+class PatientSearchToken(db.Model):
+    """Normalized per-doctor search keys of a patient (name tokens, phone digits, DOB, email)"""
+    __tablename__ = 'patient_search_tokens'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id', ondelete='CASCADE'), nullable=False, index=True)
+    kind = db.Column(db.String(10), nullable=False)  # name, phone, dob, email
+    token = db.Column(db.String(120), nullable=False)
+    
+    __table_args__ = (
+        # Prefix scans: doctor_id = ? AND kind = ? AND token >= ? AND token < ?
+        db.Index('ix_patient_search_tokens_lookup', 'doctor_id', 'kind', 'token'),
+    )
+    
+    def __repr__(self):
+        return f'<PatientSearchToken {self.kind}:{self.token}>'
+
+
+class PatientSignature(db.Model):
+    """MinHash signature of a patient's set of diagnoses"""
+    __tablename__ = 'patient_signatures'
+    
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id', ondelete='CASCADE'), primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
+    signature = db.Column(db.Text, nullable=False)  # comma-separated minimum hash values
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<PatientSignature {self.patient_id}>'
+
+
+class PatientLSHBucket(db.Model):
+    """Locality-sensitive hashing bucket of one band of a patient's MinHash signature"""
+    __tablename__ = 'patient_lsh_buckets'
+    
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id', ondelete='CASCADE'), primary_key=True)
+    band = db.Column(db.SmallInteger, primary_key=True)
+    bucket = db.Column(db.BigInteger, nullable=False)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
+    
+    __table_args__ = (
+        # Candidate lookups: band = ? AND bucket = ? (AND doctor_id = ?)
+        db.Index('ix_patient_lsh_buckets_lookup', 'band', 'bucket', 'doctor_id'),
+    )
+    
     def __repr__(self):
-        return f'<ActivityLog {self.id}>'
\ No newline at end of file
+        return f'<PatientLSHBucket {self.band}:{self.bucket}>'
@@ -1,9 +1,14 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models.models import Appointment, Doctor, Patient
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required
+from app.models.models import Appointment, Patient
+from app.services.identity import get_current_doctor
+from app.services.scheduling import (
+    find_conflicts, find_free_slots, load_schedules, expand_recurrence, to_minutes, NON_BLOCKING_STATUSES
+)
 from app import db
-from app.db_utils import add_to_db, commit_changes, delete_from_db, get_paginated_results
-from sqlalchemy import or_, and_
+from app.db_utils import (
+    add_to_db, commit_changes, delete_from_db, get_paginated_results, cursor_args, pagination_info, InvalidCursor
+)
 from datetime import datetime, date, time, timedelta
 import uuid
 
@@ -15,8 +20,7 @@ def get_appointments():
     """
     Get all appointments for the current doctor with optional filtering and pagination
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -58,10 +62,12 @@ def get_appointments():
         query = query.filter_by(status=status)
     
     # Order by date and time
-    query = query.order_by(Appointment.date, Appointment.start_time)
-    
-    # Get paginated results
-    pagination = get_paginated_results(query, page, per_page)
+    try:
+        pagination = get_paginated_results(
+            query, page, per_page, order_by=[Appointment.date, Appointment.start_time, Appointment.id], **cursor_args()
+        )
+    except InvalidCursor:
+        return jsonify({"msg": "Invalid cursor"}), 400
     
     # Format results
     appointments = []
@@ -83,14 +89,7 @@ def get_appointments():
     
     return jsonify({
         "appointments": appointments,
-        "pagination": {
-            "total": pagination.total,
-            "pages": pagination.pages,
-            "page": pagination.page,
-            "per_page": pagination.per_page,
-            "has_next": pagination.has_next,
-            "has_prev": pagination.has_prev
-        }
+        "pagination": pagination_info(pagination)
     }), 200
 
 @appointments_bp.route('/appointments/<string:appointment_uuid>', methods=['GET'])
@@ -99,8 +98,7 @@ def get_appointment(appointment_uuid):
     """
     Get a specific appointment by UUID
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -141,8 +139,7 @@ def create_appointment():
     if not request.is_json:
         return jsonify({"msg": "Missing JSON in request"}), 400
     
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -173,17 +170,7 @@ def create_appointment():
         return jsonify({"msg": "End time must be after start time"}), 400
     
     # Check for conflicting appointments
-    conflicts = Appointment.query.filter(
-        Appointment.doctor_id == doctor.id,
-        Appointment.date == appointment_date,
-        or_(
-            and_(Appointment.start_time <= start_time, Appointment.end_time > start_time),
-            and_(Appointment.start_time < end_time, Appointment.end_time >= end_time),
-            and_(Appointment.start_time >= start_time, Appointment.end_time <= end_time)
-        )
-    ).all()
-    
-    if conflicts:
+    if find_conflicts(doctor.id, appointment_date, start_time, end_time):
         return jsonify({"msg": "This time slot conflicts with an existing appointment"}), 409
     
     # Create new appointment
@@ -212,6 +199,157 @@ def create_appointment():
     
     return jsonify({"msg": "Error creating appointment"}), 500
 
+@appointments_bp.route('/appointments/bulk', methods=['POST'])
+@jwt_required()
+def create_appointments_bulk():
+    """
+    Create many appointments at once, from an explicit list and/or a recurring
+    series, in a single transaction with a per-occurrence result report.
+    Conflicts or invalid occurrences abort the whole batch unless
+    allow_partial is set, in which case only the valid ones are created.
+    """
+    if not request.is_json:
+        return jsonify({"msg": "Missing JSON in request"}), 400
+    
+    doctor = get_current_doctor()
+    
+    if not doctor:
+        return jsonify({"msg": "Doctor not found"}), 404
+    
+    data = request.get_json()
+    if not isinstance(data, dict) or not isinstance(data.get('appointments', []), list):
+        return jsonify({"msg": "Expected an object with an appointments list"}), 400
+    
+    limit = current_app.config.get('BULK_APPOINTMENT_LIMIT', 5000)
+    allow_partial = bool(data.get('allow_partial', False))
+    
+    # Defaults shared by every occurrence
+    defaults = {field: data[field] for field in ('patient_id', 'start_time', 'end_time', 'reason', 'notes', 'status')
+                if field in data}
+    
+    # Non-object entries are kept so every result index lines up with the input
+    entries = [dict(defaults, **entry) if isinstance(entry, dict) else entry for entry in data.get('appointments', [])]
+    
+    recurrence = data.get('recurrence')
+    if recurrence:
+        if not isinstance(recurrence, dict) or 'rule' not in recurrence or 'start_date' not in recurrence:
+            return jsonify({"msg": "recurrence needs a rule and a start_date"}), 400
+        try:
+            series_start = datetime.strptime(recurrence['start_date'], '%Y-%m-%d').date()
+            dates = expand_recurrence(recurrence['rule'], series_start, limit)
+        except (ValueError, TypeError) as e:
+            return jsonify({"msg": f"Invalid recurrence: {e}"}), 400
+        entries.extend(dict(defaults, date=day.strftime('%Y-%m-%d')) for day in dates)
+    
+    if not entries:
+        return jsonify({"msg": "No appointments to create"}), 400
+    
+    if len(entries) > limit:
+        return jsonify({"msg": f"At most {limit} appointments can be created at once"}), 400
+    
+    # One lookup for every patient in the batch
+    patient_uuids = {entry['patient_id'] for entry in entries
+                     if isinstance(entry, dict) and isinstance(entry.get('patient_id'), str)}
+    patients = dict(db.session.query(Patient.uuid, Patient.id).filter(
+        Patient.doctor_id == doctor.id,
+        Patient.uuid.in_(patient_uuids)
+    ).all()) if patient_uuids else {}
+    
+    # Parse and validate every occurrence
+    results = []
+    parsed = []
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            results.append({"index": index, "date": None, "status": 'invalid', "msg": "Appointment must be an object"})
+            continue
+        
+        result = {"index": index, "date": entry.get('date')}
+        results.append(result)
+        
+        missing = [field for field in ('patient_id', 'date', 'start_time', 'end_time') if not entry.get(field)]
+        if missing:
+            result.update(status='invalid', msg=f"Missing {', '.join(missing)}")
+            continue
+        
+        wrong_types = [field for field in ('patient_id', 'date', 'start_time', 'end_time', 'reason', 'notes', 'status')
+                       if entry.get(field) is not None and not isinstance(entry[field], str)]
+        if wrong_types:
+            result.update(status='invalid', msg=f"{', '.join(wrong_types)} must be a string")
+            continue
+        
+        if entry['patient_id'] not in patients:
+            result.update(status='invalid', msg="Patient not found")
+            continue
+        
+        try:
+            appointment_date = datetime.strptime(entry['date'], '%Y-%m-%d').date()
+            start_time = datetime.strptime(entry['start_time'], '%H:%M').time()
+            end_time = datetime.strptime(entry['end_time'], '%H:%M').time()
+        except (ValueError, TypeError):
+            result.update(status='invalid', msg="Invalid date or time format. Use YYYY-MM-DD for date and HH:MM for times")
+            continue
+        
+        if start_time >= end_time:
+            result.update(status='invalid', msg="End time must be after start time")
+            continue
+        
+        result.update(start_time=entry['start_time'], end_time=entry['end_time'])
+        parsed.append((result, entry, appointment_date, start_time, end_time))
+    
+    # Check every occurrence against existing bookings and each other using one range query
+    new_appointments = []
+    if parsed:
+        schedules = load_schedules(doctor.id, min(p[2] for p in parsed), max(p[2] for p in parsed))
+        
+        for result, entry, appointment_date, start_time, end_time in parsed:
+            schedule = schedules[appointment_date]
+            start, end = to_minutes(start_time), to_minutes(end_time)
+            
+            conflicts = schedule.conflicts(start, end)
+            if conflicts:
+                result.update(status='conflict', msg="This time slot conflicts with an existing appointment",
+                              conflicts=conflicts)
+                continue
+            
+            appointment = Appointment(
+                uuid=str(uuid.uuid4()),
+                doctor_id=doctor.id,
+                patient_id=patients[entry['patient_id']],
+                date=appointment_date,
+                start_time=start_time,
+                end_time=end_time,
+                reason=entry.get('reason'),
+                status=entry.get('status', 'scheduled'),
+                notes=entry.get('notes')
+            )
+            if appointment.status not in NON_BLOCKING_STATUSES:
+                schedule.add(start, end, appointment.uuid)
+            
+            result.update(status='created', id=appointment.uuid)
+            new_appointments.append(appointment)
+    
+    failed = [result for result in results if result['status'] != 'created']
+    if failed and not allow_partial:
+        for result in results:
+            if result['status'] == 'created':
+                result.update(status='not_created')
+                result.pop('id')
+        
+        status_code = 400 if any(result['status'] == 'invalid' for result in failed) else 409
+        return jsonify({"msg": "No appointments were created", "created": 0, "results": results}), status_code
+    
+    # Insert everything in one transaction
+    db.session.add_all(new_appointments)
+    if not commit_changes():
+        return jsonify({"msg": "Error creating appointments"}), 500
+    
+    return jsonify({
+        "msg": f"{len(new_appointments)} appointments created",
+        "created": len(new_appointments),
+        "skipped": len(failed),
+        "results": results
+    }), 201
+
 @appointments_bp.route('/appointments/<string:appointment_uuid>', methods=['PUT'])
 @jwt_required()
 def update_appointment(appointment_uuid):
@@ -221,8 +359,7 @@ def update_appointment(appointment_uuid):
     if not request.is_json:
         return jsonify({"msg": "Missing JSON in request"}), 400
     
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -275,16 +412,9 @@ def update_appointment(appointment_uuid):
         appointment.start_time != original_start or
         appointment.end_time != original_end):
         
-        conflicts = Appointment.query.filter(
-            Appointment.doctor_id == doctor.id,
-            Appointment.date == appointment.date,
-            Appointment.id != appointment.id,
-            or_(
-                and_(Appointment.start_time <= appointment.start_time, Appointment.end_time > appointment.start_time),
-                and_(Appointment.start_time < appointment.end_time, Appointment.end_time >= appointment.end_time),
-                and_(Appointment.start_time >= appointment.start_time, Appointment.end_time <= appointment.end_time)
-            )
-        ).all()
+        conflicts = find_conflicts(
+            doctor.id, appointment.date, appointment.start_time, appointment.end_time, exclude_id=appointment.id
+        )
         
         if conflicts:
             return jsonify({"msg": "This time slot conflicts with an existing appointment"}), 409
@@ -318,8 +448,7 @@ def delete_appointment(appointment_uuid):
     """
     Delete an appointment
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -341,8 +470,7 @@ def get_calendar():
     """
     Get calendar view of appointments for a specific date range
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -366,8 +494,20 @@ def get_calendar():
     except ValueError:
         return jsonify({"msg": "Invalid date format. Use YYYY-MM-DD"}), 400
     
-    # Get appointments in date range
-    appointments = Appointment.query.filter(
+    # Project only the calendar columns, joined to the patient's name, in a single query
+    rows = db.session.query(
+        Appointment.uuid,
+        Appointment.date,
+        Appointment.start_time,
+        Appointment.end_time,
+        Appointment.status,
+        Appointment.reason,
+        Patient.uuid.label('patient_uuid'),
+        Patient.first_name,
+        Patient.last_name
+    ).join(
+        Patient, Patient.id == Appointment.patient_id
+    ).filter(
         Appointment.doctor_id == doctor.id,
         Appointment.date >= start,
         Appointment.date <= end
@@ -375,22 +515,21 @@ def get_calendar():
     
     # Format results by date
     calendar = {}
-    for appointment in appointments:
-        date_str = appointment.date.strftime('%Y-%m-%d')
+    for row in rows:
+        date_str = row.date.strftime('%Y-%m-%d')
         
         if date_str not in calendar:
             calendar[date_str] = []
         
-        patient = Patient.query.get(appointment.patient_id)
         calendar[date_str].append({
-            "id": appointment.uuid,
-            "start_time": appointment.start_time.strftime('%H:%M'),
-            "end_time": appointment.end_time.strftime('%H:%M'),
-            "status": appointment.status,
-            "reason": appointment.reason,
+            "id": row.uuid,
+            "start_time": row.start_time.strftime('%H:%M'),
+            "end_time": row.end_time.strftime('%H:%M'),
+            "status": row.status,
+            "reason": row.reason,
             "patient": {
-                "id": patient.uuid,
-                "name": f"{patient.first_name} {patient.last_name}"
+                "id": row.patient_uuid,
+                "name": f"{row.first_name} {row.last_name}"
             }
         })
     
@@ -400,4 +539,63 @@ def get_calendar():
             "start": start_date,
             "end": end_date
         }
-    }), 200
\ No newline at end of file
+    }), 200
+
+@appointments_bp.route('/appointments/availability', methods=['GET'])
+@jwt_required()
+def get_availability():
+    """
+    Find the first free slots of a given length between two dates, and
+    optionally check a proposed slot for conflicts, in one call
+    """
+    doctor = get_current_doctor()
+    
+    if not doctor:
+        return jsonify({"msg": "Doctor not found"}), 404
+    
+    duration = request.args.get('duration', 30, type=int)
+    count = request.args.get('count', 5, type=int)
+    
+    if duration <= 0 or not 1 <= count <= 100:
+        return jsonify({"msg": "duration must be positive and count between 1 and 100"}), 400
+    
+    try:
+        start = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date() if request.args.get('start_date') else date.today()
+        end = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date() if request.args.get('end_date') else start + timedelta(days=14)
+        day_start = to_minutes(datetime.strptime(request.args['day_start'], '%H:%M').time()) if request.args.get('day_start') else None
+        day_end = to_minutes(datetime.strptime(request.args['day_end'], '%H:%M').time()) if request.args.get('day_end') else None
+    except ValueError:
+        return jsonify({"msg": "Invalid date or time format. Use YYYY-MM-DD for dates and HH:MM for times"}), 400
+    
+    if end < start or (end - start).days > 366:
+        return jsonify({"msg": "end_date must be within a year after start_date"}), 400
+    
+    slots = find_free_slots(doctor.id, start, end, duration, count, day_start=day_start, day_end=day_end)
+    
+    result = {
+        "slots": [{
+            "date": day.strftime('%Y-%m-%d'),
+            "start_time": slot_start.strftime('%H:%M'),
+            "end_time": slot_end.strftime('%H:%M')
+        } for day, slot_start, slot_end in slots]
+    }
+    
+    # Optional conflict check for a proposed slot (?date=&start_time=&end_time=)
+    if request.args.get('date'):
+        try:
+            check_date = datetime.strptime(request.args['date'], '%Y-%m-%d').date()
+            check_start = datetime.strptime(request.args.get('start_time', ''), '%H:%M').time()
+            check_end = datetime.strptime(request.args.get('end_time', ''), '%H:%M').time()
+        except ValueError:
+            return jsonify({"msg": "Invalid date or time format. Use YYYY-MM-DD for date and HH:MM for times"}), 400
+        
+        if check_start >= check_end:
+            return jsonify({"msg": "End time must be after start time"}), 400
+        
+        conflicts = find_conflicts(doctor.id, check_date, check_start, check_end)
+        result["check"] = {
+            "available": not conflicts,
+            "conflicts": conflicts
+        }
+    
+    return jsonify(result), 200
\ No newline at end of file
@@ -0,0 +1,72 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required
+from app.services.identity import get_current_doctor
+from app.services.activity_partitions import query_activity
+from app.db_utils import (
+    encode_cursor, decode_cursor, check_cursor_values, pagination_info, CursorPagination, InvalidCursor
+)
+from app.models.models import ActivityLog
+from datetime import datetime, timedelta
+
+audit_bp = Blueprint('audit', __name__)
+
+MAX_PER_PAGE = 200
+
+@audit_bp.route('/audit/logs', methods=['GET'])
+@jwt_required()
+def get_activity_logs():
+    """
+    Get the current doctor's activity history, newest first, filtered by
+    entity, action and date range, with cursor pagination
+    """
+    doctor = get_current_doctor()
+
+    if not doctor:
+        return jsonify({"msg": "Doctor not found"}), 404
+
+    # Get query parameters
+    entity_type = request.args.get('entity_type')
+    entity_id = request.args.get('entity_id', type=int)
+    action = request.args.get('action')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    per_page = min(max(request.args.get('per_page', 50, type=int), 1), MAX_PER_PAGE)
+    cursor = request.args.get('cursor')
+
+    try:
+        start = datetime.strptime(start_date, '%Y-%m-%d') if start_date else None
+        # The end date is inclusive
+        end = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1) if end_date else None
+    except ValueError:
+        return jsonify({"msg": "Invalid date format. Use YYYY-MM-DD"}), 400
+
+    before = None
+    if cursor:
+        try:
+            before = decode_cursor(cursor)
+            check_cursor_values(before, [ActivityLog.timestamp, ActivityLog.id])
+        except InvalidCursor:
+            return jsonify({"msg": "Invalid cursor"}), 400
+
+    rows = query_activity(doctor.id, entity_type, entity_id, action, start, end, before, limit=per_page + 1)
+    items = rows[:per_page]
+
+    next_cursor = None
+    if len(rows) > per_page:
+        next_cursor = encode_cursor([items[-1]['timestamp'], items[-1]['id']])
+
+    pagination = CursorPagination(items, per_page, next_cursor)
+
+    return jsonify({
+        "logs": [{
+            "id": row['id'],
+            "partition": row['partition'],
+            "action": row['action'],
+            "entity_type": row['entity_type'],
+            "entity_id": row['entity_id'],
+            "details": row['details'],
+            "ip_address": row['ip_address'],
+            "timestamp": row['timestamp'].isoformat() if row['timestamp'] else None
+        } for row in items],
+        "pagination": pagination_info(pagination)
+    }), 200
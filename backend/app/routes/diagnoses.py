@@ -1,22 +1,30 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models.models import Diagnosis, Doctor, Patient, PatientDiagnosis
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required
+from app.models.models import Diagnosis, Patient, PatientDiagnosis
+from app.services.identity import get_current_doctor
+from app.services.search_index import get_search_index
+from app.services.diagnosis_search import DIAGNOSIS_INDEX
+from app.services.cooccurrence import recommend_medicines
 from app import db
-from app.db_utils import add_to_db, commit_changes, delete_from_db, get_paginated_results
-from sqlalchemy import or_
-from datetime import datetime
+from app.db_utils import (
+    add_to_db, commit_changes, delete_from_db, get_paginated_results, cursor_args, pagination_info, InvalidCursor
+)
+from datetime import datetime, date
+import math
 import uuid
 
 diagnoses_bp = Blueprint('diagnoses', __name__)
 
+# Largest extra weight of the doctor's own prescriptions in recommendations
+MAX_DOCTOR_WEIGHT = 100.0
+
 @diagnoses_bp.route('/diagnoses', methods=['GET'])
 @jwt_required()
 def get_diagnoses():
     """
     Get all diagnoses with optional filtering and pagination
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -27,51 +35,70 @@ def get_diagnoses():
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
     
+    # Searches are ranked by the diagnosis search index
+    if search:
+        if 'cursor' in request.args:
+            return jsonify({"msg": "Cursor pagination is not supported for search results"}), 400
+        return jsonify(search_diagnosis_page(search, category, page, per_page)), 200
+    
     # Build query
     query = Diagnosis.query
     
-    # Apply filters if provided
-    if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            or_(
-                Diagnosis.name.ilike(search_term),
-                Diagnosis.description.ilike(search_term),
-                Diagnosis.icd_code.ilike(search_term)
-            )
-        )
-    
     if category:
         query = query.filter_by(category=category)
     
     # Order by name
-    query = query.order_by(Diagnosis.name)
+    try:
+        pagination = get_paginated_results(
+            query, page, per_page, order_by=[Diagnosis.name, Diagnosis.id], **cursor_args()
+        )
+    except InvalidCursor:
+        return jsonify({"msg": "Invalid cursor"}), 400
+    
+    return jsonify({
+        "diagnoses": [format_diagnosis(diagnosis) for diagnosis in pagination.items],
+        "pagination": pagination_info(pagination)
+    }), 200
+
+def format_diagnosis(diagnosis):
+    return {
+        "id": diagnosis.uuid,
+        "name": diagnosis.name,
+        "description": diagnosis.description,
+        "icd_code": diagnosis.icd_code,
+        "category": diagnosis.category
+    }
+
+def search_diagnosis_page(search, category, page, per_page):
+    """
+    Page through ranked diagnosis search results.
+    Only the diagnoses of the requested page are loaded from the database.
+    """
+    index = get_search_index(DIAGNOSIS_INDEX)
+    ranked_ids = index.ranked_ids(search)
     
-    # Get paginated results
-    pagination = get_paginated_results(query, page, per_page)
+    if category:
+        ranked_ids = [doc_id for doc_id in ranked_ids if index.payload(doc_id).get('category') == category]
     
-    # Format results
-    diagnoses = []
-    for diagnosis in pagination.items:
-        diagnoses.append({
-            "id": diagnosis.uuid,
-            "name": diagnosis.name,
-            "description": diagnosis.description,
-            "icd_code": diagnosis.icd_code,
-            "category": diagnosis.category
-        })
+    page = max(page, 1)
+    per_page = max(per_page, 1)
+    total = len(ranked_ids)
+    page_ids = ranked_ids[(page - 1) * per_page:page * per_page]
     
-    return jsonify({
-        "diagnoses": diagnoses,
+    rows = {diagnosis.id: diagnosis for diagnosis in Diagnosis.query.filter(Diagnosis.id.in_(page_ids))} if page_ids else {}
+    pages = (total + per_page - 1) // per_page
+    
+    return {
+        "diagnoses": [format_diagnosis(rows[doc_id]) for doc_id in page_ids if doc_id in rows],
         "pagination": {
-            "total": pagination.total,
-            "pages": pagination.pages,
-            "page": pagination.page,
-            "per_page": pagination.per_page,
-            "has_next": pagination.has_next,
-            "has_prev": pagination.has_prev
+            "total": total,
+            "pages": pages,
+            "page": page,
+            "per_page": per_page,
+            "has_next": page < pages,
+            "has_prev": page > 1
         }
-    }), 200
+    }
 
 @diagnoses_bp.route('/diagnoses/<string:diagnosis_uuid>', methods=['GET'])
 @jwt_required()
@@ -79,8 +106,7 @@ def get_diagnosis(diagnosis_uuid):
     """
     Get a specific diagnosis by UUID
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -112,8 +138,7 @@ def create_diagnosis():
     if not request.is_json:
         return jsonify({"msg": "Missing JSON in request"}), 400
     
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -159,8 +184,7 @@ def update_diagnosis(diagnosis_uuid):
     if not request.is_json:
         return jsonify({"msg": "Missing JSON in request"}), 400
     
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -208,8 +232,7 @@ def delete_diagnosis(diagnosis_uuid):
     """
     Delete a diagnosis
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -235,8 +258,7 @@ def search_diagnoses():
     """
     Search diagnoses for autocomplete
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -247,31 +269,51 @@ def search_diagnoses():
     if not query:
         return jsonify({"results": []}), 200
     
-    search_term = f"%{query}%"
+    # ICD code hits first, then name prefix, fuzzy name and description matches
+    results = get_search_index(DIAGNOSIS_INDEX).search(query, limit)
     
-    diagnoses = Diagnosis.query.filter(
-        or_(
-            Diagnosis.name.ilike(search_term),
-            Diagnosis.icd_code.ilike(search_term)
-        )
-    ).order_by(Diagnosis.name).limit(limit).all()
+    return jsonify({"results": results}), 200
+
+@diagnoses_bp.route('/diagnoses/<string:diagnosis_uuid>/medicines', methods=['GET'])
+@jwt_required()
+def get_recommended_medicines(diagnosis_uuid):
+    """
+    Medicines most often prescribed with a diagnosis, for prescription form suggestions.
+    The current doctor's own prescriptions weigh doctor_weight times extra.
+    """
+    doctor = get_current_doctor()
     
-    results = []
-    for diagnosis in diagnoses:
-        result = {
-            "id": diagnosis.uuid,
-            "name": diagnosis.name
-        }
-        
-        if diagnosis.icd_code:
-            result["icd_code"] = diagnosis.icd_code
-            
-        if diagnosis.category:
-            result["category"] = diagnosis.category
-            
-        results.append(result)
+    if not doctor:
+        return jsonify({"msg": "Doctor not found"}), 404
     
-    return jsonify({"results": results}), 200
+    diagnosis = Diagnosis.query.filter_by(uuid=diagnosis_uuid).first()
+    
+    if not diagnosis:
+        return jsonify({"msg": "Diagnosis not found"}), 404
+    
+    limit = min(max(request.args.get('limit', 5, type=int), 1), 50)
+    doctor_weight = request.args.get(
+        'doctor_weight', current_app.config.get('RECOMMENDATION_DOCTOR_WEIGHT', 1.0), type=float
+    )
+    if math.isnan(doctor_weight):
+        return jsonify({"msg": "doctor_weight must be a number"}), 400
+    doctor_weight = min(max(doctor_weight, 0.0), MAX_DOCTOR_WEIGHT)
+    
+    recommendations = recommend_medicines(diagnosis.id, doctor.id, doctor_weight, limit)
+    
+    return jsonify({
+        "diagnosis": {"id": diagnosis.uuid, "name": diagnosis.name},
+        "results": [{
+            "id": entry["medicine"].uuid,
+            "name": entry["medicine"].name,
+            "dosage_form": entry["medicine"].dosage_form,
+            "strength": entry["medicine"].strength,
+            "count": entry["count"],
+            "doctor_count": entry["doctor_count"],
+            "last_seen": entry["last_seen"].isoformat() if entry["last_seen"] else None,
+            "score": entry["score"]
+        } for entry in recommendations]
+    }), 200
 
 @diagnoses_bp.route('/patients/<string:patient_uuid>/diagnoses', methods=['GET'])
 @jwt_required()
@@ -279,8 +321,7 @@ def get_patient_diagnoses(patient_uuid):
     """
     Get all diagnoses for a specific patient
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -322,8 +363,7 @@ def add_patient_diagnosis(patient_uuid):
     if not request.is_json:
         return jsonify({"msg": "Missing JSON in request"}), 400
     
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -359,11 +399,19 @@ def add_patient_diagnosis(patient_uuid):
     if not diagnosis:
         return jsonify({"msg": "Diagnosis not found"}), 404
     
+    # Parse date_diagnosed if provided
+    date_diagnosed = date.today()
+    if data.get('date_diagnosed'):
+        try:
+            date_diagnosed = datetime.strptime(data['date_diagnosed'], '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({"msg": "Invalid date_diagnosed format. Use YYYY-MM-DD"}), 400
+    
     # Create patient diagnosis
     new_patient_diagnosis = PatientDiagnosis(
         patient_id=patient.id,
         diagnosis_id=diagnosis.id,
-        date_diagnosed=data.get('date_diagnosed', db.func.current_date()),
+        date_diagnosed=date_diagnosed,
         status=data.get('status', 'active'),
         notes=data.get('notes')
     )
@@ -389,8 +437,7 @@ def update_patient_diagnosis(patient_diagnosis_id):
     if not request.is_json:
         return jsonify({"msg": "Missing JSON in request"}), 400
     
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -429,8 +476,7 @@ def delete_patient_diagnosis(patient_diagnosis_id):
     """
     Remove a diagnosis from a patient
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -1,6 +1,5 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import (
-    create_access_token,
     create_refresh_token,
     jwt_required,
     get_jwt_identity
@@ -8,6 +7,7 @@ from flask_jwt_extended import (
 from app.models.models import Doctor
 from app import db
 from app.db_utils import add_to_db, commit_changes
+from app.services.identity import create_doctor_access_token
 from werkzeug.security import check_password_hash
 import datetime
 import uuid
@@ -36,7 +36,7 @@ def login():
             return jsonify({"msg": "Account is deactivated"}), 401
         
         # Create tokens
-        access_token = create_access_token(identity=doctor.uuid)
+        access_token = create_doctor_access_token(doctor)
         refresh_token = create_refresh_token(identity=doctor.uuid)
         
         return jsonify({
@@ -67,7 +67,7 @@ def refresh():
     if not doctor or not doctor.active:
         return jsonify({"msg": "User not found or inactive"}), 401
         
-    access_token = create_access_token(identity=current_user_uuid)
+    access_token = create_doctor_access_token(doctor)
     return jsonify({"access_token": access_token}), 200
 
 @doctors_bp.route('/register', methods=['POST'])
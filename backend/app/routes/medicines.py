@@ -1,8 +1,12 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models.models import Medicine, Doctor
+from flask_jwt_extended import jwt_required
+from app.models.models import Medicine
+from app.services.identity import get_current_doctor
+from app.services.search_index import MEDICINE_INDEX, get_search_index
 from app import db
-from app.db_utils import add_to_db, commit_changes, delete_from_db, get_paginated_results
+from app.db_utils import (
+    add_to_db, commit_changes, delete_from_db, get_paginated_results, cursor_args, pagination_info, InvalidCursor
+)
 from sqlalchemy import or_
 import uuid
 
@@ -14,8 +18,7 @@ def get_medicines():
     """
     Get all medicines with optional filtering and pagination
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -41,10 +44,12 @@ def get_medicines():
         )
     
     # Order by name
-    query = query.order_by(Medicine.name)
-    
-    # Get paginated results
-    pagination = get_paginated_results(query, page, per_page)
+    try:
+        pagination = get_paginated_results(
+            query, page, per_page, order_by=[Medicine.name, Medicine.id], **cursor_args()
+        )
+    except InvalidCursor:
+        return jsonify({"msg": "Invalid cursor"}), 400
     
     # Format results
     medicines = []
@@ -60,14 +65,7 @@ def get_medicines():
     
     return jsonify({
         "medicines": medicines,
-        "pagination": {
-            "total": pagination.total,
-            "pages": pagination.pages,
-            "page": pagination.page,
-            "per_page": pagination.per_page,
-            "has_next": pagination.has_next,
-            "has_prev": pagination.has_prev
-        }
+        "pagination": pagination_info(pagination)
     }), 200
 
 @medicines_bp.route('/medicines/<string:medicine_uuid>', methods=['GET'])
@@ -76,8 +74,7 @@ def get_medicine(medicine_uuid):
     """
     Get a specific medicine by UUID
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -110,8 +107,7 @@ def create_medicine():
     if not request.is_json:
         return jsonify({"msg": "Missing JSON in request"}), 400
     
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -158,8 +154,7 @@ def update_medicine(medicine_uuid):
     if not request.is_json:
         return jsonify({"msg": "Missing JSON in request"}), 400
     
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -207,8 +202,7 @@ def delete_medicine(medicine_uuid):
     """
     Delete a medicine
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -234,8 +228,7 @@ def search_medicines():
     """
     Search medicines for autocomplete
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -246,25 +239,7 @@ def search_medicines():
     if not query:
         return jsonify({"results": []}), 200
     
-    search_term = f"%{query}%"
-    
-    medicines = Medicine.query.filter(
-        Medicine.name.ilike(search_term)
-    ).order_by(Medicine.name).limit(limit).all()
-    
-    results = []
-    for medicine in medicines:
-        result = {
-            "id": medicine.uuid,
-            "name": medicine.name
-        }
-        
-        if medicine.dosage_form:
-            result["dosage_form"] = medicine.dosage_form
-            
-        if medicine.strength:
-            result["strength"] = medicine.strength
-            
-        results.append(result)
+    # Served from the in-memory name index: prefix matches first, then substrings
+    results = get_search_index(MEDICINE_INDEX).search(query, limit)
     
     return jsonify({"results": results}), 200
\ No newline at end of file
@@ -1,9 +1,14 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models.models import Note, Tag, NoteTag, Doctor, Patient, Appointment
+from flask_jwt_extended import jwt_required
+from app.models.models import Note, Tag, NoteTag, Patient, Appointment
+from app.services.identity import get_current_doctor
+from app.services.note_search import search_notes, render_snippet
 from app import db
-from app.db_utils import add_to_db, commit_changes, delete_from_db, get_paginated_results
-from sqlalchemy import or_, and_
+from app.db_utils import (
+    add_to_db, commit_changes, delete_from_db, get_paginated_results, cursor_args, pagination_info, InvalidCursor
+)
+from sqlalchemy import and_
+from sqlalchemy.orm import joinedload, selectinload
 from datetime import datetime
 import uuid
 
@@ -15,8 +20,7 @@ def get_notes():
     """
     Get all notes for the current doctor with optional filtering and pagination
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
 
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -29,8 +33,11 @@ def get_notes():
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
 
-    # Build query
-    query = Note.query.filter_by(doctor_id=doctor.id)
+    # Build query, eager-loading patients and tags so a page costs a fixed number of queries
+    query = Note.query.options(
+        joinedload(Note.patient),
+        selectinload(Note.tags).joinedload(NoteTag.tag)
+    ).filter_by(doctor_id=doctor.id)
 
     # Apply filters if provided
     if patient_uuid:
@@ -47,24 +54,26 @@ def get_notes():
         query = query.join(NoteTag).filter(NoteTag.tag_id == tag_id)
 
     if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            or_(
-                Note.title.ilike(search_term),
-                Note.content.ilike(search_term)
+        # Full-text matches ranked by relevance, each with a highlighted snippet
+        if 'cursor' in request.args:
+            return jsonify({"msg": "Cursor pagination is not supported for search results"}), 400
+
+        query = search_notes(query, search)
+        pagination = get_paginated_results(query, page, per_page)
+    else:
+        # Order by creation date (newest first)
+        try:
+            pagination = get_paginated_results(
+                query, page, per_page, order_by=[Note.created_at.desc(), Note.id.desc()], **cursor_args()
             )
-        )
-
-    # Order by creation date (newest first)
-    query = query.order_by(Note.created_at.desc())
-
-    # Get paginated results
-    pagination = get_paginated_results(query, page, per_page)
+        except InvalidCursor:
+            return jsonify({"msg": "Invalid cursor"}), 400
 
     # Format results
     notes = []
-    for note in pagination.items:
-        patient = Patient.query.get(note.patient_id)
+    for item in pagination.items:
+        note, snippet = item if search else (item, None)
+        patient = note.patient
 
         note_data = {
             "id": note.uuid,
@@ -80,9 +89,12 @@ def get_notes():
             "tags": []
         }
 
+        if search:
+            note_data["snippet"] = render_snippet(snippet)
+
         # Add tags
         for note_tag in note.tags:
-            tag = Tag.query.get(note_tag.tag_id)
+            tag = note_tag.tag
             note_data["tags"].append({
                 "id": tag.id,
                 "name": tag.name,
@@ -93,14 +105,7 @@ def get_notes():
 
     return jsonify({
         "notes": notes,
-        "pagination": {
-            "total": pagination.total,
-            "pages": pagination.pages,
-            "page": pagination.page,
-            "per_page": pagination.per_page,
-            "has_next": pagination.has_next,
-            "has_prev": pagination.has_prev
-        }
+        "pagination": pagination_info(pagination)
     }), 200
 
 @notes_bp.route('/notes/<string:note_uuid>', methods=['GET'])
@@ -109,18 +114,21 @@ def get_note(note_uuid):
     """
     Get a specific note by UUID
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
 
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
 
-    note = Note.query.filter_by(uuid=note_uuid, doctor_id=doctor.id).first()
+    note = Note.query.options(
+        joinedload(Note.patient),
+        joinedload(Note.appointment),
+        selectinload(Note.tags).joinedload(NoteTag.tag)
+    ).filter_by(uuid=note_uuid, doctor_id=doctor.id).first()
 
     if not note:
         return jsonify({"msg": "Note not found"}), 404
 
-    patient = Patient.query.get(note.patient_id)
+    patient = note.patient
 
     # Format note data
     note_data = {
@@ -139,7 +147,7 @@ def get_note(note_uuid):
 
     # Add appointment if exists
     if note.appointment_id:
-        appointment = Appointment.query.get(note.appointment_id)
+        appointment = note.appointment
         note_data["appointment"] = {
             "id": appointment.uuid,
             "date": appointment.date.strftime('%Y-%m-%d')
@@ -147,7 +155,7 @@ def get_note(note_uuid):
 
     # Add tags
     for note_tag in note.tags:
-        tag = Tag.query.get(note_tag.tag_id)
+        tag = note_tag.tag
         note_data["tags"].append({
             "id": tag.id,
             "name": tag.name,
@@ -165,8 +173,7 @@ def create_note():
     if not request.is_json:
         return jsonify({"msg": "Missing JSON in request"}), 400
 
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
 
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -265,8 +272,7 @@ def update_note(note_uuid):
     if not request.is_json:
         return jsonify({"msg": "Missing JSON in request"}), 400
 
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
 
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -340,8 +346,7 @@ def delete_note(note_uuid):
     """
     Delete a note
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
 
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -363,8 +368,7 @@ def get_tags():
     """
     Get all tags
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
 
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -392,8 +396,7 @@ def create_tag():
     if not request.is_json:
         return jsonify({"msg": "Missing JSON in request"}), 400
 
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
 
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -1,9 +1,14 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models.models import Patient, Doctor
-from app import db
-from app.db_utils import add_to_db, commit_changes, delete_from_db, get_paginated_results
-from sqlalchemy import or_
+from flask_jwt_extended import jwt_required
+from app.models.models import Patient
+from app.services.identity import get_current_doctor
+from app.services.patient_search import patient_search_filter
+from app.services.patient_similarity import get_patient_similarity, SIMILARITY_METRICS
+from app.services.patient_lsh import approximate_similar_patients
+from app.db_utils import (
+    add_to_db, commit_changes, delete_from_db, get_paginated_results, cursor_args, pagination_info, InvalidCursor
+)
+from sqlalchemy import false
 from datetime import datetime
 import uuid
 
@@ -15,8 +20,7 @@ def get_patients():
     """
     Get all patients for the current doctor with optional filtering and pagination
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -31,21 +35,19 @@ def get_patients():
     
     # Apply search filter if provided
     if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            or_(
-                Patient.first_name.ilike(search_term),
-                Patient.last_name.ilike(search_term),
-                Patient.email.ilike(search_term),
-                Patient.phone.ilike(search_term)
-            )
-        )
+        search_filter = patient_search_filter(doctor.id, search, include_email=True)
+        if search_filter is None:
+            query = query.filter(false())
+        else:
+            query = query.filter(search_filter)
     
     # Order by last name then first name
-    query = query.order_by(Patient.last_name, Patient.first_name)
-    
-    # Get paginated results
-    pagination = get_paginated_results(query, page, per_page)
+    try:
+        pagination = get_paginated_results(
+            query, page, per_page, order_by=[Patient.last_name, Patient.first_name, Patient.id], **cursor_args()
+        )
+    except InvalidCursor:
+        return jsonify({"msg": "Invalid cursor"}), 400
     
     # Format results
     patients = []
@@ -63,14 +65,7 @@ def get_patients():
     
     return jsonify({
         "patients": patients,
-        "pagination": {
-            "total": pagination.total,
-            "pages": pagination.pages,
-            "page": pagination.page,
-            "per_page": pagination.per_page,
-            "has_next": pagination.has_next,
-            "has_prev": pagination.has_prev
-        }
+        "pagination": pagination_info(pagination)
     }), 200
 
 @patients_bp.route('/patients/<string:patient_uuid>', methods=['GET'])
@@ -79,8 +74,7 @@ def get_patient(patient_uuid):
     """
     Get a specific patient by UUID
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -108,6 +102,53 @@ def get_patient(patient_uuid):
     
     return jsonify(patient_data), 200
 
+@patients_bp.route('/patients/<string:patient_uuid>/similar', methods=['GET'])
+@jwt_required()
+def get_similar_patients(patient_uuid):
+    """
+    Patients of the current doctor with the most similar diagnosis history.
+    Diagnoses are TF-IDF weighted (metric=cosine, the default) or compared as sets (metric=jaccard);
+    approximate=true answers from the MinHash/LSH index with estimated Jaccard scores.
+    """
+    doctor = get_current_doctor()
+    
+    if not doctor:
+        return jsonify({"msg": "Doctor not found"}), 404
+    
+    patient = Patient.query.filter_by(uuid=patient_uuid, doctor_id=doctor.id).first()
+    
+    if not patient:
+        return jsonify({"msg": "Patient not found"}), 404
+    
+    metric = request.args.get('metric', 'cosine')
+    if metric not in SIMILARITY_METRICS:
+        return jsonify({"msg": f"Unknown metric. Use one of: {', '.join(SIMILARITY_METRICS)}"}), 400
+    
+    limit = min(max(request.args.get('limit', 5, type=int), 1), 100)
+    approximate = request.args.get('approximate', 'false').lower() in ('true', '1')
+    
+    if approximate:
+        metric = 'jaccard'
+        matches = [(other_id, score, None) for other_id, score in
+                   approximate_similar_patients(patient.id, doctor.id, limit)]
+    else:
+        matches = get_patient_similarity().similar(doctor.id, patient.id, limit, metric)
+    patients = {other.id: other for other in Patient.query.filter(
+        Patient.id.in_([other_id for other_id, _, _ in matches]), Patient.doctor_id == doctor.id
+    )} if matches else {}
+    
+    return jsonify({
+        "metric": metric,
+        "approximate": approximate,
+        "results": [{
+            "id": patients[other_id].uuid,
+            "first_name": patients[other_id].first_name,
+            "last_name": patients[other_id].last_name,
+            "score": round(score, 4),
+            "shared_diagnoses": shared
+        } for other_id, score, shared in matches if other_id in patients]
+    }), 200
+
 @patients_bp.route('/patients', methods=['POST'])
 @jwt_required()
 def create_patient():
@@ -117,8 +158,7 @@ def create_patient():
     if not request.is_json:
         return jsonify({"msg": "Missing JSON in request"}), 400
     
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -174,8 +214,7 @@ def update_patient(patient_uuid):
     if not request.is_json:
         return jsonify({"msg": "Missing JSON in request"}), 400
     
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -223,8 +262,7 @@ def delete_patient(patient_uuid):
     """
     Delete a patient
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -246,8 +284,7 @@ def search_patients():
     """
     Search patients for autocomplete
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -258,15 +295,14 @@ def search_patients():
     if not query:
         return jsonify({"results": []}), 200
     
-    search_term = f"%{query}%"
+    # Name tokens, phone digits and DOB are prefix-scanned on the search token index
+    search_filter = patient_search_filter(doctor.id, query)
+    if search_filter is None:
+        return jsonify({"results": []}), 200
     
     patients = Patient.query.filter_by(doctor_id=doctor.id).filter(
-        or_(
-            Patient.first_name.ilike(search_term),
-            Patient.last_name.ilike(search_term),
-            db.func.concat(Patient.first_name, ' ', Patient.last_name).ilike(search_term)
-        )
-    ).limit(limit).all()
+        search_filter
+    ).order_by(Patient.last_name, Patient.first_name).limit(limit).all()
     
     results = []
     for patient in patients:
@@ -1,22 +1,103 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models.models import Prescription, PrescriptionItem, Doctor, Patient, Medicine, PatientDiagnosis, Diagnosis, Appointment
+from flask_jwt_extended import jwt_required
+from app.models.models import Prescription, PrescriptionItem, Patient, Medicine, PatientDiagnosis, Diagnosis, Appointment
+from app.services.identity import get_current_doctor
+from app.services.prescription_loader import load_prescriptions
 from app import db
-from app.db_utils import add_to_db, commit_changes, delete_from_db, get_paginated_results
-from sqlalchemy import or_, and_
+from app.db_utils import (
+    commit_changes, delete_from_db, get_paginated_results, cursor_args, pagination_info, InvalidCursor
+)
+from sqlalchemy import or_, and_, func
 from datetime import datetime, date, timedelta
 import uuid
 
 prescriptions_bp = Blueprint('prescriptions', __name__)
 
+
+def resolve_medicines(medicine_uuids):
+    """Medicines by UUID for a set of UUIDs, with one IN query"""
+    medicine_uuids = set(medicine_uuids)
+    if not medicine_uuids:
+        return {}
+    return {medicine.uuid: medicine for medicine in Medicine.query.filter(Medicine.uuid.in_(medicine_uuids))}
+
+
+def payload_type_error(items=(), diagnoses=()):
+    """Message for the first prescription item or diagnosis entry with a value of the wrong type, or None"""
+    for item_data in items:
+        if not isinstance(item_data, dict):
+            return "Each prescription item must be an object"
+        if not isinstance(item_data.get('medicine_id', ''), str):
+            return "Medicine ID must be a string"
+        if isinstance(item_data.get('id'), bool) or not isinstance(item_data.get('id', 0), int):
+            return "Prescription item ID must be an integer"
+        for key in ('dosage', 'frequency', 'duration', 'instructions'):
+            if item_data.get(key) is not None and not isinstance(item_data[key], str):
+                return f"{key} must be a string"
+    
+    for entry in diagnoses:
+        if not isinstance(entry, dict):
+            return "Each diagnosis must be an object"
+        for key in ('diagnosis_id', 'diagnosis_name', 'icd_code', 'status', 'notes'):
+            if not isinstance(entry.get(key) or '', str):
+                return f"{key} must be a string"
+    
+    return None
+
+
+def resolve_diagnoses(diagnoses_data):
+    """
+    Pair each diagnosis entry of a payload with its Diagnosis, looking all of
+    them up with one query: by diagnosis_id, or case-insensitively by
+    diagnosis_name. Unknown names become new (pending) diagnoses, created once
+    per name; entries with an unknown diagnosis_id or neither key are skipped.
+    """
+    uuids = {entry['diagnosis_id'] for entry in diagnoses_data if entry.get('diagnosis_id')}
+    names = {entry['diagnosis_name'].lower() for entry in diagnoses_data
+             if not entry.get('diagnosis_id') and entry.get('diagnosis_name')}
+    
+    by_uuid = {}
+    by_name = {}
+    if uuids or names:
+        conditions = []
+        if uuids:
+            conditions.append(Diagnosis.uuid.in_(uuids))
+        if names:
+            conditions.append(func.lower(Diagnosis.name).in_(names))
+        
+        for diagnosis in Diagnosis.query.filter(or_(*conditions)).order_by(Diagnosis.id):
+            by_uuid[diagnosis.uuid] = diagnosis
+            by_name.setdefault(diagnosis.name.lower(), diagnosis)
+    
+    resolved = []
+    for entry in diagnoses_data:
+        if entry.get('diagnosis_id'):
+            diagnosis = by_uuid.get(entry['diagnosis_id'])
+        elif entry.get('diagnosis_name'):
+            key = entry['diagnosis_name'].lower()
+            diagnosis = by_name.get(key)
+            if diagnosis is None:
+                diagnosis = by_name[key] = Diagnosis(
+                    uuid=str(uuid.uuid4()),
+                    name=entry['diagnosis_name'],
+                    icd_code=entry.get('icd_code')
+                )
+        else:
+            diagnosis = None
+        
+        if diagnosis is not None:
+            resolved.append((entry, diagnosis))
+    
+    return resolved
+
+
 @prescriptions_bp.route('/prescriptions', methods=['GET'])
 @jwt_required()
 def get_prescriptions():
     """
     Get all prescriptions for the current doctor with optional filtering and pagination
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -29,7 +110,7 @@ def get_prescriptions():
     per_page = request.args.get('per_page', 20, type=int)
     
     # Build query
-    query = Prescription.query.filter_by(doctor_id=doctor.id)
+    query = load_prescriptions(Prescription.query, diagnoses=False, medicines=False).filter_by(doctor_id=doctor.id)
     
     # Apply filters if provided
     if patient_uuid:
@@ -54,15 +135,17 @@ def get_prescriptions():
             return jsonify({"msg": "Invalid end_date format. Use YYYY-MM-DD"}), 400
     
     # Order by issue date (newest first)
-    query = query.order_by(Prescription.issue_date.desc())
-    
-    # Get paginated results
-    pagination = get_paginated_results(query, page, per_page)
+    try:
+        pagination = get_paginated_results(
+            query, page, per_page, order_by=[Prescription.issue_date.desc(), Prescription.id.desc()], **cursor_args()
+        )
+    except InvalidCursor:
+        return jsonify({"msg": "Invalid cursor"}), 400
     
     # Format results
     prescriptions = []
     for prescription in pagination.items:
-        patient = Patient.query.get(prescription.patient_id)
+        patient = prescription.patient
         
         prescription_data = {
             "id": prescription.uuid,
@@ -82,14 +165,7 @@ def get_prescriptions():
     
     return jsonify({
         "prescriptions": prescriptions,
-        "pagination": {
-            "total": pagination.total,
-            "pages": pagination.pages,
-            "page": pagination.page,
-            "per_page": pagination.per_page,
-            "has_next": pagination.has_next,
-            "has_prev": pagination.has_prev
-        }
+        "pagination": pagination_info(pagination)
     }), 200
 
 @prescriptions_bp.route('/prescriptions/<string:prescription_uuid>', methods=['GET'])
@@ -98,18 +174,19 @@ def get_prescription(prescription_uuid):
     """
     Get a specific prescription by UUID with detailed information
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
     
-    prescription = Prescription.query.filter_by(uuid=prescription_uuid, doctor_id=doctor.id).first()
+    prescription = load_prescriptions(Prescription.query).filter_by(
+        uuid=prescription_uuid, doctor_id=doctor.id
+    ).first()
     
     if not prescription:
         return jsonify({"msg": "Prescription not found"}), 404
     
-    patient = Patient.query.get(prescription.patient_id)
+    patient = prescription.patient
     
     # Format prescription data
     prescription_data = {
@@ -131,7 +208,7 @@ def get_prescription(prescription_uuid):
     
     # Get appointment if exists
     if prescription.appointment_id:
-        appointment = Appointment.query.get(prescription.appointment_id)
+        appointment = prescription.appointment
         prescription_data["appointment"] = {
             "id": appointment.uuid,
             "date": appointment.date.strftime('%Y-%m-%d')
@@ -139,7 +216,7 @@ def get_prescription(prescription_uuid):
     
     # Add prescription items (medicines)
     for item in prescription.items:
-        medicine = Medicine.query.get(item.medicine_id)
+        medicine = item.medicine
         prescription_data["items"].append({
             "id": item.id,
             "medicine": {
@@ -156,7 +233,7 @@ def get_prescription(prescription_uuid):
     
     # Add diagnoses
     for diagnosis in prescription.diagnoses:
-        diag = Diagnosis.query.get(diagnosis.diagnosis_id)
+        diag = diagnosis.diagnosis
         prescription_data["diagnoses"].append({
             "id": diagnosis.id,
             "name": diag.name,
@@ -176,8 +253,7 @@ def create_prescription():
     if not request.is_json:
         return jsonify({"msg": "Missing JSON in request"}), 400
     
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -191,6 +267,13 @@ def create_prescription():
     if 'items' not in data or not data['items']:
         return jsonify({"msg": "Prescription must have at least one medicine"}), 400
     
+    if not isinstance(data['items'], list) or not isinstance(data.get('diagnoses') or [], list):
+        return jsonify({"msg": "items and diagnoses must be lists"}), 400
+    
+    error = payload_type_error(data['items'], data.get('diagnoses') or [])
+    if error:
+        return jsonify({"msg": error}), 400
+    
     # Check if patient exists
     patient = Patient.query.filter_by(uuid=data['patient_id'], doctor_id=doctor.id).first()
     if not patient:
@@ -227,9 +310,25 @@ def create_prescription():
         except ValueError:
             return jsonify({"msg": "Invalid expiry_date format. Use YYYY-MM-DD"}), 400
     
-    # Create new prescription
+    # Validate every item and resolve all medicines with one query
+    for item_data in data['items']:
+        if 'medicine_id' not in item_data:
+            return jsonify({"msg": "Medicine ID is required for each prescription item"}), 400
+        
+        if 'dosage' not in item_data or 'frequency' not in item_data:
+            return jsonify({"msg": "Dosage and frequency are required for each prescription item"}), 400
+    
+    medicines = resolve_medicines(item_data['medicine_id'] for item_data in data['items'])
+    missing = [item_data['medicine_id'] for item_data in data['items'] if item_data['medicine_id'] not in medicines]
+    if missing:
+        return jsonify({"msg": f"Medicine not found: {', '.join(map(str, missing))}"}), 404
+    
+    diagnoses = resolve_diagnoses(data.get('diagnoses') or [])
+    
+    # Build the whole prescription and write it in a single flush/commit
+    new_prescription_uuid = str(uuid.uuid4())
     new_prescription = Prescription(
-        uuid=str(uuid.uuid4()),
+        uuid=new_prescription_uuid,
         doctor_id=doctor.id,
         patient_id=patient.id,
         appointment_id=appointment_id,
@@ -238,80 +337,33 @@ def create_prescription():
         notes=data.get('notes')
     )
     
-    # Add to database
-    if not add_to_db(new_prescription):
-        return jsonify({"msg": "Error creating prescription"}), 500
-    
-    # Add prescription items
     for item_data in data['items']:
-        # Check required fields for each item
-        if 'medicine_id' not in item_data:
-            return jsonify({"msg": "Medicine ID is required for each prescription item"}), 400
-        
-        if 'dosage' not in item_data or 'frequency' not in item_data:
-            return jsonify({"msg": "Dosage and frequency are required for each prescription item"}), 400
-        
-        # Check if medicine exists
-        medicine = Medicine.query.filter_by(uuid=item_data['medicine_id']).first()
-        if not medicine:
-            return jsonify({"msg": f"Medicine not found: {item_data['medicine_id']}"}), 404
-        
-        # Create prescription item
-        new_item = PrescriptionItem(
-            prescription_id=new_prescription.id,
-            medicine_id=medicine.id,
+        new_prescription.items.append(PrescriptionItem(
+            medicine_id=medicines[item_data['medicine_id']].id,
             dosage=item_data['dosage'],
             frequency=item_data['frequency'],
             duration=item_data.get('duration'),
             instructions=item_data.get('instructions')
-        )
-        
-        db.session.add(new_item)
+        ))
     
-    # Add diagnoses if provided
-    if 'diagnoses' in data and data['diagnoses']:
-        for diag_data in data['diagnoses']:
-            # Check if diagnosis exists
-            diagnosis = None
-            
-            if 'diagnosis_id' in diag_data:
-                diagnosis = Diagnosis.query.filter_by(uuid=diag_data['diagnosis_id']).first()
-            elif 'diagnosis_name' in diag_data:
-                # Try to find by name or create a new one
-                diagnosis = Diagnosis.query.filter(Diagnosis.name.ilike(diag_data['diagnosis_name'])).first()
-                
-                if not diagnosis:
-                    # Create new diagnosis
-                    diagnosis = Diagnosis(
-                        uuid=str(uuid.uuid4()),
-                        name=diag_data['diagnosis_name'],
-                        icd_code=diag_data.get('icd_code')
-                    )
-                    db.session.add(diagnosis)
-                    db.session.flush()
-            else:
-                continue
-            
-            if diagnosis:
-                # Create patient diagnosis
-                new_patient_diagnosis = PatientDiagnosis(
-                    patient_id=patient.id,
-                    diagnosis_id=diagnosis.id,
-                    prescription_id=new_prescription.id,
-                    date_diagnosed=issue_date,
-                    status=diag_data.get('status', 'active'),
-                    notes=diag_data.get('notes')
-                )
-                
-                db.session.add(new_patient_diagnosis)
+    for diag_data, diagnosis in diagnoses:
+        new_prescription.diagnoses.append(PatientDiagnosis(
+            patient_id=patient.id,
+            diagnosis=diagnosis,
+            date_diagnosed=issue_date,
+            status=diag_data.get('status', 'active'),
+            notes=diag_data.get('notes')
+        ))
+    
+    db.session.add(new_prescription)
     
     # Commit all changes
     if commit_changes():
         return jsonify({
             "msg": "Prescription created successfully",
             "prescription": {
-                "id": new_prescription.uuid,
-                "issue_date": new_prescription.issue_date.strftime('%Y-%m-%d')
+                "id": new_prescription_uuid,
+                "issue_date": issue_date.strftime('%Y-%m-%d')
             }
         }), 201
     
@@ -326,8 +378,7 @@ def update_prescription(prescription_uuid):
     if not request.is_json:
         return jsonify({"msg": "Missing JSON in request"}), 400
     
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -339,6 +390,10 @@ def update_prescription(prescription_uuid):
     
     data = request.get_json()
     
+    error = payload_type_error(data['items'] if isinstance(data.get('items'), list) else ())
+    if error:
+        return jsonify({"msg": error}), 400
+    
     # Update dates if provided
     if 'issue_date' in data:
         try:
@@ -367,6 +422,10 @@ def update_prescription(prescription_uuid):
         # Get current items
         current_items = {item.id: item for item in prescription.items}
         new_items = []
+        medicines = resolve_medicines(
+            item_data['medicine_id'] for item_data in data['items']
+            if item_data.get('medicine_id') and not ('id' in item_data and item_data['id'] in current_items)
+        )
         
         for item_data in data['items']:
             # Check if item has an ID (existing item)
@@ -394,7 +453,7 @@ def update_prescription(prescription_uuid):
                 if 'medicine_id' not in item_data or 'dosage' not in item_data or 'frequency' not in item_data:
                     continue
                 
-                medicine = Medicine.query.filter_by(uuid=item_data['medicine_id']).first()
+                medicine = medicines.get(item_data['medicine_id'])
                 if not medicine:
                     continue
                 
@@ -432,8 +491,7 @@ def delete_prescription(prescription_uuid):
     """
     Delete a prescription
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -456,13 +514,14 @@ def export_prescription(prescription_uuid):
     Export prescription as PDF (placeholder)
     In a real implementation, this would generate a PDF and return it
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
     
-    prescription = Prescription.query.filter_by(uuid=prescription_uuid, doctor_id=doctor.id).first()
+    prescription = load_prescriptions(Prescription.query, items=False, diagnoses=False).filter_by(
+        uuid=prescription_uuid, doctor_id=doctor.id
+    ).first()
     
     if not prescription:
         return jsonify({"msg": "Prescription not found"}), 404
@@ -479,8 +538,7 @@ def patient_prescriptions(patient_uuid):
     """
     Get all prescriptions for a specific patient
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -495,13 +553,17 @@ def patient_prescriptions(patient_uuid):
     per_page = request.args.get('per_page', 20, type=int)
     
     # Build query for patient's prescriptions
-    query = Prescription.query.filter_by(patient_id=patient.id, doctor_id=doctor.id)
+    query = load_prescriptions(Prescription.query, diagnoses=False).filter_by(
+        patient_id=patient.id, doctor_id=doctor.id
+    )
     
     # Order by issue date (newest first)
-    query = query.order_by(Prescription.issue_date.desc())
-    
-    # Get paginated results
-    pagination = get_paginated_results(query, page, per_page)
+    try:
+        pagination = get_paginated_results(
+            query, page, per_page, order_by=[Prescription.issue_date.desc(), Prescription.id.desc()], **cursor_args()
+        )
+    except InvalidCursor:
+        return jsonify({"msg": "Invalid cursor"}), 400
     
     # Format results
     prescriptions = []
@@ -519,7 +581,7 @@ def patient_prescriptions(patient_uuid):
         # Add items summary
         medicine_names = []
         for item in prescription.items:
-            medicine = Medicine.query.get(item.medicine_id)
+            medicine = item.medicine
             if medicine:
                 medicine_names.append(medicine.name)
         
@@ -529,12 +591,5 @@ def patient_prescriptions(patient_uuid):
     
     return jsonify({
         "prescriptions": prescriptions,
-        "pagination": {
-            "total": pagination.total,
-            "pages": pagination.pages,
-            "page": pagination.page,
-            "per_page": pagination.per_page,
-            "has_next": pagination.has_next,
-            "has_prev": pagination.has_prev
-        }
+        "pagination": pagination_info(pagination)
     }), 200
\ No newline at end of file
@@ -1,75 +1,108 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models.models import Doctor, Patient, Appointment, Prescription, PrescriptionItem, Medicine, Diagnosis, PatientDiagnosis
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from flask_jwt_extended import jwt_required
+from app.models.models import Patient, Prescription, PrescriptionItem, Medicine, Diagnosis, DailyStatRollup
+from app.services.identity import get_current_doctor
 from app.extensions import db
-from sqlalchemy import func, extract, cast, Integer, case, desc
+from sqlalchemy import func, cast, Integer, case, desc, and_
 from datetime import datetime, date, timedelta
+from app.services.exports import EXPORTS, export_rows
+from app.services.utils import stream_csv
+from app.services.aggregates import sum_if, month_bounds, add_months, years_before, date_histogram
 
 statistics_bp = Blueprint('statistics', __name__)
 
+# Longest monthly histogram a request may ask for
+MAX_HISTOGRAM_MONTHS = 120
+
+def parse_histogram_range(args, today, default_months=12):
+    """
+    Parse the date range of a monthly histogram from query parameters.
+    Accepts either months=N (the last N months including the current one) or
+    start_date/end_date (inclusive, YYYY-MM-DD), spanning at most
+    MAX_HISTOGRAM_MONTHS months. Returns a half-open (start, end) date tuple,
+    or None if the parameters are invalid or out of range.
+    """
+    start_date_str = args.get('start_date')
+    end_date_str = args.get('end_date')
+    
+    if start_date_str or end_date_str:
+        try:
+            start = datetime.strptime(start_date_str, '%Y-%m-%d').date() if start_date_str else None
+            end = datetime.strptime(end_date_str, '%Y-%m-%d').date() if end_date_str else today
+        except ValueError:
+            return None
+        
+        if start is None:
+            start = add_months(end, -(default_months - 1))
+        
+        months = (end.year - start.year) * 12 + end.month - start.month + 1
+        if start > end or months > MAX_HISTOGRAM_MONTHS:
+            return None
+        
+        return start, end + timedelta(days=1)
+    
+    months = args.get('months', default_months, type=int)
+    if not months or months < 1 or months > MAX_HISTOGRAM_MONTHS:
+        return None
+    
+    current_month = month_bounds(today)[0]
+    return add_months(current_month, -(months - 1)), add_months(current_month, 1)
+
 @statistics_bp.route('/stats/overview', methods=['GET'])
 @jwt_required()
 def get_overview_statistics():
     """
     Get overview statistics for the current doctor
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
     
     # Today's date
     today = date.today()
-    
-    # Get patient statistics
-    total_patients = Patient.query.filter_by(doctor_id=doctor.id).count()
-    new_patients_this_month = Patient.query.filter(
-        Patient.doctor_id == doctor.id,
-        extract('month', Patient.created_at) == today.month,
-        extract('year', Patient.created_at) == today.year
-    ).count()
-    
-    # Get appointment statistics
-    total_appointments = Appointment.query.filter_by(doctor_id=doctor.id).count()
-    today_appointments = Appointment.query.filter(
-        Appointment.doctor_id == doctor.id,
-        Appointment.date == today
-    ).count()
-    upcoming_appointments = Appointment.query.filter(
-        Appointment.doctor_id == doctor.id,
-        Appointment.date > today,
-        Appointment.date <= today + timedelta(days=7)  # Next 7 days
-    ).count()
-    completed_appointments = Appointment.query.filter(
-        Appointment.doctor_id == doctor.id,
-        Appointment.status == 'completed'
-    ).count()
-    
-    # Get prescription statistics
-    total_prescriptions = Prescription.query.filter_by(doctor_id=doctor.id).count()
-    prescriptions_this_month = Prescription.query.filter(
-        Prescription.doctor_id == doctor.id,
-        extract('month', Prescription.issue_date) == today.month,
-        extract('year', Prescription.issue_date) == today.year
-    ).count()
+    this_month, next_month = month_bounds(today)
+    
+    # Patient, appointment and prescription counters come from the daily rollups
+    rollup = DailyStatRollup
+    is_patients = rollup.metric == 'new_patients'
+    is_appointments = rollup.metric == 'appointments'
+    is_prescriptions = rollup.metric == 'prescriptions'
+    in_this_month = and_(rollup.day >= this_month, rollup.day < next_month)
+    
+    (
+        total_patients, new_patients_this_month,
+        total_appointments, today_appointments, upcoming_appointments, completed_appointments,
+        total_prescriptions, prescriptions_this_month
+    ) = db.session.query(
+        sum_if(is_patients, rollup.count),
+        sum_if(and_(is_patients, in_this_month), rollup.count),
+        sum_if(is_appointments, rollup.count),
+        sum_if(and_(is_appointments, rollup.day == today), rollup.count),
+        sum_if(and_(is_appointments, rollup.day > today, rollup.day <= today + timedelta(days=7)), rollup.count),  # Next 7 days
+        sum_if(and_(is_appointments, rollup.dimension == 'completed'), rollup.count),
+        sum_if(is_prescriptions, rollup.count),
+        sum_if(and_(is_prescriptions, in_this_month), rollup.count)
+    ).filter(
+        rollup.doctor_id == doctor.id,
+        rollup.metric.in_(('new_patients', 'appointments', 'prescriptions'))
+    ).one()
     
     # Get diagnosis statistics
-    patient_diagnoses = db.session.query(PatientDiagnosis.diagnosis_id, func.count(PatientDiagnosis.id).label('count')) \
-        .join(Patient, PatientDiagnosis.patient_id == Patient.id) \
-        .filter(Patient.doctor_id == doctor.id) \
-        .group_by(PatientDiagnosis.diagnosis_id) \
-        .order_by(desc('count')) \
+    diagnosis_counts = db.session.query(
+        rollup.dimension.label('diagnosis_id'), func.sum(rollup.count).label('count')
+    ).filter(
+        rollup.doctor_id == doctor.id,
+        rollup.metric == 'diagnoses'
+    ).group_by(rollup.dimension).having(func.sum(rollup.count) > 0).subquery()
+    
+    patient_diagnoses = db.session.query(Diagnosis.name, diagnosis_counts.c.count) \
+        .join(diagnosis_counts, cast(diagnosis_counts.c.diagnosis_id, Integer) == Diagnosis.id) \
+        .order_by(desc(diagnosis_counts.c.count)) \
         .limit(5) \
         .all()
     
-    top_diagnoses = []
-    for diag_id, count in patient_diagnoses:
-        diagnosis = Diagnosis.query.get(diag_id)
-        top_diagnoses.append({
-            "name": diagnosis.name,
-            "count": count
-        })
+    top_diagnoses = [{"name": name, "count": count} for name, count in patient_diagnoses]
     
     return jsonify({
         "patients": {
@@ -95,8 +128,7 @@ def get_appointment_statistics():
     """
     Get detailed appointment statistics
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
@@ -126,32 +158,30 @@ def get_appointment_statistics():
         except ValueError:
             return jsonify({"msg": "Invalid end_date format. Use YYYY-MM-DD"}), 400
     
-    # Get total appointments in date range
-    total_appointments = Appointment.query.filter(
-        Appointment.doctor_id == doctor.id,
-        Appointment.date >= start_date,
-        Appointment.date <= end_date
-    ).count()
+    # Read appointment counters for the range from the daily rollups
+    in_range = and_(
+        DailyStatRollup.doctor_id == doctor.id,
+        DailyStatRollup.metric == 'appointments',
+        DailyStatRollup.day >= start_date,
+        DailyStatRollup.day <= end_date
+    )
     
     # Get appointments by status
     status_counts = db.session.query(
-        Appointment.status, func.count(Appointment.id)
-    ).filter(
-        Appointment.doctor_id == doctor.id,
-        Appointment.date >= start_date,
-        Appointment.date <= end_date
-    ).group_by(Appointment.status).all()
+        DailyStatRollup.dimension, func.sum(DailyStatRollup.count)
+    ).filter(in_range).group_by(
+        DailyStatRollup.dimension
+    ).having(func.sum(DailyStatRollup.count) > 0).all()
     
-    by_status = [{"status": status, "count": count} for status, count in status_counts]
+    by_status = [{"status": status or None, "count": count} for status, count in status_counts]
+    total_appointments = sum(count for _, count in status_counts)
     
     # Get appointments by day
     day_counts = db.session.query(
-        Appointment.date, func.count(Appointment.id)
-    ).filter(
-        Appointment.doctor_id == doctor.id,
-        Appointment.date >= start_date,
-        Appointment.date <= end_date
-    ).group_by(Appointment.date).all()
+        DailyStatRollup.day, func.sum(DailyStatRollup.count)
+    ).filter(in_range).group_by(
+        DailyStatRollup.day
+    ).having(func.sum(DailyStatRollup.count) > 0).order_by(DailyStatRollup.day).all()
     
     by_day = [{"date": day.strftime('%Y-%m-%d'), "count": count} for day, count in day_counts]
     
@@ -173,14 +203,18 @@ def get_patient_statistics():
     """
     Get detailed patient statistics
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
     
     # Get total patients
-    total_patients = Patient.query.filter_by(doctor_id=doctor.id).count()
+    total_patients = db.session.query(
+        func.coalesce(func.sum(DailyStatRollup.count), 0)
+    ).filter(
+        DailyStatRollup.doctor_id == doctor.id,
+        DailyStatRollup.metric == 'new_patients'
+    ).scalar()
     
     # Get patients by gender
     gender_counts = db.session.query(
@@ -191,7 +225,7 @@ def get_patient_statistics():
     
     by_gender = [{"gender": gender or "Not specified", "count": count} for gender, count in gender_counts]
     
-    # Get patients by age group
+    # Get patients by age group, bucketed in a single grouped query
     today = date.today()
     age_groups = [
         {'name': '0-10', 'min': 0, 'max': 10},
@@ -204,38 +238,48 @@ def get_patient_statistics():
         {'name': '71+', 'min': 71, 'max': 200}
     ]
     
-    by_age_group = []
-    for group in age_groups:
-        min_date = date(today.year - group['max'] - 1, today.month, today.day) + timedelta(days=1)
-        max_date = date(today.year - group['min'], today.month, today.day)
-        
-        count = Patient.query.filter(
-            Patient.doctor_id == doctor.id,
-            Patient.date_of_birth >= min_date,
-            Patient.date_of_birth <= max_date
-        ).count()
-        
-        if count > 0:
-            by_age_group.append({"group": group['name'], "count": count})
-    
-    # Get new patients by month for the last 12 months
-    new_patients = []
-    for i in range(12):
-        month = (today.month - i - 1) % 12 + 1
-        year = today.year - ((i + (today.month - 1)) // 12)
-        
-        count = Patient.query.filter(
-            Patient.doctor_id == doctor.id,
-            extract('month', Patient.created_at) == month,
-            extract('year', Patient.created_at) == year
-        ).count()
-        
-        new_patients.append({
-            "month": datetime(year, month, 1).strftime('%Y-%m'),
-            "count": count
-        })
+    age_bucket = case(
+        *[
+            (
+                and_(
+                    Patient.date_of_birth >= years_before(today, group['max'] + 1) + timedelta(days=1),
+                    Patient.date_of_birth <= years_before(today, group['min'])
+                ),
+                group['name']
+            )
+            for group in age_groups
+        ],
+        else_=None
+    ).label('age_group')
+    
+    age_counts = dict(db.session.query(
+        age_bucket, func.count(Patient.id)
+    ).filter(
+        Patient.doctor_id == doctor.id
+    ).group_by(age_bucket).all())
     
-    new_patients.reverse()  # Show oldest to newest
+    by_age_group = [
+        {"group": group['name'], "count": age_counts[group['name']]}
+        for group in age_groups
+        if age_counts.get(group['name'], 0) > 0
+    ]
+    
+    # Get new patients by month (last 12 months unless a range is given)
+    date_range = parse_histogram_range(request.args, today)
+    if date_range is None:
+        return jsonify({
+            "msg": f"Invalid date range. Use months=N or start_date/end_date as YYYY-MM-DD, "
+                   f"up to {MAX_HISTOGRAM_MONTHS} months"
+        }), 400
+    
+    new_patients = [
+        {"month": month, "count": count}
+        for month, count in date_histogram(
+            DailyStatRollup.day, *date_range, bucket='month',
+            filters=[DailyStatRollup.doctor_id == doctor.id, DailyStatRollup.metric == 'new_patients'],
+            value=func.sum(DailyStatRollup.count)
+        )
+    ]
     
     return jsonify({
         "patients": {
@@ -252,42 +296,39 @@ def get_prescription_statistics():
     """
     Get detailed prescription statistics
     """
-    current_user_uuid = get_jwt_identity()
-    doctor = Doctor.query.filter_by(uuid=current_user_uuid).first()
+    doctor = get_current_doctor()
     
     if not doctor:
         return jsonify({"msg": "Doctor not found"}), 404
     
-    # Get total prescriptions
-    total_prescriptions = Prescription.query.filter_by(doctor_id=doctor.id).count()
-    
-    # Get recent prescriptions (last 30 days)
+    # Get total and recent (last 30 days) prescriptions
     today = date.today()
     thirty_days_ago = today - timedelta(days=30)
     
-    recent_count = Prescription.query.filter(
-        Prescription.doctor_id == doctor.id,
-        Prescription.issue_date >= thirty_days_ago
-    ).count()
-    
-    # Get prescriptions by month for the last 12 months
-    prescriptions_by_month = []
-    for i in range(12):
-        month = (today.month - i - 1) % 12 + 1
-        year = today.year - ((i + (today.month - 1)) // 12)
-        
-        count = Prescription.query.filter(
-            Prescription.doctor_id == doctor.id,
-            extract('month', Prescription.issue_date) == month,
-            extract('year', Prescription.issue_date) == year
-        ).count()
-        
-        prescriptions_by_month.append({
-            "month": datetime(year, month, 1).strftime('%Y-%m'),
-            "count": count
-        })
-    
-    prescriptions_by_month.reverse()  # Show oldest to newest
+    total_prescriptions, recent_count = db.session.query(
+        func.coalesce(func.sum(DailyStatRollup.count), 0),
+        sum_if(DailyStatRollup.day >= thirty_days_ago, DailyStatRollup.count)
+    ).filter(
+        DailyStatRollup.doctor_id == doctor.id,
+        DailyStatRollup.metric == 'prescriptions'
+    ).one()
+    
+    # Get prescriptions by month (last 12 months unless a range is given)
+    date_range = parse_histogram_range(request.args, today)
+    if date_range is None:
+        return jsonify({
+            "msg": f"Invalid date range. Use months=N or start_date/end_date as YYYY-MM-DD, "
+                   f"up to {MAX_HISTOGRAM_MONTHS} months"
+        }), 400
+    
+    prescriptions_by_month = [
+        {"month": month, "count": count}
+        for month, count in date_histogram(
+            DailyStatRollup.day, *date_range, bucket='month',
+            filters=[DailyStatRollup.doctor_id == doctor.id, DailyStatRollup.metric == 'prescriptions'],
+            value=func.sum(DailyStatRollup.count)
+        )
+    ]
     
     # Get top prescribed medicines
     top_medicines_query = db.session.query(
@@ -313,4 +354,36 @@ def get_prescription_statistics():
         },
         "by_month": prescriptions_by_month,
         "top_medicines": top_medicines
-    }), 200
\ No newline at end of file
+    }), 200
+
+@statistics_bp.route('/stats/export', methods=['GET'])
+@jwt_required()
+def export_statistics():
+    """
+    Export appointments, prescriptions (with items), patients or diagnosis
+    statistics as a streamed CSV file
+    """
+    doctor = get_current_doctor()
+    
+    if not doctor:
+        return jsonify({"msg": "Doctor not found"}), 404
+    
+    export_type = request.args.get('type', 'appointments')
+    if export_type not in EXPORTS:
+        return jsonify({"msg": f"Invalid export type. Use one of: {', '.join(EXPORTS)}"}), 400
+    
+    # Optional inclusive date range
+    try:
+        start = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date() if request.args.get('start_date') else None
+        end = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date() if request.args.get('end_date') else None
+    except ValueError:
+        return jsonify({"msg": "Invalid date format. Use YYYY-MM-DD"}), 400
+    
+    headers, rows = export_rows(export_type, doctor.id, start, end)
+    filename = f"{export_type}_{date.today().strftime('%Y%m%d')}.csv"
+    
+    return Response(
+        stream_with_context(stream_csv(rows, headers)),
+        mimetype='text/csv',
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
\ No newline at end of file
@@ -0,0 +1,415 @@
+import gzip
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+from datetime import date, datetime, time
+from flask import current_app
+from sqlalchemy import DDL, Index, MetaData, Table, and_, event, inspect, literal, or_, select, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import CreateTable
+from app.extensions import db
+from app.models.models import ActivityLog
+from app.services.utils import CustomJSONEncoder
+
+logger = logging.getLogger(__name__)
+
+BASE_TABLE = ActivityLog.__table__
+
+# Monthly partitions are named activity_logs_YYYYMM
+_PARTITION_PATTERN = re.compile(rf'^{BASE_TABLE.name}_(\d{{4}})(\d{{2}})$')
+
+# Partitions' own tables, used to read and write them directly
+_partition_metadata = MetaData()
+_partition_metadata_lock = threading.Lock()
+
+
+def month_start(value):
+    """First day of the month of a date or datetime"""
+    return date(value.year, value.month, 1)
+
+
+def next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{BASE_TABLE.name}_{month:%Y%m}'
+
+
+def partition_month(name):
+    """Month of a partition table, or None if the name isn't a monthly partition"""
+    match = _PARTITION_PATTERN.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def partition_table(name):
+    """Table with the activity log columns and per-partition indexes"""
+    with _partition_metadata_lock:
+        if name in _partition_metadata.tables:
+            return _partition_metadata.tables[name]
+
+        return Table(
+            name, _partition_metadata,
+            *[column._copy() for column in BASE_TABLE.columns],
+            Index(f'ix_{name}_doctor_timestamp', 'doctor_id', 'timestamp'),
+            Index(f'ix_{name}_entity', 'entity_type', 'entity_id', 'timestamp')
+        )
+
+
+# PostgreSQL: activity_logs is natively partitioned by timestamp range. The
+# partition key has to be part of the primary key there.
+@compiles(CreateTable, 'postgresql')
+def _create_partitioned_activity_logs(create, compiler, **kw):
+    statement = compiler.visit_create_table(create, **kw)
+    if create.element is not BASE_TABLE:
+        return statement
+    statement = statement.replace('PRIMARY KEY (id)', 'PRIMARY KEY (id, timestamp)')
+    return statement.rstrip() + ' PARTITION BY RANGE (timestamp)\n\n'
+
+
+# Catch-all partition for rows outside the created monthly ranges
+event.listen(BASE_TABLE, 'after_create', DDL(
+    f'CREATE TABLE IF NOT EXISTS {BASE_TABLE.name}_default PARTITION OF {BASE_TABLE.name} DEFAULT'
+).execute_if(dialect='postgresql'))
+
+
+class ActivityLogPartitions:
+    """
+    Monthly partitions of the activity log.
+
+    The base activity_logs table plays the part of the default partition: it
+    holds rows that weren't routed to a month (e.g. added through the ORM).
+    Subclasses decide how months are stored and read.
+    """
+
+    def __init__(self):
+        self._known = set()
+        self._lock = threading.Lock()
+
+    def _create(self, connection, month):
+        raise NotImplementedError
+
+    def _drop(self, connection, name):
+        raise NotImplementedError
+
+    def partition_names(self, connection):
+        """Names of the existing monthly partitions"""
+        raise NotImplementedError
+
+    def ensure(self, connection, month):
+        """Create the partition of a month if it doesn't exist yet"""
+        name = partition_name(month)
+        if name not in self._known:
+            with self._lock:
+                self._create(connection, month)
+                self._known.add(name)
+        return name
+
+    def reset(self):
+        """Forget which partitions exist, e.g. after a rolled back write created some"""
+        with self._lock:
+            self._known.clear()
+
+    def partitions(self, connection):
+        """Existing monthly partitions as (month, name), oldest first"""
+        return sorted((partition_month(name), name) for name in self.partition_names(connection))
+
+    def drop(self, connection, name):
+        self._drop(connection, name)
+        with self._lock:
+            self._known.discard(name)
+
+    def insert(self, connection, rows):
+        """Write rows into the partitions of their months"""
+        by_month = {}
+        for row in rows:
+            if row.get('timestamp') is None:
+                row = dict(row, timestamp=datetime.utcnow())
+            by_month.setdefault(month_start(row['timestamp']), []).append(row)
+
+        for month, month_rows in by_month.items():
+            name = self.ensure(connection, month)
+            connection.execute(self.insert_table(name).insert(), month_rows)
+
+    def insert_table(self, name):
+        return partition_table(name)
+
+    def read_tables(self, connection, start=None, end=None):
+        """
+        Tables to read for a time range as (table, month) with the newest
+        month first; the default partition (month None) comes first.
+        """
+        raise NotImplementedError
+
+    def default_table(self, connection):
+        """Table holding the rows outside the monthly partitions"""
+        return BASE_TABLE
+
+
+class ShardedActivityLogPartitions(ActivityLogPartitions):
+    """Separate activity_logs_YYYYMM tables (SQLite and other databases)"""
+
+    def _create(self, connection, month):
+        partition_table(partition_name(month)).create(connection, checkfirst=True)
+
+    def _drop(self, connection, name):
+        partition_table(name).drop(connection, checkfirst=True)
+
+    def partition_names(self, connection):
+        return [name for name in inspect(connection).get_table_names() if partition_month(name)]
+
+    def read_tables(self, connection, start=None, end=None):
+        tables = [(BASE_TABLE, None)]
+        for month, name in reversed(self.partitions(connection)):
+            month_begins = datetime.combine(month, time.min)
+            month_ends = datetime.combine(next_month(month), time.min)
+            if (end is None or month_begins < end) and (start is None or month_ends > start):
+                tables.append((partition_table(name), month))
+        return tables
+
+
+class NativeActivityLogPartitions(ActivityLogPartitions):
+    """
+    PostgreSQL declarative range partitions of activity_logs.
+
+    Only an activity_logs table created by create_all is partitioned; one that
+    predates partitioning is a plain table and can't get PARTITION OF
+    children, so its months are kept in separate tables like on other
+    databases.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._sharded = None
+        self._checked = False
+
+    def _fallback(self, connection):
+        """Sharded partitions to use instead when activity_logs isn't partitioned"""
+        if not self._checked:
+            kind = connection.execute(text(
+                "SELECT relkind FROM pg_class WHERE relname = :name AND pg_table_is_visible(oid)"
+            ), {'name': BASE_TABLE.name}).scalar()
+            # Decided once the table exists
+            if kind is not None:
+                self._checked = True
+                if kind != 'p':
+                    logger.warning(f"{BASE_TABLE.name} is not partitioned, writing monthly tables instead")
+                    self._sharded = ShardedActivityLogPartitions()
+        return self._sharded
+
+    def _create(self, connection, month):
+        sharded = self._fallback(connection)
+        if sharded is not None:
+            return sharded._create(connection, month)
+
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {BASE_TABLE.name} "
+            f"FOR VALUES FROM ('{month}') TO ('{next_month(month)}')"
+        ))
+
+    def _drop(self, connection, name):
+        sharded = self._fallback(connection)
+        if sharded is not None:
+            return sharded._drop(connection, name)
+
+        connection.execute(text(f'ALTER TABLE {BASE_TABLE.name} DETACH PARTITION {name}'))
+        connection.execute(text(f'DROP TABLE {name}'))
+
+    def partition_names(self, connection):
+        sharded = self._fallback(connection)
+        if sharded is not None:
+            return sharded.partition_names(connection)
+
+        return [name for name in connection.execute(text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = :parent"
+        ), {'parent': BASE_TABLE.name}).scalars() if partition_month(name)]
+
+    def insert_table(self, name):
+        # Rows go through the parent and PostgreSQL routes them
+        return partition_table(name) if self._sharded is not None else BASE_TABLE
+
+    def read_tables(self, connection, start=None, end=None):
+        sharded = self._fallback(connection)
+        if sharded is not None:
+            return sharded.read_tables(connection, start, end)
+
+        # Partition pruning on the timestamp range happens in the planner
+        return [(BASE_TABLE, None)]
+
+    def default_table(self, connection):
+        if self._fallback(connection) is not None:
+            return BASE_TABLE
+        return partition_table(f'{BASE_TABLE.name}_default')
+
+
+def partitions_for_dialect(dialect_name):
+    if dialect_name == 'postgresql':
+        return NativeActivityLogPartitions()
+    return ShardedActivityLogPartitions()
+
+
+def init_activity_partitions(app):
+    """Attach the activity log partition manager to the application"""
+    with app.app_context():
+        app.extensions['activity_log_partitions'] = partitions_for_dialect(db.engine.dialect.name)
+
+
+def get_activity_partitions():
+    """Get the activity log partition manager of the current application"""
+    return current_app.extensions['activity_log_partitions']
+
+
+def _activity_select(table, doctor_id, entity_type=None, entity_id=None, action=None,
+                     start=None, end=None, before=None):
+    columns = table.c
+    query = select(*columns, literal(table.name).label('partition'))
+
+    conditions = []
+    if doctor_id is not None:
+        conditions.append(columns.doctor_id == doctor_id)
+    if entity_type is not None:
+        conditions.append(columns.entity_type == entity_type)
+    if entity_id is not None:
+        conditions.append(columns.entity_id == entity_id)
+    if action is not None:
+        conditions.append(columns.action == action)
+    if start is not None:
+        conditions.append(columns.timestamp >= start)
+    if end is not None:
+        conditions.append(columns.timestamp < end)
+    if before is not None:
+        timestamp, row_id = before
+        conditions.append(or_(
+            columns.timestamp < timestamp,
+            and_(columns.timestamp == timestamp, columns.id < row_id)
+        ))
+
+    return query.where(*conditions).order_by(columns.timestamp.desc(), columns.id.desc())
+
+
+def query_activity(doctor_id, entity_type=None, entity_id=None, action=None,
+                   start=None, end=None, before=None, limit=50):
+    """
+    Newest activity first, filtered by doctor, entity, action and a
+    [start, end) time range, continuing after a (timestamp, id) key.
+
+    Every partition is read through its (doctor_id, timestamp) or
+    (entity_type, entity_id, timestamp) index. Monthly partitions don't
+    overlap, so they are read newest first and the scan stops as soon as
+    `limit` rows are found.
+    """
+    connection = db.session.connection()
+    partitions = get_activity_partitions()
+
+    rows = []
+    found_in_months = 0
+    for table, month in partitions.read_tables(connection, start, end):
+        if month is not None and found_in_months >= limit:
+            break
+        if month is not None and before is not None and datetime.combine(month, time.min) > before[0]:
+            continue
+
+        query = _activity_select(table, doctor_id, entity_type, entity_id, action, start, end, before)
+        table_rows = connection.execute(query.limit(limit)).mappings().all()
+        rows.extend(table_rows)
+        if month is not None:
+            found_in_months += len(table_rows)
+
+    rows.sort(key=lambda row: (row['timestamp'], row['id']), reverse=True)
+    return rows[:limit]
+
+
+def _write_archive(path, rows):
+    with gzip.open(path, 'at', encoding='utf-8') as archive:
+        for row in rows:
+            archive.write(json.dumps(dict(row), cls=CustomJSONEncoder) + '\n')
+
+
+def archive_activity_logs(before, directory, dry_run=False, batch_size=1000):
+    """
+    Move activity older than the month of `before` into gzipped JSON-lines
+    files (one activity_logs_YYYYMM.jsonl.gz per month) and drop it from the
+    database: whole monthly partitions are dropped, rows of the default
+    partition are deleted. New rows are appended to a copy of each archive
+    that replaces it only once the deletions are committed, so a failed run
+    leaves the archives untouched and re-runs are safe.
+    Returns (month, rows) for every archived month.
+    """
+    cutoff = datetime.combine(month_start(before), time.min)
+    partitions = get_activity_partitions()
+    archived = {}
+    staged = {}  # archive path -> copy being appended to
+
+    def stage(path):
+        if path not in staged:
+            temporary = f'{path}.tmp'
+            if os.path.exists(path):
+                shutil.copyfile(path, temporary)
+            elif os.path.exists(temporary):
+                os.remove(temporary)
+            staged[path] = temporary
+        return staged[path]
+
+    if not dry_run:
+        os.makedirs(directory, exist_ok=True)
+
+    try:
+        with db.engine.begin() as connection:
+            for month, name in partitions.partitions(connection):
+                if month >= cutoff.date():
+                    continue
+
+                table = partition_table(name)
+                query = select(table).order_by(table.c.timestamp, table.c.id)
+                rows = 0
+                path = os.path.join(directory, f'{name}.jsonl.gz')
+                for chunk in connection.execution_options(yield_per=batch_size).execute(query).mappings().partitions():
+                    rows += len(chunk)
+                    if not dry_run:
+                        _write_archive(stage(path), chunk)
+
+                if not dry_run:
+                    partitions.drop(connection, name)
+                archived[month] = archived.get(month, 0) + rows
+                logger.info(f"Archived partition {name} ({rows} rows)")
+
+            # Stragglers in the default partition
+            default_table = partitions.default_table(connection)
+            query = select(default_table).where(default_table.c.timestamp < cutoff).order_by(
+                default_table.c.timestamp, default_table.c.id
+            )
+            for chunk in connection.execution_options(yield_per=batch_size).execute(query).mappings().partitions():
+                by_month = {}
+                for row in chunk:
+                    by_month.setdefault(month_start(row['timestamp']), []).append(row)
+                for month, month_rows in by_month.items():
+                    if not dry_run:
+                        _write_archive(stage(os.path.join(directory, f'{partition_name(month)}.jsonl.gz')), month_rows)
+                    archived[month] = archived.get(month, 0) + len(month_rows)
+
+            if not dry_run:
+                connection.execute(default_table.delete().where(default_table.c.timestamp < cutoff))
+    except Exception:
+        partitions.reset()
+        for temporary in staged.values():
+            if os.path.exists(temporary):
+                os.remove(temporary)
+        raise
+
+    for path, temporary in staged.items():
+        os.replace(temporary, path)
+
+    return sorted(archived.items())
+
+
+def retention_cutoff(months, today=None):
+    """First day of the oldest month kept when keeping `months` months including the current one"""
+    today = today or date.today()
+    total = today.year * 12 + today.month - 1 - (months - 1)
+    return date(total // 12, total % 12 + 1, 1)
@@ -0,0 +1,123 @@
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import func, case, DateTime
+from app.extensions import db
+
+# Bucket label formats per dialect for date histograms
+BUCKET_FORMATS = {
+    'day': {'python': '%Y-%m-%d', 'sqlite': '%Y-%m-%d', 'postgresql': 'YYYY-MM-DD', 'mysql': '%Y-%m-%d'},
+    'month': {'python': '%Y-%m', 'sqlite': '%Y-%m', 'postgresql': 'YYYY-MM', 'mysql': '%Y-%m'},
+    'year': {'python': '%Y', 'sqlite': '%Y', 'postgresql': 'YYYY', 'mysql': '%Y'}
+}
+
+
+def count_if(condition):
+    """Conditional COUNT expression: SUM(CASE WHEN condition THEN 1 ELSE 0 END)"""
+    return sum_if(condition, 1)
+
+
+def sum_if(condition, value):
+    """Conditional SUM expression: SUM(CASE WHEN condition THEN value ELSE 0 END)"""
+    return func.coalesce(func.sum(case((condition, value), else_=0)), 0)
+
+
+def month_start(day):
+    """First day of the month containing the given date"""
+    return date(day.year, day.month, 1)
+
+
+def add_months(day, months):
+    """First day of the month `months` months after the month of the given date"""
+    month_index = day.year * 12 + (day.month - 1) + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def month_bounds(day):
+    """Half-open [start, end) date range of the month containing the given date"""
+    start = month_start(day)
+    return start, add_months(start, 1)
+
+
+def years_before(day, years):
+    """Same calendar day `years` years earlier (Feb 29 falls back to Feb 28)"""
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        return day.replace(year=day.year - years, day=28)
+
+
+def range_bound(column, day):
+    """Bind a date bound against a Date or DateTime column"""
+    if isinstance(column.type, DateTime):
+        return datetime.combine(day, time.min)
+    return day
+
+
+def bucket_expression(column, bucket='month', dialect_name=None):
+    """SQL expression labelling a date/datetime column with its histogram bucket"""
+    if dialect_name is None:
+        dialect_name = db.engine.dialect.name
+
+    formats = BUCKET_FORMATS[bucket]
+
+    if dialect_name == 'postgresql':
+        return func.to_char(func.date_trunc(bucket, column), formats['postgresql'])
+
+    if dialect_name in ('mysql', 'mariadb'):
+        return func.date_format(column, formats['mysql'])
+
+    return func.strftime(formats['sqlite'], column)
+
+
+def bucket_start(day, bucket='month'):
+    """Start of the bucket containing the given date"""
+    if bucket == 'day':
+        return day
+    if bucket == 'month':
+        return month_start(day)
+    return date(day.year, 1, 1)
+
+
+def next_bucket(day, bucket='month'):
+    """Start of the bucket following the one starting at the given date"""
+    if bucket == 'day':
+        return day + timedelta(days=1)
+    if bucket == 'month':
+        return add_months(day, 1)
+    return date(day.year + 1, 1, 1)
+
+
+def bucket_keys(start, end, bucket='month'):
+    """All bucket labels covering the half-open date range [start, end)"""
+    fmt = BUCKET_FORMATS[bucket]['python']
+    keys = []
+
+    current = bucket_start(start, bucket)
+    while current < end:
+        keys.append(current.strftime(fmt))
+        current = next_bucket(current, bucket)
+
+    return keys
+
+
+def date_histogram(column, start, end, bucket='month', filters=(), value=None):
+    """
+    Count rows (or aggregate `value`) per day/month/year bucket of `column`
+    over [start, end) in a single grouped query. The range filter is expressed
+    as plain bounds on the column so it can use an index. Empty buckets are
+    filled with zero. Returns a list of (bucket_label, count) tuples, oldest first.
+    """
+    bucket_column = bucket_expression(column, bucket).label('bucket')
+
+    if value is None:
+        value = func.count()
+
+    rows = db.session.query(
+        bucket_column, value
+    ).filter(
+        column >= range_bound(column, start),
+        column < range_bound(column, end),
+        *filters
+    ).group_by(bucket_column).all()
+
+    counts = {key: int(count or 0) for key, count in rows}
+    return [(key, counts.get(key, 0)) for key in bucket_keys(start, end, bucket)]
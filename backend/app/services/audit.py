@@ -0,0 +1,282 @@
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+import weakref
+from collections import Counter
+from datetime import datetime
+from flask import current_app, g, request
+from app.extensions import db
+from app.services.activity_partitions import partitions_for_dialect
+
+logger = logging.getLogger(__name__)
+
+DURABILITY_MODES = ('async', 'sync')
+
+# Queued by close() to wake a writer waiting for events
+_WAKE = object()
+
+# Writers still open at interpreter exit are flushed; closed ones are released
+_open_writers = weakref.WeakSet()
+
+# Audit action recorded for each HTTP method
+REQUEST_ACTIONS = {
+    'GET': 'read',
+    'HEAD': 'read',
+    'POST': 'create',
+    'PUT': 'update',
+    'PATCH': 'update',
+    'DELETE': 'delete'
+}
+
+
+class _Ticket:
+    """Completion signal for an event recorded with sync durability"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.ok = False
+
+
+class AuditWriter:
+    """
+    Bounded in-process queue of audit rows, written to the monthly
+    activity log partitions in batches (one executemany per partition and
+    batch) on its own connection, so audit
+    writes never touch the request session or add a commit to the request.
+
+    durability:
+      'async' - record() returns once the row is queued; the background writer
+                waits up to flush_interval to fill a batch.
+      'sync'  - record() blocks until the batch holding the row is committed;
+                concurrent callers share batches (group commit).
+
+    When the queue is full, record() blocks for up to enqueue_timeout and then
+    drops the row (overflow='block') or drops it immediately (overflow='drop').
+    Without a background thread rows are written by flush(), by the caller
+    once the queue fills up, and on close().
+    """
+
+    def __init__(self, engine, partitions=None, maxsize=10000, batch_size=500, flush_interval=1.0,
+                 durability='async', overflow='block', enqueue_timeout=1.0, background=True):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown audit durability mode: {durability}")
+
+        self.engine = engine
+        self.partitions = partitions_for_dialect(engine.dialect.name) if partitions is None else partitions
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.durability = durability
+        self.overflow = overflow
+        self.enqueue_timeout = enqueue_timeout
+        self.stats = Counter()
+
+        self._queue = queue.Queue(maxsize)
+        self._write_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        if background:
+            self.start()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+
+    def _count(self, **increments):
+        with self._stats_lock:
+            self.stats.update(increments)
+
+    def record(self, row):
+        """Queue an audit row. Returns False if it was dropped (or, in sync mode, not written)."""
+        ticket = _Ticket() if self.durability == 'sync' else None
+        item = (row, ticket)
+
+        try:
+            if not self.running:
+                self._put_without_writer(item)
+            elif self.overflow == 'block':
+                self._queue.put(item, timeout=self.enqueue_timeout)
+            else:
+                self._queue.put_nowait(item)
+        except queue.Full:
+            self._count(dropped=1)
+            logger.warning("Audit queue full, dropping event")
+            return False
+
+        self._count(enqueued=1)
+
+        if ticket is None:
+            return True
+        if not self.running:
+            self.flush()
+        ticket.done.wait(self.enqueue_timeout + self.flush_interval + 30)
+        return ticket.ok
+
+    def _put_without_writer(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # Nobody else will drain the queue, so the caller does
+            self.flush()
+            self._queue.put_nowait(item)
+
+    def _take(self, limit):
+        items = []
+        while len(items) < limit:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _WAKE:
+                items.append(item)
+        return items
+
+    def _write(self, items):
+        rows = [row for row, _ in items]
+        ok = False
+        try:
+            with self._write_lock, self.engine.begin() as connection:
+                self.partitions.insert(connection, rows)
+            ok = True
+            self._count(written=len(rows), batches=1)
+        except Exception:
+            self.partitions.reset()
+            self._count(failed=len(rows))
+            logger.exception(f"Error writing {len(rows)} audit events")
+
+        for _, ticket in items:
+            if ticket is not None:
+                ticket.ok = ok
+                ticket.done.set()
+        return len(rows) if ok else 0
+
+    def flush(self):
+        """Write everything queued so far. Returns the number of rows written."""
+        written = 0
+        while True:
+            items = self._take(self.batch_size)
+            if not items:
+                return written
+            written += self._write(items)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            if first is _WAKE:
+                continue
+
+            items = [first] + self._take(self.batch_size - 1)
+
+            # Linger for a fuller batch unless callers are waiting on it
+            if self.durability == 'async':
+                deadline = time.monotonic() + self.flush_interval
+                while len(items) < self.batch_size and not self._stop.is_set():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=min(remaining, 0.05))
+                    except queue.Empty:
+                        continue
+                    if item is not _WAKE:
+                        items.append(item)
+
+            self._write(items)
+
+    def close(self, timeout=10):
+        """Stop the background writer and flush whatever is still queued"""
+        self._stop.set()
+        if self._thread is not None:
+            try:
+                self._queue.put_nowait(_WAKE)
+            except queue.Full:
+                pass
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+        _open_writers.discard(self)
+
+
+def init_audit(app):
+    """Attach the audit writer to the application and audit requests when AUDIT_REQUESTS is set"""
+    with app.app_context():
+        engine = db.engine
+
+    writer = AuditWriter(
+        engine,
+        partitions=app.extensions['activity_log_partitions'],
+        maxsize=app.config.get('AUDIT_QUEUE_SIZE', 10000),
+        batch_size=app.config.get('AUDIT_BATCH_SIZE', 500),
+        flush_interval=app.config.get('AUDIT_FLUSH_INTERVAL', 1.0),
+        durability=app.config.get('AUDIT_DURABILITY', 'async'),
+        overflow=app.config.get('AUDIT_OVERFLOW', 'block'),
+        enqueue_timeout=app.config.get('AUDIT_ENQUEUE_TIMEOUT', 1.0),
+        background=app.config.get('AUDIT_BACKGROUND_WRITER', True)
+    )
+    app.extensions['audit_writer'] = writer
+    _open_writers.add(writer)
+    app.after_request(_audit_request)
+
+
+@atexit.register
+def _close_writers():
+    for writer in list(_open_writers):
+        writer.close()
+
+
+def get_audit_writer():
+    """Get the audit writer of the current application"""
+    return current_app.extensions['audit_writer']
+
+
+def audit_row(doctor_id, action, entity_type=None, entity_id=None, details=None, request=None):
+    """activity_logs row for an event, timestamped now rather than when it is written"""
+    return {
+        'doctor_id': doctor_id,
+        'action': action,
+        'entity_type': entity_type,
+        'entity_id': entity_id,
+        'details': details,
+        'ip_address': request.remote_addr if request else None,
+        'user_agent': request.user_agent.string if request and request.user_agent else None,
+        'timestamp': datetime.utcnow()
+    }
+
+
+def record_activity(doctor_id, action, entity_type=None, entity_id=None, details=None, request=None):
+    """Queue an audit event. Returns False if it was dropped."""
+    return get_audit_writer().record(audit_row(doctor_id, action, entity_type, entity_id, details, request))
+
+
+def _audit_request(response):
+    # Only requests that resolved a doctor are attributable
+    doctor = g.get('current_doctor')
+    if doctor is None or not current_app.config.get('AUDIT_REQUESTS', False):
+        return response
+
+    details = json.dumps({
+        'endpoint': request.endpoint,
+        'path': request.path,
+        'status': response.status_code
+    })
+    record_activity(doctor.id, REQUEST_ACTIONS.get(request.method, request.method.lower()),
+                    entity_type=request.blueprint, details=details, request=request)
+    return response
@@ -0,0 +1,268 @@
+import logging
+from datetime import date, datetime
+from itertools import chain
+from sqlalchemy import case, event, func, inspect, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from app.extensions import db
+from app.models.models import DiagnosisMedicineStat, Medicine, PatientDiagnosis, Prescription, PrescriptionItem
+
+logger = logging.getLogger(__name__)
+
+_SESSION_KEY = 'cooccurrence_snapshot'
+
+
+def _track_previous_value(target, value, oldvalue, initiator):
+    return value
+
+
+# The previous prescription of a moved item or diagnosis must be known even if it was expired
+for _attribute in (PrescriptionItem.prescription_id, PatientDiagnosis.prescription_id):
+    event.listen(_attribute, 'set', _track_previous_value, active_history=True, retval=True)
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+
+def pair_counts(connection, prescription_ids=None):
+    """
+    Diagnosis/medicine co-occurrences of prescriptions (all of them when
+    prescription_ids is None) as {(doctor_id, diagnosis_id, medicine_id): (count, last_seen)}.
+    Every item of a prescription pairs with every diagnosis linked to it.
+    """
+    query = select(
+        Prescription.doctor_id, PatientDiagnosis.diagnosis_id, PrescriptionItem.medicine_id,
+        func.count(), func.max(Prescription.issue_date)
+    ).select_from(PatientDiagnosis).join(
+        PrescriptionItem, PrescriptionItem.prescription_id == PatientDiagnosis.prescription_id
+    ).join(
+        Prescription, Prescription.id == PatientDiagnosis.prescription_id
+    ).group_by(
+        Prescription.doctor_id, PatientDiagnosis.diagnosis_id, PrescriptionItem.medicine_id
+    )
+
+    if prescription_ids is not None:
+        if not prescription_ids:
+            return {}
+        query = query.where(PatientDiagnosis.prescription_id.in_(prescription_ids))
+
+    return {
+        (doctor_id, diagnosis_id, medicine_id): (count, _as_date(last_seen))
+        for doctor_id, diagnosis_id, medicine_id, count, last_seen in connection.execute(query)
+    }
+
+
+def _prescription_ids(obj):
+    """Current and previous prescription ids an object contributes pairs to"""
+    if isinstance(obj, Prescription):
+        return {obj.id}
+
+    state = inspect(obj)
+    ids = {obj.prescription_id}
+    ids.update(state.attrs.prescription_id.history.deleted or ())
+
+    # Attached through the relationship but not flushed yet
+    prescription = state.attrs.prescription.loaded_value
+    if isinstance(prescription, Prescription):
+        ids.add(prescription.id)
+
+    return ids
+
+
+def _loaded_pairs(prescription):
+    """Pairs of a just-created prescription from its in-memory items and diagnoses, None if not loaded"""
+    state = inspect(prescription)
+    items = state.attrs['items'].loaded_value
+    diagnoses = state.attrs.diagnoses.loaded_value
+    if not isinstance(items, list) or not isinstance(diagnoses, list):
+        return None
+
+    pairs = {}
+    for diagnosis in diagnoses:
+        for item in items:
+            key = (prescription.doctor_id, diagnosis.diagnosis_id, item.medicine_id)
+            count, _ = pairs.get(key, (0, None))
+            pairs[key] = (count + 1, _as_date(prescription.issue_date))
+    return pairs
+
+
+def _merge_pairs(total, pairs):
+    for key, (count, last_seen) in pairs.items():
+        total_count, total_seen = total.get(key, (0, None))
+        if total_seen is None or (last_seen is not None and last_seen > total_seen):
+            total_seen = last_seen
+        total[key] = (total_count + count, total_seen)
+
+
+def _related(session):
+    return [
+        obj for obj in chain(session.new, session.dirty, session.deleted)
+        if isinstance(obj, (Prescription, PrescriptionItem, PatientDiagnosis))
+    ]
+
+
+@event.listens_for(Session, 'before_flush')
+def _snapshot_pairs(session, flush_context, instances):
+    # Pairs of the touched prescriptions as stored before this flush
+    related = _related(session)
+    if not related:
+        return
+
+    ids = set()
+    for obj in related:
+        ids.update(_prescription_ids(obj))
+    ids.discard(None)
+
+    before = pair_counts(session.connection(), ids) if ids else {}
+    session.info[_SESSION_KEY] = (related, ids, before)
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_pairs(session, flush_context):
+    snapshot = session.info.pop(_SESSION_KEY, None)
+    if snapshot is None:
+        return
+
+    related, ids, before = snapshot
+    # New prescriptions, items and diagnoses have their ids now
+    for obj in related:
+        ids.update(_prescription_ids(obj))
+    ids.discard(None)
+
+    # Freshly created prescriptions are counted from memory instead of read back
+    after = {}
+    for obj in related:
+        if isinstance(obj, Prescription) and obj in session.new and obj.id in ids:
+            pairs = _loaded_pairs(obj)
+            if pairs is not None:
+                _merge_pairs(after, pairs)
+                ids.discard(obj.id)
+
+    connection = session.connection()
+    _merge_pairs(after, pair_counts(connection, ids))
+
+    deltas = {}
+    for key in set(before) | set(after):
+        old_count, old_seen = before.get(key, (0, None))
+        new_count, new_seen = after.get(key, (0, None))
+        if new_count != old_count or (new_seen and (old_seen is None or new_seen > old_seen)):
+            deltas[key] = (new_count - old_count, new_seen)
+
+    apply_pair_deltas(connection, deltas)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_snapshot(session):
+    session.info.pop(_SESSION_KEY, None)
+
+
+def apply_pair_deltas(connection, deltas):
+    """
+    Add count deltas to the co-occurrence table. last_seen only moves
+    forward; pairs whose count drops to zero are removed.
+    """
+    if not deltas:
+        return
+
+    table = DiagnosisMedicineStat.__table__
+    dialect_name = connection.dialect.name
+
+    for (doctor_id, diagnosis_id, medicine_id), (amount, last_seen) in deltas.items():
+        key = dict(doctor_id=doctor_id, diagnosis_id=diagnosis_id, medicine_id=medicine_id)
+
+        if dialect_name in ('sqlite', 'postgresql'):
+            insert = sqlite_insert if dialect_name == 'sqlite' else postgresql_insert
+            stmt = insert(table).values(count=amount, last_seen=last_seen, **key)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['diagnosis_id', 'medicine_id', 'doctor_id'],
+                set_={
+                    'count': table.c.count + stmt.excluded.count,
+                    'last_seen': case(
+                        (table.c.last_seen.is_(None), stmt.excluded.last_seen),
+                        (stmt.excluded.last_seen > table.c.last_seen, stmt.excluded.last_seen),
+                        else_=table.c.last_seen
+                    )
+                }
+            )
+            connection.execute(stmt)
+        else:
+            conditions = [table.c[column] == value for column, value in key.items()]
+            result = connection.execute(table.update().where(*conditions).values(
+                count=table.c.count + amount,
+                last_seen=case(
+                    (table.c.last_seen.is_(None), last_seen),
+                    (table.c.last_seen < last_seen, last_seen),
+                    else_=table.c.last_seen
+                )
+            ))
+            if result.rowcount == 0:
+                connection.execute(table.insert().values(count=amount, last_seen=last_seen, **key))
+
+        if amount < 0:
+            connection.execute(table.delete().where(
+                *[table.c[column] == value for column, value in key.items()], table.c.count <= 0
+            ))
+
+
+def rebuild_pair_counts(batch_size=1000):
+    """
+    Recompute the co-occurrence table from all prescriptions (backfill / repair).
+    Returns the number of rows written.
+    """
+    DiagnosisMedicineStat.query.delete(synchronize_session=False)
+
+    table = DiagnosisMedicineStat.__table__
+    rows = [
+        dict(doctor_id=doctor_id, diagnosis_id=diagnosis_id, medicine_id=medicine_id, count=count, last_seen=last_seen)
+        for (doctor_id, diagnosis_id, medicine_id), (count, last_seen) in pair_counts(db.session.connection()).items()
+    ]
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(table.insert(), rows[start:start + batch_size])
+
+    db.session.commit()
+    logger.info(f"Rebuilt {len(rows)} diagnosis/medicine co-occurrence rows")
+    return len(rows)
+
+
+def recommend_medicines(diagnosis_id, doctor_id=None, doctor_weight=0, limit=5):
+    """
+    Medicines most often prescribed with a diagnosis, read from the
+    co-occurrence table. With a doctor, their own prescriptions count
+    1 + doctor_weight times, so suggestions lean towards their habits.
+    Returns dicts with the medicine, overall and own counts, last_seen and score.
+    """
+    stats = DiagnosisMedicineStat
+    total = func.sum(stats.count)
+    own = func.sum(case((stats.doctor_id == doctor_id, stats.count), else_=0)) if doctor_id is not None else None
+    score = total + own * doctor_weight if own is not None and doctor_weight else total
+
+    columns = [stats.medicine_id, total.label('total'), func.max(stats.last_seen).label('last_seen'),
+               score.label('score')]
+    if own is not None:
+        columns.append(own.label('own'))
+
+    rows = db.session.query(*columns).filter(
+        stats.diagnosis_id == diagnosis_id
+    ).group_by(
+        stats.medicine_id
+    ).order_by(
+        score.desc(), func.max(stats.last_seen).desc(), stats.medicine_id
+    ).limit(limit).all()
+
+    medicines = {medicine.id: medicine for medicine in Medicine.query.filter(
+        Medicine.id.in_([row.medicine_id for row in rows])
+    )} if rows else {}
+
+    return [{
+        "medicine": medicines[row.medicine_id],
+        "count": row.total,
+        "doctor_count": getattr(row, 'own', None),
+        "last_seen": _as_date(row.last_seen),
+        "score": row.score
+    } for row in rows if row.medicine_id in medicines]
@@ -0,0 +1,197 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+from flask import current_app, has_app_context, request, has_request_context
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.util import find_tables
+from app.extensions import db
+
+logger = logging.getLogger(__name__)
+
+COUNT_STRATEGIES = ('exact', 'cached', 'estimate')
+
+
+class TableGenerations:
+    """
+    Per-table write generation. Every committed write to a table bumps its
+    generation, which invalidates the cached counts computed over it.
+    """
+
+    def __init__(self):
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def bump(self, table_names):
+        with self._lock:
+            for name in table_names:
+                self._generations[name] = self._generations.get(name, 0) + 1
+
+    def snapshot(self, table_names):
+        with self._lock:
+            return tuple(self._generations.get(name, 0) for name in table_names)
+
+
+class CountCache:
+    """Bounded TTL/LRU cache of listing totals tagged with the table generations they were computed at"""
+
+    def __init__(self, maxsize=4096, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, generations):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            value, entry_generations, expires_at = entry
+            if entry_generations != generations or expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, generations, value):
+        with self._lock:
+            self._entries[key] = (value, generations, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def init_count_cache(app):
+    """Attach the listing count cache to the application"""
+    app.extensions['count_cache'] = CountCache(
+        maxsize=app.config.get('COUNT_CACHE_SIZE', 4096),
+        ttl=app.config.get('COUNT_CACHE_TTL', 60)
+    )
+    app.extensions['table_generations'] = TableGenerations()
+
+
+def count_strategy(endpoint=None):
+    """
+    Count strategy for an endpoint: COUNT_STRATEGIES overrides keyed by Flask
+    endpoint name (e.g. 'notes.get_notes'), falling back to COUNT_STRATEGY.
+    """
+    if endpoint is None and has_request_context():
+        endpoint = request.endpoint
+
+    overrides = current_app.config.get('COUNT_STRATEGIES') or {}
+    strategy = overrides.get(endpoint, current_app.config.get('COUNT_STRATEGY', 'exact'))
+
+    if strategy not in COUNT_STRATEGIES:
+        logger.warning(f"Unknown count strategy {strategy!r}, using exact counts")
+        return 'exact'
+    return strategy
+
+
+def _query_tables(statement):
+    return sorted({table.name for table in find_tables(statement, include_joins=True, include_aliases=True)
+                   if getattr(table, 'name', None)})
+
+
+def _count_key(statement):
+    """Normalized filter: the compiled SQL plus its bound parameters"""
+    compiled = statement.compile(dialect=db.engine.dialect)
+    params = json.dumps(compiled.params, sort_keys=True, default=str)
+    return str(compiled), params
+
+
+def exact_count(query):
+    return query.order_by(None).count()
+
+
+def cached_count(query):
+    """
+    Exact count, memoized until a write is committed to one of the queried
+    tables (or the TTL bounds staleness from other processes' writes).
+    The doctor scope is part of the cached filter, so doctors never share totals.
+    """
+    query = query.order_by(None)
+    statement = query.statement
+    tables = _query_tables(statement)
+
+    cache = current_app.extensions['count_cache']
+    generations = current_app.extensions['table_generations'].snapshot(tables)
+    key = _count_key(statement)
+
+    total = cache.get(key, generations)
+    if total is None:
+        total = query.count()
+        cache.set(key, generations, total)
+    return total
+
+
+def estimated_count(query):
+    """
+    Row estimate from the PostgreSQL planner (EXPLAIN, no execution).
+    Other databases fall back to cached exact counts.
+    """
+    if db.engine.dialect.name != 'postgresql':
+        return cached_count(query)
+
+    statement = query.order_by(None).statement
+    compiled = statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+    plan = db.session.execute(text(f"EXPLAIN (FORMAT JSON) {compiled}")).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+COUNTERS = {
+    'exact': exact_count,
+    'cached': cached_count,
+    'estimate': estimated_count
+}
+
+
+def count_query(query, strategy=None):
+    """Total rows of a listing query using the given (or the endpoint's) count strategy"""
+    if strategy is None:
+        strategy = count_strategy()
+    return COUNTERS[strategy](query)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_written_tables(session, flush_context):
+    tables = session.info.setdefault('written_tables', set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        table = getattr(obj, '__table__', None)
+        if table is not None:
+            tables.add(table.name)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_written_tables(orm_execute_state):
+    # Query.update() / Query.delete() bypass the flush
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None:
+            orm_execute_state.session.info.setdefault('written_tables', set()).add(table.name)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_table_generations(session):
+    tables = session.info.pop('written_tables', None)
+    if tables and has_app_context() and 'table_generations' in current_app.extensions:
+        current_app.extensions['table_generations'].bump(tables)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_written_tables(session):
+    session.info.pop('written_tables', None)
@@ -0,0 +1,185 @@
+import bisect
+import re
+from collections import Counter, defaultdict
+from itertools import islice
+from app.models.models import Diagnosis
+from app.services.search_index import (
+    TextSearchIndex, SearchIndexSpec, register_search_index, normalize_text, trigrams
+)
+
+# Share of the query's trigrams a name must contain to count as a fuzzy match
+FUZZY_MATCH_THRESHOLD = 0.5
+
+_WORD_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def normalize_icd_code(value):
+    """Canonical ICD code for lookups: uppercase without dots or spaces"""
+    if not value:
+        return ''
+    return re.sub(r'[\s.]', '', value).upper()
+
+
+class DiagnosisSearchIndex(TextSearchIndex):
+    """
+    Diagnosis search over ICD codes, names and descriptions.
+
+    ICD codes are kept in a sorted list for exact and prefix hits, names use
+    the prefix + trigram index for typo-tolerant matching, and description
+    words are posted in an inverted index used as a fallback.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._codes = []
+        self._description_words = defaultdict(set)
+        self._extras = {}
+
+    def load(self, documents):
+        with self._lock:
+            self._codes = []
+            self._description_words = defaultdict(set)
+            self._extras = {}
+            documents = list(documents)
+            super().load((doc_id, name, payload) for doc_id, name, payload, _, _ in documents)
+
+            for doc_id, _, _, icd_code, description in documents:
+                code = self._index_extras(doc_id, icd_code, description)
+                if code:
+                    self._codes.append((code, doc_id))
+            self._codes.sort()
+
+    def add(self, doc_id, name, payload, icd_code=None, description=None):
+        with self._lock:
+            self._unindex_extras(doc_id)
+            super().add(doc_id, name, payload)
+            code = self._index_extras(doc_id, icd_code, description)
+            if code:
+                bisect.insort(self._codes, (code, doc_id))
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._unindex_extras(doc_id)
+            super().remove(doc_id)
+
+    def _index_extras(self, doc_id, icd_code, description):
+        code = normalize_icd_code(icd_code)
+        words = set(_WORD_PATTERN.findall(normalize_text(description)))
+        self._extras[doc_id] = (code, words)
+
+        for word in words:
+            self._description_words[word].add(doc_id)
+        return code
+
+    def _unindex_extras(self, doc_id):
+        code, words = self._extras.pop(doc_id, ('', ()))
+        if code:
+            position = bisect.bisect_left(self._codes, (code, doc_id))
+            if position < len(self._codes) and self._codes[position] == (code, doc_id):
+                del self._codes[position]
+
+        for word in words:
+            posting = self._description_words.get(word)
+            if posting is not None:
+                posting.discard(doc_id)
+                if not posting:
+                    del self._description_words[word]
+
+    def _code_matches(self, code):
+        position = bisect.bisect_left(self._codes, (code,))
+        while position < len(self._codes) and self._codes[position][0].startswith(code):
+            yield self._codes[position]
+            position += 1
+
+    def _fuzzy_name_matches(self, term):
+        """(similarity, key, doc_id) for names sharing enough of the term's trigrams"""
+        grams = trigrams(term)
+        if not grams:
+            return []
+
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._postings.get(gram, ()))
+
+        matches = []
+        for doc_id, count in shared.items():
+            similarity = count / len(grams)
+            if similarity >= FUZZY_MATCH_THRESHOLD:
+                matches.append((similarity, self._documents[doc_id][0], doc_id))
+        return matches
+
+    def _description_matches(self, term):
+        words = _WORD_PATTERN.findall(term)
+        if not words:
+            return set()
+        postings = sorted((self._description_words.get(word, set()) for word in words), key=len)
+        return set.intersection(*postings)
+
+    def ranked_ids(self, query, limit=None):
+        """
+        Doc ids matching the query, best first: exact ICD code, ICD code prefix,
+        name prefix, name substring or fuzzy (trigram similarity), description words.
+        Tiers are evaluated in order and later ones skipped once `limit` is reached.
+        """
+        term = normalize_text(query)
+        if not term:
+            return []
+
+        with self._lock:
+            ranked = []
+            seen = set()
+
+            def extend(doc_ids):
+                for doc_id in doc_ids:
+                    if doc_id not in seen:
+                        seen.add(doc_id)
+                        ranked.append(doc_id)
+                return limit is not None and len(ranked) >= limit
+
+            # Exact codes sort ahead of their own prefixes
+            code = normalize_icd_code(query)
+            if code and ' ' not in term:
+                codes = self._code_matches(code)
+                if limit is not None:
+                    codes = islice(codes, limit)
+                if extend(doc_id for _, doc_id in codes):
+                    return ranked[:limit]
+
+            if extend(self.prefix_matches(term, limit)):
+                return ranked[:limit]
+
+            if len(term) >= 3:
+                name_matches = {doc_id: (-1.0, key) for doc_id, key in self.substring_matches(term)}
+                for similarity, key, doc_id in self._fuzzy_name_matches(term):
+                    name_matches.setdefault(doc_id, (-similarity, key))
+                if extend(sorted(name_matches, key=name_matches.get)):
+                    return ranked[:limit]
+
+            description_matches = self._description_matches(term) - seen
+            extend(sorted(description_matches, key=lambda doc_id: self._documents[doc_id][0]))
+
+            return ranked if limit is None else ranked[:limit]
+
+    def search(self, query, limit=10):
+        if limit <= 0:
+            return []
+        return [self.payload(doc_id) for doc_id in self.ranked_ids(query, limit)]
+
+
+def _diagnosis_document(diagnosis):
+    payload = {"id": diagnosis.uuid, "name": diagnosis.name}
+    if diagnosis.icd_code:
+        payload["icd_code"] = diagnosis.icd_code
+    if diagnosis.category:
+        payload["category"] = diagnosis.category
+    return diagnosis.id, diagnosis.name, payload, diagnosis.icd_code, diagnosis.description
+
+
+DIAGNOSIS_INDEX = register_search_index(SearchIndexSpec(
+    'diagnosis_search_index',
+    Diagnosis,
+    _diagnosis_document,
+    (Diagnosis.id, Diagnosis.uuid, Diagnosis.name, Diagnosis.icd_code, Diagnosis.category, Diagnosis.description),
+    index_class=DiagnosisSearchIndex,
+    ttl_setting='DIAGNOSIS_SEARCH_INDEX_TTL'
+))
@@ -0,0 +1,106 @@
+from datetime import timedelta
+from sqlalchemy import func, cast, Integer
+from app.extensions import db
+from app.services.aggregates import range_bound
+from app.models.models import (
+    Appointment, Patient, Prescription, PrescriptionItem, Medicine, Diagnosis, DailyStatRollup
+)
+
+# Rows fetched per round-trip from the server-side cursor
+EXPORT_BATCH_SIZE = 1000
+
+
+def _within(column, start, end):
+    """Inclusive date range filters for an export (either bound may be None)"""
+    filters = []
+    if start:
+        filters.append(column >= range_bound(column, start))
+    if end:
+        filters.append(column < range_bound(column, end + timedelta(days=1)))
+    return filters
+
+
+def export_appointments(doctor_id, start=None, end=None):
+    headers = ['id', 'date', 'start_time', 'end_time', 'status', 'reason', 'patient_id', 'patient_name']
+    query = db.session.query(
+        Appointment.uuid, Appointment.date, Appointment.start_time, Appointment.end_time,
+        Appointment.status, Appointment.reason, Patient.uuid,
+        (Patient.first_name + ' ' + Patient.last_name)
+    ).join(
+        Patient, Patient.id == Appointment.patient_id
+    ).filter(
+        Appointment.doctor_id == doctor_id,
+        *_within(Appointment.date, start, end)
+    ).order_by(Appointment.date, Appointment.start_time, Appointment.id)
+    return headers, query
+
+
+def export_prescriptions(doctor_id, start=None, end=None):
+    headers = [
+        'id', 'issue_date', 'expiry_date', 'patient_id', 'patient_name',
+        'medicine', 'dosage', 'frequency', 'duration', 'instructions'
+    ]
+    query = db.session.query(
+        Prescription.uuid, Prescription.issue_date, Prescription.expiry_date, Patient.uuid,
+        (Patient.first_name + ' ' + Patient.last_name),
+        Medicine.name, PrescriptionItem.dosage, PrescriptionItem.frequency,
+        PrescriptionItem.duration, PrescriptionItem.instructions
+    ).join(
+        Patient, Patient.id == Prescription.patient_id
+    ).outerjoin(
+        PrescriptionItem, PrescriptionItem.prescription_id == Prescription.id
+    ).outerjoin(
+        Medicine, Medicine.id == PrescriptionItem.medicine_id
+    ).filter(
+        Prescription.doctor_id == doctor_id,
+        *_within(Prescription.issue_date, start, end)
+    ).order_by(Prescription.issue_date, Prescription.id, PrescriptionItem.id)
+    return headers, query
+
+
+def export_patients(doctor_id, start=None, end=None):
+    headers = ['id', 'first_name', 'last_name', 'date_of_birth', 'gender', 'email', 'phone', 'created_at']
+    query = db.session.query(
+        Patient.uuid, Patient.first_name, Patient.last_name, Patient.date_of_birth,
+        Patient.gender, Patient.email, Patient.phone, Patient.created_at
+    ).filter(
+        Patient.doctor_id == doctor_id,
+        *_within(Patient.created_at, start, end)
+    ).order_by(Patient.last_name, Patient.first_name, Patient.id)
+    return headers, query
+
+
+def export_diagnoses(doctor_id, start=None, end=None):
+    headers = ['diagnosis_id', 'name', 'icd_code', 'count']
+    counts = db.session.query(
+        DailyStatRollup.dimension.label('diagnosis_id'), func.sum(DailyStatRollup.count).label('count')
+    ).filter(
+        DailyStatRollup.doctor_id == doctor_id,
+        DailyStatRollup.metric == 'diagnoses',
+        *_within(DailyStatRollup.day, start, end)
+    ).group_by(DailyStatRollup.dimension).having(func.sum(DailyStatRollup.count) > 0).subquery()
+
+    query = db.session.query(
+        Diagnosis.uuid, Diagnosis.name, Diagnosis.icd_code, counts.c.count
+    ).join(
+        counts, cast(counts.c.diagnosis_id, Integer) == Diagnosis.id
+    ).order_by(counts.c.count.desc(), Diagnosis.name)
+    return headers, query
+
+
+EXPORTS = {
+    'appointments': export_appointments,
+    'prescriptions': export_prescriptions,
+    'patients': export_patients,
+    'diagnoses': export_diagnoses
+}
+
+
+def export_rows(export_type, doctor_id, start=None, end=None):
+    """
+    Build the headers and a lazily streamed row iterator for an export.
+    Rows are plain column tuples read through a server-side cursor in batches,
+    so memory stays constant regardless of how many rows are exported.
+    """
+    headers, query = EXPORTS[export_type](doctor_id, start, end)
+    return headers, query.yield_per(EXPORT_BATCH_SIZE)
@@ -0,0 +1,176 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from flask import current_app, g, has_app_context
+from flask_jwt_extended import create_access_token, get_jwt, get_jwt_identity
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import object_session
+from app.models.models import Doctor
+
+# Lightweight snapshot of the authenticated doctor. Routes only need the
+# integer id to scope their queries, so we never keep ORM rows across requests.
+CurrentDoctor = namedtuple('CurrentDoctor', ['id', 'uuid', 'active'])
+
+# Cached for UUIDs without a doctor row, so tokens of deleted doctors stay
+# rejected without a query per request until the entry expires
+REVOKED = object()
+
+
+class DoctorIdentityCache:
+    """Bounded TTL/LRU cache of doctor identities keyed by JWT identity (doctor UUID)"""
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def init_identity_cache(app):
+    """Attach a doctor identity cache to the application"""
+    app.extensions['doctor_identity_cache'] = DoctorIdentityCache(
+        maxsize=app.config.get('DOCTOR_IDENTITY_CACHE_SIZE', 1024),
+        ttl=app.config.get('DOCTOR_IDENTITY_CACHE_TTL', 300)
+    )
+
+    # g outlives the request when an app context was already pushed (CLI, tests)
+    @app.teardown_request
+    def _forget_current_doctor(exc):
+        g.pop('current_doctor', None)
+
+
+def get_identity_cache():
+    """Get the identity cache of the current application"""
+    return current_app.extensions['doctor_identity_cache']
+
+
+def snapshot_doctor(doctor):
+    """Build a CurrentDoctor snapshot from a Doctor row"""
+    return CurrentDoctor(id=doctor.id, uuid=doctor.uuid, active=doctor.active)
+
+
+def doctor_claims(doctor):
+    """Additional JWT claims describing the doctor"""
+    return {
+        "doctor_id": doctor.id,
+        "active": doctor.active
+    }
+
+
+def create_doctor_access_token(doctor):
+    """
+    Create an access token for a doctor.
+    When JWT_EMBED_DOCTOR_CLAIMS is enabled the doctor's id and active flag
+    are signed into the token. The doctor row was just read, so it also
+    primes the identity cache.
+    """
+    get_identity_cache().set(doctor.uuid, snapshot_doctor(doctor))
+    
+    additional_claims = None
+    if current_app.config.get('JWT_EMBED_DOCTOR_CLAIMS', True):
+        additional_claims = doctor_claims(doctor)
+
+    return create_access_token(identity=doctor.uuid, additional_claims=additional_claims)
+
+
+def _claims_allow(doctor):
+    """Signed claims can only narrow access: tokens of an inactive or another doctor are rejected"""
+    if not current_app.config.get('JWT_EMBED_DOCTOR_CLAIMS', True):
+        return True
+
+    claims = get_jwt()
+    if claims.get('active') is False:
+        return False
+    return claims.get('doctor_id', doctor.id) == doctor.id
+
+
+def _lookup_doctor(doctor_uuid):
+    """Current state of a doctor from the identity cache, or the database on a miss"""
+    cache = get_identity_cache()
+    doctor = cache.get(doctor_uuid)
+
+    if doctor is None:
+        row = Doctor.query.filter_by(uuid=doctor_uuid).first()
+        doctor = snapshot_doctor(row) if row else REVOKED
+        cache.set(doctor_uuid, doctor)
+
+    return None if doctor is REVOKED else doctor
+
+
+def get_current_doctor():
+    """
+    Resolve the doctor behind the current JWT.
+    The doctors table is the source of truth: it is read on an identity cache
+    miss, so deletions and deactivations made by any process are seen within
+    DOCTOR_IDENTITY_CACHE_TTL. Deleted and inactive doctors resolve to None.
+    The result is memoized on flask.g for the request.
+    """
+    if 'current_doctor' in g:
+        return g.current_doctor
+
+    doctor = _lookup_doctor(get_jwt_identity())
+    if doctor is not None and (not doctor.active or not _claims_allow(doctor)):
+        doctor = None
+
+    g.current_doctor = doctor
+    return doctor
+
+
+def invalidate_doctor(doctor_uuid):
+    """Drop a doctor from the identity cache so the next request reads the database"""
+    if not has_app_context() or 'doctor_identity_cache' not in current_app.extensions:
+        return
+
+    get_identity_cache().invalidate(doctor_uuid)
+
+
+@event.listens_for(Doctor, 'after_insert')
+@event.listens_for(Doctor, 'after_update')
+def _doctor_updated(mapper, connection, target):
+    # Covers profile updates, deactivation and UUID changes alike; rows merged
+    # back unchanged are flushed too and keep their cache entry
+    if not object_session(target).is_modified(target, include_collections=False):
+        return
+
+    invalidate_doctor(target.uuid)
+
+    for old_uuid in inspect(target).attrs.uuid.history.deleted or ():
+        invalidate_doctor(old_uuid)
+
+
+@event.listens_for(Doctor, 'after_delete')
+def _doctor_deleted(mapper, connection, target):
+    invalidate_doctor(target.uuid)
@@ -0,0 +1,180 @@
+import html
+import logging
+import re
+from sqlalchemy import DDL, event, func, literal_column, or_, false, table, column, text
+from app.extensions import db
+from app.models.models import Note
+
+logger = logging.getLogger(__name__)
+
+# Text search configuration used by the PostgreSQL backend
+POSTGRES_TEXT_SEARCH_CONFIG = 'english'
+
+SNIPPET_START = '<mark>'
+SNIPPET_END = '</mark>'
+SNIPPET_ELLIPSIS = '…'
+SNIPPET_WORDS = 12
+
+# The database highlights matches with private-use characters, so the note
+# text can be HTML-escaped before they are turned into SNIPPET_START/END
+_MATCH_START = '\ue000'
+_MATCH_END = '\ue001'
+
+_WORD_PATTERN = re.compile(r'[^\W_]+')
+
+# SQLite: external-content FTS5 table over notes, kept in sync by triggers
+notes_fts = table('notes_fts', column('rowid'), column('title'), column('content'))
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5("
+    "title, content, content='notes', content_rowid='id', tokenize='porter unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS notes_fts_insert AFTER INSERT ON notes BEGIN "
+    "INSERT INTO notes_fts(rowid, title, content) VALUES (new.id, new.title, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS notes_fts_delete AFTER DELETE ON notes BEGIN "
+    "INSERT INTO notes_fts(notes_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS notes_fts_update AFTER UPDATE OF title, content ON notes BEGIN "
+    "INSERT INTO notes_fts(notes_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content); "
+    "INSERT INTO notes_fts(rowid, title, content) VALUES (new.id, new.title, new.content); END"
+]
+
+# PostgreSQL: GIN expression index over the note's tsvector, maintained by the database
+POSTGRES_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_notes_search ON notes USING GIN "
+    f"(to_tsvector('{POSTGRES_TEXT_SEARCH_CONFIG}', coalesce(title, '') || ' ' || content))"
+]
+
+for _statement in SQLITE_DDL:
+    event.listen(Note.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+event.listen(Note.__table__, 'before_drop', DDL('DROP TABLE IF EXISTS notes_fts').execute_if(dialect='sqlite'))
+
+for _statement in POSTGRES_DDL:
+    event.listen(Note.__table__, 'after_create', DDL(_statement).execute_if(dialect='postgresql'))
+
+
+def render_snippet(snippet):
+    """HTML-escape a snippet from the database and mark its highlighted matches"""
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(_MATCH_START, SNIPPET_START).replace(_MATCH_END, SNIPPET_END)
+
+
+def search_words(search):
+    """Words of a search string, lowercased"""
+    return _WORD_PATTERN.findall(search.lower())
+
+
+class NoteSearchBackend:
+    """
+    Full-text search over note titles and content.
+    `apply` filters a Note query to the matches, orders it by relevance and
+    adds a snippet column with matches between _MATCH_START and _MATCH_END;
+    pass it through render_snippet before returning it.
+    """
+
+    def apply(self, query, search):
+        raise NotImplementedError
+
+    def rebuild(self, connection):
+        """Create any missing search structures and reindex existing notes"""
+
+
+class SQLiteNoteSearch(NoteSearchBackend):
+    """FTS5 with bm25 ranking and snippet()"""
+
+    @staticmethod
+    def match_expression(search):
+        # Quote every word so user input can't inject FTS syntax; the last word
+        # is a prefix so results follow the user while they type
+        words = search_words(search)
+        if not words:
+            return None
+        terms = [f'"{word}"' for word in words]
+        terms[-1] += '*'
+        return ' '.join(terms)
+
+    def apply(self, query, search):
+        expression = self.match_expression(search)
+        if expression is None:
+            return query.filter(false()).add_columns(literal_column("''"))
+
+        fts = literal_column('notes_fts')
+        snippet = func.snippet(fts, 1, _MATCH_START, _MATCH_END, SNIPPET_ELLIPSIS, SNIPPET_WORDS)
+
+        return query.join(
+            notes_fts, notes_fts.c.rowid == Note.id
+        ).filter(
+            fts.op('MATCH')(expression)
+        ).add_columns(
+            snippet.label('snippet')
+        ).order_by(func.bm25(fts), Note.created_at.desc())
+
+    def rebuild(self, connection):
+        for statement in SQLITE_DDL:
+            connection.execute(text(statement))
+        connection.execute(text("INSERT INTO notes_fts(notes_fts) VALUES ('rebuild')"))
+
+
+class PostgresNoteSearch(NoteSearchBackend):
+    """tsvector/tsquery with ts_rank ranking and ts_headline()"""
+
+    def apply(self, query, search):
+        if not search_words(search):
+            return query.filter(false()).add_columns(literal_column("''"))
+
+        config = literal_column(f"'{POSTGRES_TEXT_SEARCH_CONFIG}'::regconfig")
+        document = func.to_tsvector(config, func.coalesce(Note.title, '') + ' ' + Note.content)
+        tsquery = func.websearch_to_tsquery(config, search)
+        headline = func.ts_headline(
+            config, Note.content, tsquery,
+            f'StartSel="{_MATCH_START}", StopSel="{_MATCH_END}", FragmentDelimiter={SNIPPET_ELLIPSIS}, '
+            f'MaxWords={SNIPPET_WORDS}, MinWords=3, MaxFragments=2'
+        )
+
+        return query.filter(
+            document.op('@@')(tsquery)
+        ).add_columns(
+            headline.label('snippet')
+        ).order_by(func.ts_rank(document, tsquery).desc(), Note.created_at.desc())
+
+    def rebuild(self, connection):
+        # The expression index is maintained by PostgreSQL itself
+        for statement in POSTGRES_DDL:
+            connection.execute(text(statement))
+
+
+class LikeNoteSearch(NoteSearchBackend):
+    """Fallback for other databases: ILIKE on every word, newest first"""
+
+    def apply(self, query, search):
+        words = search_words(search)
+        if not words:
+            return query.filter(false()).add_columns(literal_column("''"))
+
+        for word in words:
+            query = query.filter(or_(Note.title.ilike(f'%{word}%'), Note.content.ilike(f'%{word}%')))
+        return query.add_columns(Note.content.label('snippet')).order_by(Note.created_at.desc())
+
+
+NOTE_SEARCH_BACKENDS = {
+    'sqlite': SQLiteNoteSearch(),
+    'postgresql': PostgresNoteSearch()
+}
+
+
+def get_note_search_backend(dialect_name=None):
+    """Search backend for the current database"""
+    if dialect_name is None:
+        dialect_name = db.engine.dialect.name
+    return NOTE_SEARCH_BACKENDS.get(dialect_name, LikeNoteSearch())
+
+
+def search_notes(query, search):
+    """Restrict a Note query to full-text matches, ranked, with a raw snippet column"""
+    return get_note_search_backend().apply(query, search)
+
+
+def rebuild_note_search_index():
+    """Create the note search structures if missing and reindex all notes"""
+    with db.engine.begin() as connection:
+        get_note_search_backend(connection.dialect.name).rebuild(connection)
+    logger.info("Rebuilt note search index")
@@ -0,0 +1,313 @@
+import hashlib
+import logging
+import random
+import struct
+import time
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import event, inspect, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from app.extensions import db
+from app.models.models import Patient, PatientDiagnosis, PatientLSHBucket, PatientSignature
+
+logger = logging.getLogger(__name__)
+
+# Signature length and banding. 16 bands of 4 rows make a pair with Jaccard
+# similarity 0.5 a candidate with ~64% probability and one at 0.8 with ~99.9%.
+# Changing any of these requires `flask patients rebuild-similarity-index`.
+NUM_PERMUTATIONS = 64
+NUM_BANDS = 16
+ROWS_PER_BAND = NUM_PERMUTATIONS // NUM_BANDS
+HASH_SEED = 20240501
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_random = random.Random(HASH_SEED)
+# Universal hash family h(x) = (a * x + b) mod p, fixed so signatures are stable across processes
+_HASH_COEFFICIENTS = [
+    (_random.randrange(1, _MERSENNE_PRIME), _random.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERMUTATIONS)
+]
+
+
+def minhash(diagnosis_ids):
+    """MinHash signature of a set of diagnosis ids (None for an empty set)"""
+    if not diagnosis_ids:
+        return None
+    return [
+        min((a * diagnosis_id + b) % _MERSENNE_PRIME for diagnosis_id in diagnosis_ids)
+        for a, b in _HASH_COEFFICIENTS
+    ]
+
+
+def band_buckets(signature):
+    """(band, bucket) keys of a signature: a 63-bit hash of each band's rows"""
+    buckets = []
+    for band in range(NUM_BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(struct.pack(f'>{len(rows)}Q', *rows), digest_size=8).digest()
+        buckets.append((band, int.from_bytes(digest, 'big') >> 1))
+    return buckets
+
+
+def estimated_jaccard(signature, other):
+    """Share of equal signature rows, an unbiased estimate of the Jaccard similarity"""
+    return sum(1 for a, b in zip(signature, other) if a == b) / len(signature)
+
+
+def encode_signature(signature):
+    return ','.join(map(str, signature))
+
+
+def decode_signature(text):
+    return [int(value) for value in text.split(',')]
+
+
+def _index_rows(patient_id, doctor_id, diagnosis_ids):
+    signature = minhash(diagnosis_ids)
+    if signature is None:
+        return None, []
+    return (
+        dict(patient_id=patient_id, doctor_id=doctor_id, signature=encode_signature(signature),
+             updated_at=datetime.utcnow()),
+        [dict(band=band, bucket=bucket, doctor_id=doctor_id, patient_id=patient_id)
+         for band, bucket in band_buckets(signature)]
+    )
+
+
+def _upsert(connection, table, rows, update_columns):
+    """Insert rows, overwriting those whose primary key exists (e.g. written by a concurrent transaction)"""
+    dialect_name = connection.dialect.name
+    if dialect_name in ('sqlite', 'postgresql'):
+        insert = sqlite_insert if dialect_name == 'sqlite' else postgresql_insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[column.name for column in table.primary_key.columns],
+            set_={column: stmt.excluded[column] for column in update_columns}
+        )
+        connection.execute(stmt, rows)
+    else:
+        for row in rows:
+            key = [table.c[column.name] == row[column.name] for column in table.primary_key.columns]
+            if connection.execute(table.update().where(*key).values(
+                {column: row[column] for column in update_columns}
+            )).rowcount == 0:
+                connection.execute(table.insert().values(row))
+
+
+def reindex_patients(connection, patient_ids):
+    """
+    Recompute the signatures and buckets of some patients from their current
+    diagnoses. Rows are upserted, so concurrent reindexing of the same patient
+    doesn't fail the caller's write.
+    """
+    patient_ids = list(patient_ids)
+    if not patient_ids:
+        return
+
+    doctors = {}
+    diagnoses = defaultdict(set)
+    rows = connection.execute(
+        select(Patient.id, Patient.doctor_id, PatientDiagnosis.diagnosis_id).outerjoin(
+            PatientDiagnosis, PatientDiagnosis.patient_id == Patient.id
+        ).where(Patient.id.in_(patient_ids))
+    )
+    for patient_id, doctor_id, diagnosis_id in rows:
+        doctors[patient_id] = doctor_id
+        if diagnosis_id is not None:
+            diagnoses[patient_id].add(diagnosis_id)
+
+    signatures = []
+    buckets = []
+    for patient_id, doctor_id in doctors.items():
+        signature, patient_buckets = _index_rows(patient_id, doctor_id, diagnoses[patient_id])
+        if signature is not None:
+            signatures.append(signature)
+            buckets.extend(patient_buckets)
+
+    # Patients left without diagnoses (or gone) drop out of the index
+    indexed = {signature['patient_id'] for signature in signatures}
+    unindexed = [patient_id for patient_id in patient_ids if patient_id not in indexed]
+    if unindexed:
+        _delete_patients(connection, unindexed)
+
+    if signatures:
+        _upsert(connection, PatientSignature.__table__, signatures, ['doctor_id', 'signature', 'updated_at'])
+        _upsert(connection, PatientLSHBucket.__table__, buckets, ['bucket', 'doctor_id'])
+
+
+def _delete_patients(connection, patient_ids):
+    connection.execute(PatientLSHBucket.__table__.delete().where(PatientLSHBucket.patient_id.in_(patient_ids)))
+    connection.execute(PatientSignature.__table__.delete().where(PatientSignature.patient_id.in_(patient_ids)))
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_patient_signatures(session, flush_context):
+    changed = set()
+    deleted = set()
+
+    for obj in session.new:
+        if isinstance(obj, PatientDiagnosis):
+            changed.add(obj.patient_id)
+
+    for obj in session.dirty:
+        if isinstance(obj, PatientDiagnosis):
+            state = inspect(obj)
+            if state.attrs.patient_id.history.has_changes() or state.attrs.diagnosis_id.history.has_changes():
+                changed.add(obj.patient_id)
+                changed.update(state.attrs.patient_id.history.deleted or ())
+        elif isinstance(obj, Patient) and inspect(obj).attrs.doctor_id.history.has_changes():
+            changed.add(obj.id)
+
+    for obj in session.deleted:
+        if isinstance(obj, Patient):
+            deleted.add(obj.id)
+        elif isinstance(obj, PatientDiagnosis):
+            changed.add(obj.patient_id)
+
+    changed -= deleted
+    changed.discard(None)
+    if not changed and not deleted:
+        return
+
+    connection = session.connection()
+    if deleted:
+        _delete_patients(connection, list(deleted))
+    reindex_patients(connection, changed)
+
+
+def rebuild_patient_signatures(doctor_id=None, batch_size=1000):
+    """
+    Recompute every MinHash signature and LSH bucket offline (backfill / repair).
+    Returns the number of patients indexed.
+    """
+    signature_delete = PatientSignature.query
+    bucket_delete = PatientLSHBucket.query
+    query = db.session.query(PatientDiagnosis.patient_id, Patient.doctor_id, PatientDiagnosis.diagnosis_id).join(
+        Patient, Patient.id == PatientDiagnosis.patient_id
+    ).order_by(PatientDiagnosis.patient_id)
+    if doctor_id is not None:
+        signature_delete = signature_delete.filter_by(doctor_id=doctor_id)
+        bucket_delete = bucket_delete.filter_by(doctor_id=doctor_id)
+        query = query.filter(Patient.doctor_id == doctor_id)
+    bucket_delete.delete(synchronize_session=False)
+    signature_delete.delete(synchronize_session=False)
+
+    indexed = 0
+    signatures = []
+    buckets = []
+
+    def write():
+        db.session.execute(PatientSignature.__table__.insert(), signatures)
+        db.session.execute(PatientLSHBucket.__table__.insert(), buckets)
+        signatures.clear()
+        buckets.clear()
+
+    def add(patient_id, patient_doctor_id, diagnosis_ids):
+        signature, patient_buckets = _index_rows(patient_id, patient_doctor_id, diagnosis_ids)
+        signatures.append(signature)
+        buckets.extend(patient_buckets)
+        if len(signatures) >= batch_size:
+            write()
+
+    current = None
+    for patient_id, patient_doctor_id, diagnosis_id in query.yield_per(batch_size):
+        if current is None or current[0] != patient_id:
+            if current is not None:
+                add(*current)
+                indexed += 1
+            current = (patient_id, patient_doctor_id, set())
+        current[2].add(diagnosis_id)
+
+    if current is not None:
+        add(*current)
+        indexed += 1
+    if signatures:
+        write()
+
+    db.session.commit()
+    logger.info(f"Rebuilt MinHash signatures of {indexed} patients")
+    return indexed
+
+
+def approximate_similar_patients(patient_id, doctor_id=None, limit=5):
+    """
+    Approximate top `limit` patients by Jaccard similarity of their diagnoses
+    as (patient_id, estimated similarity), best first.
+
+    Candidates are the patients sharing at least one LSH bucket with the
+    patient (an index lookup per band, independent of the number of
+    patients) and are ranked by their estimated similarity. Pass doctor_id
+    to stay within one doctor's patients or None to search the whole network.
+    """
+    own = db.session.get(PatientSignature, patient_id)
+    if own is None:
+        return []
+
+    signature = decode_signature(own.signature)
+    query = db.session.query(PatientSignature.patient_id, PatientSignature.signature).filter(
+        PatientSignature.patient_id.in_(
+            select(PatientLSHBucket.patient_id).where(
+                tuple_(PatientLSHBucket.band, PatientLSHBucket.bucket).in_(band_buckets(signature)),
+                *([PatientLSHBucket.doctor_id == doctor_id] if doctor_id is not None else [])
+            )
+        ),
+        PatientSignature.patient_id != patient_id
+    )
+
+    scored = [
+        (estimated_jaccard(signature, decode_signature(other_signature)), other_id)
+        for other_id, other_signature in query
+    ]
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    return [(other_id, score) for score, other_id in scored[:limit]]
+
+
+def benchmark_lsh(doctor_id, samples=100, limit=10, seed=0):
+    """
+    Recall and latency of approximate lookups against exact Jaccard top-k for
+    a sample of the doctor's patients. A result counts as recalled when its
+    exact similarity reaches the k-th best exact score, so ties don't matter.
+    """
+    from app.services.patient_similarity import get_patient_similarity
+
+    engine = get_patient_similarity()
+    engine.invalidate(doctor_id)
+    matrix = engine.matrix(doctor_id)
+
+    patient_ids = sorted(db.session.execute(
+        select(PatientSignature.patient_id).where(PatientSignature.doctor_id == doctor_id)
+    ).scalars())
+    sample = random.Random(seed).sample(patient_ids, min(samples, len(patient_ids)))
+
+    exact_seconds = 0.0
+    approximate_seconds = 0.0
+    recalled = 0
+    relevant_total = 0
+
+    for patient_id in sample:
+        started = time.perf_counter()
+        exact = matrix.similar(patient_id, limit, 'jaccard')
+        exact_seconds += time.perf_counter() - started
+
+        started = time.perf_counter()
+        approximate = approximate_similar_patients(patient_id, doctor_id, limit)
+        approximate_seconds += time.perf_counter() - started
+
+        if not exact:
+            continue
+        threshold = exact[-1][1]
+        exact_scores = {other: score for other, score, _ in matrix.similar(patient_id, len(matrix), 'jaccard')}
+        recalled += sum(1 for other, _ in approximate if exact_scores.get(other, 0) >= threshold)
+        relevant_total += len(exact)
+
+    count = max(len(sample), 1)
+    return {
+        "patients": len(patient_ids),
+        "samples": len(sample),
+        "limit": limit,
+        "recall": recalled / relevant_total if relevant_total else 1.0,
+        "exact_ms": exact_seconds * 1000 / count,
+        "approximate_ms": approximate_seconds * 1000 / count
+    }
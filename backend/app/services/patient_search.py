@@ -0,0 +1,165 @@
+import logging
+import re
+from sqlalchemy import event, inspect, select, and_, or_
+from sqlalchemy.orm import Session
+from app.extensions import db
+from app.models.models import Patient, PatientSearchToken
+from app.services.search_index import normalize_text
+from app.services.utils import normalize_phone_digits
+
+logger = logging.getLogger(__name__)
+
+# Patient attributes the search tokens are derived from
+SEARCH_ATTRIBUTES = ('doctor_id', 'first_name', 'last_name', 'phone', 'email', 'date_of_birth')
+
+# Shortest digit run treated as a phone number prefix
+MIN_PHONE_DIGITS = 3
+
+_WORD_PATTERN = re.compile(r'[^\W_]+')
+_DOB_PATTERN = re.compile(r'^\d{4}(-\d{1,2}(-\d{1,2})?)?$')
+
+
+def patient_tokens(patient):
+    """(kind, token) search keys for a patient"""
+    tokens = set()
+
+    for name in (patient.first_name, patient.last_name):
+        for word in _WORD_PATTERN.findall(normalize_text(name)):
+            tokens.add(('name', word))
+
+    digits = normalize_phone_digits(patient.phone)
+    if digits:
+        tokens.add(('phone', digits))
+        # Also match US numbers typed without their country code
+        if len(digits) == 11 and digits[0] == '1':
+            tokens.add(('phone', digits[1:]))
+
+    if patient.date_of_birth:
+        tokens.add(('dob', patient.date_of_birth.isoformat()))
+
+    if patient.email:
+        tokens.add(('email', patient.email.strip().lower()))
+
+    return tokens
+
+
+def _token_rows(patient):
+    return [
+        dict(doctor_id=patient.doctor_id, patient_id=patient.id, kind=kind, token=token[:120])
+        for kind, token in patient_tokens(patient)
+    ]
+
+
+def _prefix_range(column, prefix):
+    """Index-friendly prefix match: prefix <= column < next string after prefix"""
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return and_(column >= prefix, column < upper)
+
+
+def _matching_patients(doctor_id, kinds, prefix):
+    return select(PatientSearchToken.patient_id).where(
+        PatientSearchToken.doctor_id == doctor_id,
+        PatientSearchToken.kind.in_(kinds),
+        _prefix_range(PatientSearchToken.token, prefix)
+    )
+
+
+def _dob_prefix(query):
+    """Zero-pad a partial YYYY-MM-DD query ("1980-4" -> "1980-04")"""
+    parts = query.split('-')
+    return '-'.join([parts[0]] + [part.zfill(2) for part in parts[1:] if part])
+
+
+def patient_search_filter(doctor_id, query, include_email=False):
+    """
+    SQL condition selecting a doctor's patients matching a search query.
+
+    Every word of the query must prefix-match one of the patient's name tokens
+    (or email); digit runs prefix-match the digits-only phone and date-like
+    queries prefix-match the date of birth. All lookups are range scans on
+    the (doctor_id, kind, token) index. Returns None for an empty query.
+    """
+    query = query.strip()
+    conditions = []
+
+    words = [word for word in _WORD_PATTERN.findall(normalize_text(query)) if not word.isdigit()]
+    if words:
+        kinds = ('name', 'email') if include_email else ('name',)
+        conditions.append(and_(*[
+            Patient.id.in_(_matching_patients(doctor_id, kinds, word)) for word in words
+        ]))
+
+    if include_email and '@' in query:
+        conditions.append(Patient.id.in_(_matching_patients(doctor_id, ('email',), query.lower())))
+
+    if not words:
+        if _DOB_PATTERN.match(query):
+            conditions.append(Patient.id.in_(_matching_patients(doctor_id, ('dob',), _dob_prefix(query))))
+
+        digits = normalize_phone_digits(query)
+        if digits and len(digits) >= MIN_PHONE_DIGITS:
+            conditions.append(Patient.id.in_(_matching_patients(doctor_id, ('phone',), digits)))
+
+    if not conditions:
+        return None
+    return or_(*conditions)
+
+
+def _search_fields_changed(patient):
+    state = inspect(patient)
+    return any(state.attrs[attr].history.has_changes() for attr in SEARCH_ATTRIBUTES)
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_patient_search_tokens(session, flush_context):
+    changed = [
+        obj for obj in session.new.union(session.dirty)
+        if isinstance(obj, Patient) and (obj in session.new or _search_fields_changed(obj))
+    ]
+    deleted = [obj.id for obj in session.deleted if isinstance(obj, Patient)]
+
+    if not changed and not deleted:
+        return
+
+    connection = session.connection()
+    table = PatientSearchToken.__table__
+
+    stale = deleted + [patient.id for patient in changed if patient not in session.new]
+    if stale:
+        connection.execute(table.delete().where(table.c.patient_id.in_(stale)))
+
+    rows = [row for patient in changed for row in _token_rows(patient)]
+    if rows:
+        connection.execute(table.insert(), rows)
+
+
+def rebuild_patient_search_tokens(doctor_id=None, batch_size=1000):
+    """
+    Recompute the patient search tokens (backfill / repair).
+    Returns the number of token rows written.
+    """
+    delete_query = PatientSearchToken.query
+    query = Patient.query.order_by(Patient.id)
+    if doctor_id is not None:
+        delete_query = delete_query.filter_by(doctor_id=doctor_id)
+        query = query.filter_by(doctor_id=doctor_id)
+    delete_query.delete(synchronize_session=False)
+
+    table = PatientSearchToken.__table__
+    written = 0
+    batch = []
+
+    for patient in query.yield_per(batch_size):
+        batch.extend(_token_rows(patient))
+        if len(batch) >= batch_size:
+            db.session.execute(table.insert(), batch)
+            written += len(batch)
+            batch = []
+
+    if batch:
+        db.session.execute(table.insert(), batch)
+        written += len(batch)
+
+    db.session.commit()
+    logger.info(f"Rebuilt {written} patient search tokens")
+    return written
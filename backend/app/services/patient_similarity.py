@@ -0,0 +1,266 @@
+import heapq
+import math
+import threading
+import time
+from collections import defaultdict
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from app.extensions import db
+from app.models.models import Patient, PatientDiagnosis
+
+SIMILARITY_METRICS = ('cosine', 'jaccard')
+
+
+class PatientDiagnosisMatrix:
+    """
+    Sparse binary patient x diagnosis matrix of one doctor, stored both by
+    row (patient -> diagnoses) and by column (diagnosis -> patients).
+
+    Scoring a patient is a sparse matrix-vector product: only the columns of
+    the patient's own diagnoses are visited, so the cost depends on how many
+    patients share a diagnosis with them rather than on the panel size.
+    Diagnoses are weighted by inverse document frequency, so sharing a rare
+    diagnosis counts more than sharing a common one.
+    """
+
+    def __init__(self, links=()):
+        self._rows = defaultdict(dict)  # patient_id -> {diagnosis_id: number of links}
+        self._columns = defaultdict(set)  # diagnosis_id -> patient_ids
+        self._norms = None
+        for patient_id, diagnosis_id in links:
+            self.add(patient_id, diagnosis_id)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, patient_id, diagnosis_id):
+        row = self._rows[patient_id]
+        row[diagnosis_id] = row.get(diagnosis_id, 0) + 1
+        self._columns[diagnosis_id].add(patient_id)
+        self._norms = None
+
+    def remove(self, patient_id, diagnosis_id):
+        row = self._rows.get(patient_id)
+        if not row or diagnosis_id not in row:
+            return
+
+        row[diagnosis_id] -= 1
+        if row[diagnosis_id] <= 0:
+            del row[diagnosis_id]
+            self._columns[diagnosis_id].discard(patient_id)
+            if not self._columns[diagnosis_id]:
+                del self._columns[diagnosis_id]
+        if not row:
+            del self._rows[patient_id]
+        self._norms = None
+
+    def remove_patient(self, patient_id):
+        for diagnosis_id in list(self._rows.get(patient_id, ())):
+            self._columns[diagnosis_id].discard(patient_id)
+            if not self._columns[diagnosis_id]:
+                del self._columns[diagnosis_id]
+        if self._rows.pop(patient_id, None) is not None:
+            self._norms = None
+
+    def idf(self, diagnosis_id):
+        """Smoothed inverse document frequency of a diagnosis"""
+        return math.log((1 + len(self._rows)) / (1 + len(self._columns.get(diagnosis_id, ())))) + 1
+
+    def _row_norms(self):
+        # Weights depend on every document frequency, so norms are recomputed
+        # in one pass after a change rather than patched per patient
+        if self._norms is None:
+            weights = {diagnosis_id: self.idf(diagnosis_id) ** 2 for diagnosis_id in self._columns}
+            self._norms = {
+                patient_id: math.sqrt(sum(weights[diagnosis_id] for diagnosis_id in row))
+                for patient_id, row in self._rows.items()
+            }
+        return self._norms
+
+    def similar(self, patient_id, limit=5, metric='cosine'):
+        """Top `limit` other patients as (patient_id, score, shared diagnoses), best first"""
+        row = self._rows.get(patient_id)
+        if not row:
+            return []
+
+        shared = defaultdict(int)
+        dot = defaultdict(float)
+        for diagnosis_id in row:
+            weight = self.idf(diagnosis_id) ** 2
+            for other in self._columns[diagnosis_id]:
+                shared[other] += 1
+                dot[other] += weight
+        shared.pop(patient_id, None)
+
+        if metric == 'jaccard':
+            size = len(row)
+            scores = ((count / (size + len(self._rows[other]) - count), other) for other, count in shared.items())
+        else:
+            norms = self._row_norms()
+            norm = norms[patient_id]
+            scores = ((dot[other] / (norm * norms[other]), other) for other in shared)
+
+        top = heapq.nlargest(limit, scores, key=lambda item: (item[0], -item[1]))
+        return [(other, score, shared[other]) for score, other in top]
+
+
+class PatientSimilarityEngine:
+    """
+    Per-doctor diagnosis matrices, loaded on first use and kept current on
+    commit. Commits of other processes, raw SQL and bulk query deletes aren't
+    seen here, so a matrix is also reloaded once it is older than `ttl` seconds.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._matrices = {}
+        self._loaded_at = {}
+        self._doctor_of_patient = {}
+        self._changes = 0
+        self._lock = threading.RLock()
+
+    def matrix(self, doctor_id):
+        # The panel queries run outside the lock; an expired matrix keeps
+        # serving other requests until its replacement is swapped in
+        with self._lock:
+            matrix = self._matrices.get(doctor_id)
+            loaded_at = self._loaded_at.get(doctor_id)
+            if matrix is not None and loaded_at + self.ttl >= time.monotonic():
+                return matrix
+            if matrix is not None:
+                self._loaded_at[doctor_id] = time.monotonic()
+            changes = self._changes
+
+        patient_ids, fresh = self._load(doctor_id)
+
+        with self._lock:
+            if self._changes != changes:
+                # Commits were applied while loading and may be missing from the
+                # snapshot: answer from it, but keep the old matrix (or publish
+                # this one already expired) so the next request reloads
+                if matrix is not None:
+                    self._loaded_at[doctor_id] = loaded_at
+                    return fresh
+                self._loaded_at[doctor_id] = float('-inf')
+            else:
+                self._loaded_at[doctor_id] = time.monotonic()
+
+            self._matrices[doctor_id] = fresh
+            self._doctor_of_patient = {
+                patient: doctor for patient, doctor in self._doctor_of_patient.items() if doctor != doctor_id
+            }
+            self._doctor_of_patient.update(dict.fromkeys(patient_ids, doctor_id))
+            return fresh
+
+    def _load(self, doctor_id):
+        patient_ids = db.session.execute(select(Patient.id).where(Patient.doctor_id == doctor_id)).scalars().all()
+        links = db.session.execute(
+            select(PatientDiagnosis.patient_id, PatientDiagnosis.diagnosis_id).join(
+                Patient, Patient.id == PatientDiagnosis.patient_id
+            ).where(Patient.doctor_id == doctor_id)
+        ).all()
+        return patient_ids, PatientDiagnosisMatrix(links)
+
+    def similar(self, doctor_id, patient_id, limit=5, metric='cosine'):
+        matrix = self.matrix(doctor_id)
+        with self._lock:
+            return matrix.similar(patient_id, limit, metric)
+
+    def invalidate(self, doctor_id=None):
+        """Drop loaded matrices so they are rebuilt from the database on next use"""
+        with self._lock:
+            self._changes += 1
+            doctors = list(self._matrices) if doctor_id is None else [doctor_id]
+            for doctor in doctors:
+                self._matrices.pop(doctor, None)
+                self._loaded_at.pop(doctor, None)
+            self._doctor_of_patient = {
+                patient: doctor for patient, doctor in self._doctor_of_patient.items()
+                if doctor in self._matrices
+            }
+
+    def apply(self, changes):
+        """Apply committed (operation, patient_id, value) changes to the loaded matrices"""
+        with self._lock:
+            self._changes += 1
+            for operation, patient_id, value in changes:
+                if operation == 'patient':
+                    previous = self._doctor_of_patient.get(patient_id)
+                    if previous is not None and previous != value:
+                        # Moved to another doctor: reload both panels
+                        self.invalidate(previous)
+                        self.invalidate(value)
+                    elif value in self._matrices:
+                        self._doctor_of_patient[patient_id] = value
+                    continue
+
+                matrix = self._matrices.get(self._doctor_of_patient.get(patient_id))
+                if operation == 'drop_patient':
+                    if matrix is not None:
+                        matrix.remove_patient(patient_id)
+                    self._doctor_of_patient.pop(patient_id, None)
+                elif matrix is not None:
+                    if operation == 'add':
+                        matrix.add(patient_id, value)
+                    else:
+                        matrix.remove(patient_id, value)
+
+
+def init_patient_similarity(app):
+    """Attach the similar-patient engine to the application"""
+    app.extensions['patient_similarity'] = PatientSimilarityEngine(
+        ttl=app.config.get('PATIENT_SIMILARITY_TTL', 300)
+    )
+
+
+def get_patient_similarity():
+    """Get the similar-patient engine of the current application"""
+    return current_app.extensions['patient_similarity']
+
+
+def _previous(obj, attr):
+    history = inspect(obj).attrs[attr].history
+    return history.deleted[0] if history.deleted else getattr(obj, attr)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_similarity_changes(session, flush_context):
+    changes = []
+
+    for obj in session.new:
+        if isinstance(obj, Patient):
+            changes.append(('patient', obj.id, obj.doctor_id))
+        elif isinstance(obj, PatientDiagnosis):
+            changes.append(('add', obj.patient_id, obj.diagnosis_id))
+
+    for obj in session.dirty:
+        if isinstance(obj, Patient) and inspect(obj).attrs.doctor_id.history.has_changes():
+            changes.append(('patient', obj.id, obj.doctor_id))
+        elif isinstance(obj, PatientDiagnosis) and any(
+            inspect(obj).attrs[attr].history.has_changes() for attr in ('patient_id', 'diagnosis_id')
+        ):
+            changes.append(('remove', _previous(obj, 'patient_id'), _previous(obj, 'diagnosis_id')))
+            changes.append(('add', obj.patient_id, obj.diagnosis_id))
+
+    for obj in session.deleted:
+        if isinstance(obj, Patient):
+            changes.append(('drop_patient', obj.id, None))
+        elif isinstance(obj, PatientDiagnosis):
+            changes.append(('remove', _previous(obj, 'patient_id'), _previous(obj, 'diagnosis_id')))
+
+    if changes:
+        session.info.setdefault('patient_similarity_changes', []).extend(changes)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_similarity_changes(session):
+    # Matrices only see committed diagnoses
+    changes = session.info.pop('patient_similarity_changes', None)
+    if changes and has_app_context() and 'patient_similarity' in current_app.extensions:
+        get_patient_similarity().apply(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_similarity_changes(session):
+    session.info.pop('patient_similarity_changes', None)
@@ -0,0 +1,28 @@
+from sqlalchemy.orm import joinedload, selectinload
+from app.models.models import Prescription, PrescriptionItem, PatientDiagnosis
+
+
+def load_prescriptions(query, items=True, diagnoses=True, medicines=True):
+    """
+    Eager-load everything the prescription endpoints serialize.
+
+    Patients and appointments are joined into the main query, while items
+    (with their medicines) and linked diagnoses are fetched with one IN-batched
+    query each, so a page of prescriptions costs a fixed number of queries
+    regardless of its size. Pass medicines=False when only the items
+    themselves are used (e.g. to count them).
+    """
+    options = [
+        joinedload(Prescription.patient),
+        joinedload(Prescription.appointment)
+    ]
+
+    if items and medicines:
+        options.append(selectinload(Prescription.items).joinedload(PrescriptionItem.medicine))
+    elif items:
+        options.append(selectinload(Prescription.items))
+
+    if diagnoses:
+        options.append(selectinload(Prescription.diagnoses).joinedload(PatientDiagnosis.diagnosis))
+
+    return query.options(*options)
@@ -8,60 +8,36 @@ class RecommendationService:
     """
     
     @staticmethod
-    def get_similar_patients(patient_id, doctor_id, limit=5):
+    def get_similar_patients(patient_id, doctor_id, limit=5, metric='cosine', approximate=False):
         """
         Find similar patients based on diagnosis history
         """
-        # Get the patient's diagnoses
-        patient_diagnoses = PatientDiagnosis.query.join(
-            Patient, Patient.id == PatientDiagnosis.patient_id
-        ).filter(
-            PatientDiagnosis.patient_id == patient_id,
-            Patient.doctor_id == doctor_id
-        ).all()
+        # Exact: TF-IDF weighted similarity over the doctor's in-memory patient x diagnosis matrix.
+        # Approximate: MinHash/LSH candidates ranked by estimated Jaccard similarity.
+        from app.services.patient_similarity import get_patient_similarity
+        from app.services.patient_lsh import approximate_similar_patients
         
-        if not patient_diagnoses:
+        if approximate:
+            matches = [other for other, _ in approximate_similar_patients(patient_id, doctor_id, limit)]
+        else:
+            matches = [other for other, _, _ in get_patient_similarity().similar(doctor_id, patient_id, limit, metric)]
+        if not matches:
             return []
         
-        # Extract diagnosis IDs
-        diagnosis_ids = [pd.diagnosis_id for pd in patient_diagnoses]
-        
-        # Find patients with similar diagnoses
-        similar_patients = Patient.query.join(
-            PatientDiagnosis, Patient.id == PatientDiagnosis.patient_id
-        ).filter(
-            Patient.id != patient_id,
-            Patient.doctor_id == doctor_id,
-            PatientDiagnosis.diagnosis_id.in_(diagnosis_ids)
-        ).group_by(
-            Patient.id
-        ).order_by(
-            func.count(PatientDiagnosis.id).desc()
-        ).limit(limit).all()
-        
-        return similar_patients
+        patients = {patient.id: patient for patient in Patient.query.filter(
+            Patient.id.in_(matches), Patient.doctor_id == doctor_id
+        )}
+        return [patients[other] for other in matches if other in patients]
     
     @staticmethod
-    def get_medicine_recommendations(diagnosis_id, limit=5):
+    def get_medicine_recommendations(diagnosis_id, limit=5, doctor_id=None, doctor_weight=0):
         """
         Recommend medicines based on diagnosis
         """
-        # Find most commonly prescribed medicines for this diagnosis
-        recommended_medicines = Medicine.query.join(
-            PrescriptionItem, Medicine.id == PrescriptionItem.medicine_id
-        ).join(
-            Prescription, Prescription.id == PrescriptionItem.prescription_id
-        ).join(
-            PatientDiagnosis, PatientDiagnosis.prescription_id == Prescription.id
-        ).filter(
-            PatientDiagnosis.diagnosis_id == diagnosis_id
-        ).group_by(
-            Medicine.id
-        ).order_by(
-            func.count(PrescriptionItem.id).desc()
-        ).limit(limit).all()
+        # Most commonly prescribed medicines for this diagnosis, from the precomputed co-occurrence counts
+        from app.services.cooccurrence import recommend_medicines
         
-        return recommended_medicines
+        return [entry["medicine"] for entry in recommend_medicines(diagnosis_id, doctor_id, doctor_weight, limit)]
     
     @staticmethod
     def get_diagnosis_suggestions(symptoms, limit=5):
@@ -0,0 +1,256 @@
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+from sqlalchemy import event, func, inspect, literal, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from app.extensions import db
+from app.models.models import Appointment, Prescription, Patient, PatientDiagnosis, DailyStatRollup
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_METRICS = ('appointments', 'prescriptions', 'new_patients', 'diagnoses')
+
+
+class _PatientRef:
+    """Placeholder for a doctor id that must be resolved through a patient"""
+    __slots__ = ('patient_id',)
+
+    def __init__(self, patient_id):
+        self.patient_id = patient_id
+
+
+def _as_date(value):
+    """Coerce a Date/DateTime attribute value to a date (None for SQL expressions)"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return None
+
+
+def _appointment_keys(get):
+    return [(get('doctor_id'), 'appointments', _as_date(get('date')), get('status') or '')]
+
+
+def _prescription_keys(get):
+    return [(get('doctor_id'), 'prescriptions', _as_date(get('issue_date')), '')]
+
+
+def _patient_keys(get):
+    return [(get('doctor_id'), 'new_patients', _as_date(get('created_at')), '')]
+
+
+def _patient_diagnosis_keys(get):
+    day = _as_date(get('date_diagnosed')) or _as_date(get('created_at'))
+    return [(_PatientRef(get('patient_id')), 'diagnoses', day, str(get('diagnosis_id')))]
+
+
+# Rollup keys (doctor_id, metric, day, dimension) contributed by one row of each model
+ROLLUP_SOURCES = {
+    Appointment: _appointment_keys,
+    Prescription: _prescription_keys,
+    Patient: _patient_keys,
+    PatientDiagnosis: _patient_diagnosis_keys
+}
+
+# Attributes the rollup keys depend on. Their previous value must be known when
+# they change, even if the row was expired, so we request active history.
+ROLLUP_ATTRIBUTES = {
+    Appointment: ('doctor_id', 'date', 'status'),
+    Prescription: ('doctor_id', 'issue_date'),
+    Patient: ('doctor_id', 'created_at'),
+    PatientDiagnosis: ('patient_id', 'diagnosis_id', 'date_diagnosed', 'created_at')
+}
+
+
+def _track_previous_value(target, value, oldvalue, initiator):
+    return value
+
+
+for _model, _attributes in ROLLUP_ATTRIBUTES.items():
+    for _attribute in _attributes:
+        event.listen(getattr(_model, _attribute), 'set', _track_previous_value, active_history=True, retval=True)
+
+
+def _current_values(obj):
+    return lambda attr: getattr(obj, attr)
+
+
+def _previous_values(obj):
+    state = inspect(obj)
+
+    def get(attr):
+        history = state.attrs[attr].history
+        if history.deleted:
+            return history.deleted[0]
+        return getattr(obj, attr)
+
+    return get
+
+
+def collect_rollup_deltas(session):
+    """Compute rollup count changes for the objects of a flush (pre-flush state)"""
+    deltas = defaultdict(int)
+
+    def add(keys, amount):
+        for key in keys:
+            if key[0] is not None and key[2] is not None:
+                deltas[key] += amount
+
+    for obj in session.new:
+        keys_for = ROLLUP_SOURCES.get(type(obj))
+        if keys_for:
+            add(keys_for(_current_values(obj)), 1)
+
+    for obj in session.deleted:
+        keys_for = ROLLUP_SOURCES.get(type(obj))
+        if keys_for:
+            add(keys_for(_previous_values(obj)), -1)
+
+    for obj in session.dirty:
+        keys_for = ROLLUP_SOURCES.get(type(obj))
+        if keys_for and session.is_modified(obj):
+            add(keys_for(_previous_values(obj)), -1)
+            add(keys_for(_current_values(obj)), 1)
+
+    return deltas
+
+
+def _resolve_doctors(session, connection, deltas):
+    """Replace patient placeholders in rollup keys with the patient's doctor id"""
+    patient_ids = {key[0].patient_id for key in deltas if isinstance(key[0], _PatientRef)}
+    if not patient_ids:
+        return deltas
+
+    doctor_by_patient = {}
+    for patient_id in patient_ids:
+        patient = session.identity_map.get(inspect(Patient).identity_key_from_primary_key((patient_id,)))
+        if patient is not None:
+            doctor_by_patient[patient_id] = patient.doctor_id
+
+    missing = patient_ids - set(doctor_by_patient)
+    if missing:
+        rows = connection.execute(
+            select(Patient.id, Patient.doctor_id).where(Patient.id.in_(missing))
+        )
+        doctor_by_patient.update(dict(rows.all()))
+
+    resolved = defaultdict(int)
+    for (doctor, metric, day, dimension), amount in deltas.items():
+        if isinstance(doctor, _PatientRef):
+            doctor = doctor_by_patient.get(doctor.patient_id)
+            if doctor is None:
+                continue
+        resolved[(doctor, metric, day, dimension)] += amount
+
+    return resolved
+
+
+def apply_rollup_deltas(connection, deltas):
+    """Add count deltas to the rollup table, creating rows as needed"""
+    table = DailyStatRollup.__table__
+    dialect_name = connection.dialect.name
+
+    for (doctor_id, metric, day, dimension), amount in deltas.items():
+        if amount == 0:
+            continue
+
+        values = dict(doctor_id=doctor_id, metric=metric, day=day, dimension=dimension, count=amount)
+
+        if dialect_name in ('sqlite', 'postgresql'):
+            insert = sqlite_insert if dialect_name == 'sqlite' else postgresql_insert
+            stmt = insert(table).values(**values)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['doctor_id', 'metric', 'day', 'dimension'],
+                set_={'count': table.c.count + stmt.excluded.count}
+            )
+            connection.execute(stmt)
+            continue
+
+        result = connection.execute(
+            table.update().where(
+                table.c.doctor_id == doctor_id,
+                table.c.metric == metric,
+                table.c.day == day,
+                table.c.dimension == dimension
+            ).values(count=table.c.count + amount)
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(**values))
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_rollups(session, flush_context):
+    deltas = collect_rollup_deltas(session)
+    if not deltas:
+        return
+
+    connection = session.connection()
+    apply_rollup_deltas(connection, _resolve_doctors(session, connection, deltas))
+
+
+def _rebuild_queries(doctor_id=None):
+    """Grouped fact-table queries producing (doctor_id, metric, day, dimension, count) rows"""
+    diagnosis_day = func.coalesce(PatientDiagnosis.date_diagnosed, func.date(PatientDiagnosis.created_at))
+
+    queries = [
+        db.session.query(
+            Appointment.doctor_id, literal('appointments'), Appointment.date,
+            func.coalesce(Appointment.status, ''), func.count()
+        ).group_by(Appointment.doctor_id, Appointment.date, Appointment.status),
+        db.session.query(
+            Prescription.doctor_id, literal('prescriptions'), Prescription.issue_date, literal(''), func.count()
+        ).group_by(Prescription.doctor_id, Prescription.issue_date),
+        db.session.query(
+            Patient.doctor_id, literal('new_patients'), func.date(Patient.created_at), literal(''), func.count()
+        ).group_by(Patient.doctor_id, func.date(Patient.created_at)),
+        db.session.query(
+            Patient.doctor_id, literal('diagnoses'), diagnosis_day,
+            PatientDiagnosis.diagnosis_id, func.count()
+        ).join(
+            Patient, Patient.id == PatientDiagnosis.patient_id
+        ).group_by(Patient.doctor_id, diagnosis_day, PatientDiagnosis.diagnosis_id)
+    ]
+
+    if doctor_id is not None:
+        doctor_columns = [Appointment.doctor_id, Prescription.doctor_id, Patient.doctor_id, Patient.doctor_id]
+        queries = [query.filter(column == doctor_id) for query, column in zip(queries, doctor_columns)]
+
+    return queries
+
+
+def rebuild_rollups(doctor_id=None, batch_size=1000):
+    """
+    Recompute the rollup table from the fact tables (backfill / repair).
+    Returns the number of rollup rows written.
+    """
+    delete_query = DailyStatRollup.query
+    if doctor_id is not None:
+        delete_query = delete_query.filter_by(doctor_id=doctor_id)
+    delete_query.delete(synchronize_session=False)
+
+    table = DailyStatRollup.__table__
+    written = 0
+    batch = []
+
+    for query in _rebuild_queries(doctor_id):
+        for doctor, metric, day, dimension, count in query.all():
+            day = _as_date(day) or (date.fromisoformat(day) if isinstance(day, str) else None)
+            if day is None:
+                continue
+
+            batch.append(dict(doctor_id=doctor, metric=metric, day=day, dimension=str(dimension), count=count))
+            if len(batch) >= batch_size:
+                db.session.execute(table.insert(), batch)
+                written += len(batch)
+                batch = []
+
+    if batch:
+        db.session.execute(table.insert(), batch)
+        written += len(batch)
+
+    db.session.commit()
+    logger.info(f"Rebuilt {written} statistics rollup rows")
+    return written
@@ -0,0 +1,166 @@
+import bisect
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from itertools import islice
+from dateutil.rrule import rrulestr
+from sqlalchemy import or_
+from flask import current_app
+from app.extensions import db
+from app.models.models import Appointment
+
+# Appointments in these states don't occupy their slot
+NON_BLOCKING_STATUSES = ('canceled',)
+
+
+def to_minutes(value):
+    """Minutes since midnight of a time"""
+    return value.hour * 60 + value.minute
+
+
+def from_minutes(minutes):
+    """Time for a number of minutes since midnight"""
+    return time(minutes // 60, minutes % 60)
+
+
+class DaySchedule:
+    """
+    Busy time of one doctor on one day as disjoint, sorted [start, end) minute
+    intervals. Overlapping bookings are merged on load, so conflict checks are
+    a bisect plus one neighbour comparison and free gaps are read off directly.
+    """
+
+    def __init__(self, bookings=()):
+        self.bookings = sorted(bookings)  # (start, end, appointment_uuid)
+        self._merge()
+
+    def _merge(self):
+        self.starts = []
+        self.ends = []
+
+        for start, end, _ in self.bookings:
+            if self.ends and start < self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def add(self, start, end, appointment_uuid):
+        """Book [start, end) so later checks in the same batch see it"""
+        bisect.insort(self.bookings, (start, end, appointment_uuid))
+        self._merge()
+
+    def is_free(self, start, end):
+        """True if [start, end) overlaps no booking"""
+        position = bisect.bisect_right(self.ends, start)
+        return position == len(self.starts) or self.starts[position] >= end
+
+    def conflicts(self, start, end):
+        """UUIDs of the bookings overlapping [start, end)"""
+        if self.is_free(start, end):
+            return []
+        return [uuid for booking_start, booking_end, uuid in self.bookings
+                if booking_start < end and booking_end > start]
+
+    def free_slots(self, duration, day_start, day_end, step, not_before=None):
+        """Yield the starts of free [start, start + duration) slots on a `step` grid"""
+        earliest = day_start if not_before is None else max(day_start, not_before)
+        # Align to the grid counted from the start of the working day
+        candidate = day_start + -(-(earliest - day_start) // step) * step
+
+        while candidate + duration <= day_end:
+            position = bisect.bisect_right(self.ends, candidate)
+            if position < len(self.starts) and self.starts[position] < candidate + duration:
+                # Jump past the blocking interval onto the next grid point
+                blocked_until = self.ends[position]
+                candidate = day_start + -(-(blocked_until - day_start) // step) * step
+                continue
+
+            yield candidate
+            candidate += step
+
+
+def load_schedules(doctor_id, start_date, end_date, exclude_id=None):
+    """
+    Day schedules of a doctor for every day in [start_date, end_date],
+    built from a single range query on (doctor_id, date).
+    """
+    query = db.session.query(
+        Appointment.date, Appointment.start_time, Appointment.end_time, Appointment.uuid
+    ).filter(
+        Appointment.doctor_id == doctor_id,
+        Appointment.date >= start_date,
+        Appointment.date <= end_date,
+        or_(Appointment.status.is_(None), Appointment.status.notin_(NON_BLOCKING_STATUSES))
+    )
+    if exclude_id is not None:
+        query = query.filter(Appointment.id != exclude_id)
+
+    bookings = defaultdict(list)
+    for day, start_time, end_time, appointment_uuid in query:
+        bookings[day].append((to_minutes(start_time), to_minutes(end_time), appointment_uuid))
+
+    return defaultdict(DaySchedule, {day: DaySchedule(items) for day, items in bookings.items()})
+
+
+def expand_recurrence(rule, start_date, limit):
+    """
+    Dates of a recurrence rule (RFC 5545 RRULE, e.g. "FREQ=WEEKLY;COUNT=10;BYDAY=MO")
+    starting at start_date. Raises ValueError for invalid rules or when the
+    rule yields more than `limit` occurrences.
+    """
+    recurrence = rrulestr(rule, dtstart=datetime.combine(start_date, time.min))
+    dates = [occurrence.date() for occurrence in islice(recurrence, limit + 1)]
+
+    if len(dates) > limit:
+        raise ValueError(f"Recurrence yields more than {limit} occurrences")
+    return dates
+
+
+def find_conflicts(doctor_id, day, start_time, end_time, exclude_id=None):
+    """UUIDs of the doctor's appointments overlapping a proposed slot"""
+    schedule = load_schedules(doctor_id, day, day, exclude_id)[day]
+    return schedule.conflicts(to_minutes(start_time), to_minutes(end_time))
+
+
+def working_hours():
+    """Configured working day as (start, end, slot step) in minutes and working weekdays"""
+    config = current_app.config
+    day_start = datetime.strptime(config.get('SCHEDULE_DAY_START', '09:00'), '%H:%M').time()
+    day_end = datetime.strptime(config.get('SCHEDULE_DAY_END', '17:00'), '%H:%M').time()
+    return (
+        to_minutes(day_start),
+        to_minutes(day_end),
+        config.get('SCHEDULE_SLOT_STEP', 15),
+        config.get('SCHEDULE_WORKING_DAYS', (0, 1, 2, 3, 4))
+    )
+
+
+def find_free_slots(doctor_id, start_date, end_date, duration, count,
+                    day_start=None, day_end=None, step=None, now=None):
+    """
+    First `count` free slots of `duration` minutes between start_date and
+    end_date (inclusive), within working hours and never in the past.
+    Returns a list of (date, start_time, end_time).
+    """
+    default_start, default_end, default_step, working_days = working_hours()
+    day_start = default_start if day_start is None else day_start
+    day_end = default_end if day_end is None else day_end
+    step = step or default_step
+
+    if now is None:
+        now = datetime.now()
+
+    schedules = load_schedules(doctor_id, start_date, end_date)
+    slots = []
+
+    day = max(start_date, now.date())
+    while day <= end_date and len(slots) < count:
+        if day.weekday() in working_days:
+            not_before = to_minutes(now.time()) + 1 if day == now.date() else None
+            for start in schedules[day].free_slots(duration, day_start, day_end, step, not_before):
+                slots.append((day, from_minutes(start), from_minutes(start + duration)))
+                if len(slots) >= count:
+                    break
+        day += timedelta(days=1)
+
+    return slots
@@ -0,0 +1,272 @@
+import bisect
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.extensions import db
+from app.models.models import Medicine
+
+
+def normalize_text(value):
+    """Lowercase, strip accents and collapse whitespace for index lookups"""
+    if not value:
+        return ''
+    value = unicodedata.normalize('NFKD', value)
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return ' '.join(value.lower().split())
+
+
+def trigrams(text):
+    """Set of 3-character substrings of an already normalized string"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TextSearchIndex:
+    """
+    In-memory prefix + trigram index over one text field of a catalog.
+
+    Keys are kept in a sorted list so prefix matches are a bisect range, and
+    every key is posted under its trigrams so substring matches only verify
+    the rows sharing all trigrams of the query.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self.loaded_at = None
+        self._lock = threading.RLock()
+        self._documents = {}
+        self._sorted_keys = []
+        self._postings = defaultdict(set)
+
+    def load(self, documents):
+        """Replace the index contents with (doc_id, text, payload) tuples"""
+        with self._lock:
+            self._documents = {}
+            self._sorted_keys = []
+            self._postings = defaultdict(set)
+
+            for doc_id, text, payload in documents:
+                self._index(doc_id, text, payload)
+
+            self._sorted_keys.sort()
+            self.loaded = True
+            self.loaded_at = time.monotonic()
+
+    def claim_reload(self, ttl):
+        """True for the one caller that should rebuild an index older than ttl seconds"""
+        with self._lock:
+            if self.loaded_at is None or self.loaded_at + ttl >= time.monotonic():
+                return False
+            self.loaded_at = time.monotonic()
+            return True
+
+    def add(self, doc_id, text, payload):
+        """Insert or replace a document"""
+        with self._lock:
+            self._unindex(doc_id)
+            key = self._index(doc_id, text, payload)
+            bisect.insort(self._sorted_keys, (key, doc_id))
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._unindex(doc_id)
+
+    def _index(self, doc_id, text, payload):
+        key = normalize_text(text)
+        self._documents[doc_id] = (key, payload)
+        self._sorted_keys.append((key, doc_id))
+        for gram in trigrams(key):
+            self._postings[gram].add(doc_id)
+        return key
+
+    def _unindex(self, doc_id):
+        entry = self._documents.pop(doc_id, None)
+        if entry is None:
+            return
+
+        key = entry[0]
+        position = bisect.bisect_left(self._sorted_keys, (key, doc_id))
+        if position < len(self._sorted_keys) and self._sorted_keys[position] == (key, doc_id):
+            del self._sorted_keys[position]
+
+        for gram in trigrams(key):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(doc_id)
+                if not posting:
+                    del self._postings[gram]
+
+    def prefix_matches(self, term, limit=None):
+        """Doc ids whose key starts with the normalized term, in key order"""
+        with self._lock:
+            position = bisect.bisect_left(self._sorted_keys, (term,))
+            matches = []
+            while position < len(self._sorted_keys):
+                key, doc_id = self._sorted_keys[position]
+                if not key.startswith(term) or (limit is not None and len(matches) >= limit):
+                    break
+                matches.append(doc_id)
+                position += 1
+            return matches
+
+    def substring_matches(self, term):
+        """(doc_id, key) pairs whose key contains the normalized term"""
+        with self._lock:
+            if len(term) < 3:
+                # Too short for trigrams; the catalog scan is still in memory
+                candidates = self._documents.keys()
+            else:
+                postings = sorted((self._postings.get(gram, set()) for gram in trigrams(term)), key=len)
+                candidates = set.intersection(*postings) if postings else set()
+
+            return [
+                (doc_id, self._documents[doc_id][0])
+                for doc_id in candidates
+                if term in self._documents[doc_id][0]
+            ]
+
+    def payload(self, doc_id):
+        entry = self._documents.get(doc_id)
+        return entry[1] if entry else None
+
+    def search(self, query, limit=10):
+        """
+        Rank prefix matches first (alphabetically), then other substring
+        matches by where the term occurs in the key. Returns payloads.
+        """
+        term = normalize_text(query)
+        if not term or limit <= 0:
+            return []
+
+        with self._lock:
+            ranked = self.prefix_matches(term, limit)
+            if len(ranked) < limit:
+                seen = set(ranked)
+                substring = sorted(
+                    (key.find(term), key, doc_id)
+                    for doc_id, key in self.substring_matches(term)
+                    if doc_id not in seen
+                )
+                ranked.extend(doc_id for _, _, doc_id in substring[:limit - len(ranked)])
+
+            return [self.payload(doc_id) for doc_id in ranked]
+
+    def __len__(self):
+        return len(self._documents)
+
+
+class SearchIndexSpec:
+    """How a model is loaded into and kept in sync with a search index"""
+
+    def __init__(self, name, model, document, columns, index_class=TextSearchIndex, ttl_setting=None):
+        self.name = name
+        self.model = model
+        self.document = document
+        self.columns = columns
+        self.index_class = index_class
+        self.ttl_setting = ttl_setting
+
+    def load_documents(self):
+        rows = db.session.query(*self.columns).yield_per(1000)
+        return (self.document(row) for row in rows)
+
+
+SEARCH_INDEXES = {}
+
+
+def register_search_index(spec):
+    SEARCH_INDEXES[spec.name] = spec
+    return spec
+
+
+def _medicine_document(medicine):
+    payload = {"id": medicine.uuid, "name": medicine.name}
+    if medicine.dosage_form:
+        payload["dosage_form"] = medicine.dosage_form
+    if medicine.strength:
+        payload["strength"] = medicine.strength
+    return medicine.id, medicine.name, payload
+
+
+MEDICINE_INDEX = register_search_index(SearchIndexSpec(
+    'medicine_search_index',
+    Medicine,
+    _medicine_document,
+    (Medicine.id, Medicine.uuid, Medicine.name, Medicine.dosage_form, Medicine.strength),
+    ttl_setting='MEDICINE_SEARCH_INDEX_TTL'
+))
+
+
+def init_search_indexes(app):
+    """Attach the search indexes to the app, loading them unless SEARCH_INDEX_PRELOAD is off"""
+    for spec in SEARCH_INDEXES.values():
+        app.extensions[spec.name] = spec.index_class()
+
+    if app.config.get('SEARCH_INDEX_PRELOAD', True):
+        with app.app_context():
+            for spec in SEARCH_INDEXES.values():
+                get_search_index(spec)
+
+
+def get_search_index(spec):
+    """
+    Get an index of the current application, loading it on first use.
+    Commits of other processes (workers, CLI commands, seed scripts) aren't
+    seen here, so an index older than its TTL setting is rebuilt.
+    """
+    index = current_app.extensions[spec.name]
+    if not index.loaded:
+        with index._lock:
+            if not index.loaded:
+                index.load(spec.load_documents())
+    elif spec.ttl_setting and index.claim_reload(current_app.config.get(spec.ttl_setting, 300)):
+        # Build the replacement without holding the lock so searches keep using the old one
+        fresh = spec.index_class()
+        fresh.load(spec.load_documents())
+        current_app.extensions[spec.name] = index = fresh
+    return index
+
+
+def _specs_by_model():
+    return {spec.model: spec for spec in SEARCH_INDEXES.values()}
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_index_changes(session, flush_context):
+    specs = _specs_by_model()
+    changes = session.info.setdefault('search_index_changes', [])
+
+    for obj in session.new.union(session.dirty):
+        spec = specs.get(type(obj))
+        if spec is not None and (obj in session.new or session.is_modified(obj)):
+            changes.append((spec, 'add', spec.document(obj)))
+
+    for obj in session.deleted:
+        spec = specs.get(type(obj))
+        if spec is not None:
+            changes.append((spec, 'remove', obj.id))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_index_changes(session):
+    # Indexes only see committed catalog changes
+    changes = session.info.pop('search_index_changes', None)
+    if not changes or not has_app_context():
+        return
+
+    for spec, operation, value in changes:
+        index = current_app.extensions.get(spec.name)
+        if index is None or not index.loaded:
+            continue
+        if operation == 'add':
+            index.add(*value)
+        else:
+            index.remove(value)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_index_changes(session):
+    session.info.pop('search_index_changes', None)
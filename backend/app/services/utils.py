@@ -1,4 +1,5 @@
 import os
+import io
 import uuid
 import csv
 import json
@@ -67,13 +68,46 @@ def generate_csv(data, headers):
         logger.error(f"Error generating CSV: {str(e)}")
         return None
 
+def stream_csv(rows, headers, batch_size=500):
+    """Yield CSV text in chunks of rows without holding the dataset in memory"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    
+    pending = 0
+    for row in rows:
+        writer.writerow([csv_value(value) for value in row])
+        pending += 1
+        
+        if pending >= batch_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            pending = 0
+    
+    yield buffer.getvalue()
+
+def csv_value(value):
+    """Format a value for CSV output"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, time):
+        return value.strftime('%H:%M')
+    return value
+
+def normalize_phone_digits(phone):
+    """Digits-only form of a phone number (None if it has no digits)"""
+    if not phone:
+        return None
+    return ''.join(filter(str.isdigit, phone)) or None
+
 def format_phone_number(phone):
     """Format a phone number consistently"""
     if not phone:
         return None
         
     # Remove all non-numeric characters
-    digits = ''.join(filter(str.isdigit, phone))
+    digits = normalize_phone_digits(phone) or ''
     
     # Apply formatting based on length
     if len(digits) == 10:  # US number without country code
@@ -97,34 +131,13 @@ def calculate_age(birth_date):
     return age
 
 def log_activity(doctor_id, action, entity_type=None, entity_id=None, details=None, request=None):
-    """Log user activity"""
-    from app.models.models import ActivityLog
-    from app import db
+    """Log user activity through the audit writer, outside the request session"""
+    from app.services.audit import record_activity
     
     try:
-        ip_address = None
-        user_agent = None
-        
-        if request:
-            ip_address = request.remote_addr
-            user_agent = request.user_agent.string if request.user_agent else None
-        
-        activity = ActivityLog(
-            doctor_id=doctor_id,
-            action=action,
-            entity_type=entity_type,
-            entity_id=entity_id,
-            details=details,
-            ip_address=ip_address,
-            user_agent=user_agent
-        )
-        
-        db.session.add(activity)
-        db.session.commit()
-        return True
+        return record_activity(doctor_id, action, entity_type, entity_id, details, request)
     except Exception as e:
         logger.error(f"Error logging activity: {str(e)}")
-        db.session.rollback()
         return False
 
 def is_valid_uuid(val):
@@ -3,6 +3,7 @@ import sys
 import pytest
 from datetime import datetime, date
 import uuid
+from sqlalchemy import event
 
 # Add application to Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -25,6 +26,7 @@ def app():
     with app.app_context():
         db.create_all()
         yield app
+        app.extensions['audit_writer'].close()
         db.session.remove()
         db.drop_all()
 
@@ -33,6 +35,36 @@ def client(app):
     """A test client for the app."""
     return app.test_client()
 
+class QueryCounter(list):
+    """SQL statements executed against the test database."""
+    
+    def selects(self):
+        """The SELECT statements"""
+        return [statement for statement in self if statement.lstrip().upper().startswith('SELECT')]
+    
+    def reading(self, *tables):
+        """The statements reading from any of the tables"""
+        return [statement for statement in self if any(f'FROM {table}' in statement for table in tables)]
+    
+    def get(self, client, url, **kwargs):
+        """GET a URL, recording only the statements it executes"""
+        self.clear()
+        response = client.get(url, **kwargs)
+        assert response.status_code == 200, response.get_data(as_text=True)
+        return response
+
+@pytest.fixture(scope='function')
+def query_counter(app):
+    """Record the SQL statements executed against the test database."""
+    statements = QueryCounter()
+    
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    yield statements
+    event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
 @pytest.fixture(scope='function')
 def doctor(app):
     """Create a test doctor."""
@@ -83,4 +83,137 @@ def test_calendar(client, auth_headers, appointment):
     
     today_str = today.strftime('%Y-%m-%d')
     assert today_str in data['calendar']
-    assert len(data['calendar'][today_str]) > 0
\ No newline at end of file
+    assert len(data['calendar'][today_str]) > 0
+
+def test_calendar_single_query(client, auth_headers, appointment, query_counter):
+    """Test that the calendar is built from one projection query"""
+    today = date.today()
+    
+    data = query_counter.get(
+        client, f'/api/calendar?start_date={today.strftime("%Y-%m-%d")}&end_date={today.strftime("%Y-%m-%d")}',
+        headers=auth_headers
+    ).get_json()
+    
+    assert data['calendar'][today.strftime('%Y-%m-%d')][0]['patient']['name'] == 'Test Patient'
+    assert len(query_counter) == 1
+
+def test_appointment_availability(client, auth_headers, patient):
+    """Test free slot search and conflict checks in one call"""
+    # 2030-01-07 is a Monday
+    for start_time, end_time, status in [('09:00', '10:00', 'scheduled'), ('10:30', '11:00', 'scheduled'),
+                                          ('11:00', '12:00', 'canceled')]:
+        response = client.post('/api/appointments', json={
+            'patient_id': patient.uuid,
+            'date': '2030-01-07',
+            'start_time': start_time,
+            'end_time': end_time,
+            'status': status
+        }, headers=auth_headers)
+        assert response.status_code == 201
+    
+    response = client.get(
+        '/api/appointments/availability?start_date=2030-01-05&end_date=2030-01-08&duration=30&count=3'
+        '&date=2030-01-07&start_time=09:30&end_time=10:15',
+        headers=auth_headers
+    )
+    data = response.get_json()
+    
+    assert response.status_code == 200
+    # The weekend is skipped and the canceled appointment doesn't block its slot
+    assert [(slot['date'], slot['start_time'], slot['end_time']) for slot in data['slots']] == [
+        ('2030-01-07', '10:00', '10:30'),
+        ('2030-01-07', '11:00', '11:30'),
+        ('2030-01-07', '11:15', '11:45')
+    ]
+    assert data['check']['available'] is False
+    assert len(data['check']['conflicts']) == 1
+    
+    # An empty or reversed proposed slot is rejected
+    for start_time, end_time in [('09:30', '09:10'), ('09:30', '09:30')]:
+        response = client.get(
+            f'/api/appointments/availability?date=2030-01-07&start_time={start_time}&end_time={end_time}',
+            headers=auth_headers
+        )
+        assert response.status_code == 400
+    
+    # Creating in an occupied slot is still rejected
+    response = client.post('/api/appointments', json={
+        'patient_id': patient.uuid,
+        'date': '2030-01-07',
+        'start_time': '10:15',
+        'end_time': '10:45'
+    }, headers=auth_headers)
+    assert response.status_code == 409
+
+def test_create_recurring_appointments(client, auth_headers, patient, query_counter):
+    """Test creating a weekly series in one request with a per-occurrence report"""
+    client.post('/api/appointments', json={
+        'patient_id': patient.uuid,
+        'date': '2030-01-21',
+        'start_time': '09:30',
+        'end_time': '10:30'
+    }, headers=auth_headers)
+    
+    series = {
+        'patient_id': patient.uuid,
+        'start_time': '09:00',
+        'end_time': '10:00',
+        'reason': 'Physiotherapy',
+        'recurrence': {'rule': 'FREQ=WEEKLY;COUNT=4;BYDAY=MO', 'start_date': '2030-01-07'}
+    }
+    
+    # The third Monday is taken, so nothing is created by default
+    response = client.post('/api/appointments/bulk', json=series, headers=auth_headers)
+    data = response.get_json()
+    assert response.status_code == 409
+    assert [result['status'] for result in data['results']] == ['not_created', 'not_created', 'conflict', 'not_created']
+    
+    query_counter.clear()
+    response = client.post('/api/appointments/bulk', json=dict(series, allow_partial=True), headers=auth_headers)
+    data = response.get_json()
+    
+    assert response.status_code == 201
+    assert data['created'] == 3
+    assert [result['date'] for result in data['results'] if result['status'] == 'created'] == [
+        '2030-01-07', '2030-01-14', '2030-01-28'
+    ]
+    # patient lookup + conflict range query + inserts, no per-occurrence queries before the insert
+    assert len(query_counter.selects()) <= 3
+    
+    response = client.get('/api/appointments?start_date=2030-01-01&end_date=2030-01-31', headers=auth_headers)
+    assert response.get_json()['pagination']['total'] == 4
+    
+    # Occurrences within one batch conflict with each other too
+    response = client.post('/api/appointments/bulk', json={
+        'patient_id': patient.uuid,
+        'appointments': [
+            {'date': '2030-02-04', 'start_time': '09:00', 'end_time': '10:00'},
+            {'date': '2030-02-04', 'start_time': '09:30', 'end_time': '10:30'}
+        ]
+    }, headers=auth_headers)
+    assert response.status_code == 409
+    
+    # Values of the wrong type are reported per occurrence, not a server error
+    response = client.post('/api/appointments/bulk', json={
+        'appointments': [
+            {'patient_id': [patient.uuid], 'date': '2030-03-04', 'start_time': '09:00', 'end_time': '10:00'},
+            {'patient_id': {'id': 1}, 'date': '2030-03-05', 'start_time': '09:00', 'end_time': '10:00'},
+            {'patient_id': patient.uuid, 'status': ['done'], 'date': '2030-03-06',
+             'start_time': '09:00', 'end_time': '10:00'},
+            {'patient_id': patient.uuid, 'reason': {'text': 'x'}, 'date': '2030-03-07',
+             'start_time': '09:00', 'end_time': '10:00'}
+        ]
+    }, headers=auth_headers)
+    assert response.status_code == 400
+    assert [result['status'] for result in response.get_json()['results']] == ['invalid'] * 4
+    
+    # Non-object entries keep their place in the results
+    response = client.post('/api/appointments/bulk', json={
+        'appointments': [5, {'patient_id': patient.uuid, 'date': '2030-03-11', 'start_time': '09:00', 'end_time': '10:00'}]
+    }, headers=auth_headers)
+    assert response.status_code == 400
+    results = response.get_json()['results']
+    assert [(result['index'], result['status']) for result in results] == [(0, 'invalid'), (1, 'not_created')]
+    
+    response = client.post('/api/appointments/bulk', json={'appointments': 5}, headers=auth_headers)
+    assert response.status_code == 400
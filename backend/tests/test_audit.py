@@ -0,0 +1,181 @@
+import gzip
+import json
+import threading
+import time
+import pytest
+from datetime import datetime
+from sqlalchemy import create_engine, event, inspect, select, func
+from app.extensions import db
+from app.models.models import ActivityLog
+from app.services.activity_partitions import ShardedActivityLogPartitions, archive_activity_logs, partition_table
+from app.services.audit import AuditWriter, audit_row, get_audit_writer
+
+@pytest.fixture
+def audit_engine(tmp_path):
+    """File-backed database holding only the activity log table"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'audit.db'}")
+    ActivityLog.__table__.create(engine)
+    yield engine
+    engine.dispose()
+
+def logged_rows(engine):
+    partitions = ShardedActivityLogPartitions()
+    with engine.connect() as connection:
+        return sum(
+            connection.execute(select(func.count()).select_from(table)).scalar()
+            for table, _ in partitions.read_tables(connection)
+        )
+
+@pytest.mark.parametrize('durability', ['async', 'sync'])
+def test_writer_batches_events(audit_engine, durability):
+    """Test that queued events are written in a few executemany batches and flushed on close"""
+    inserts = []
+    event.listen(audit_engine, 'before_cursor_execute',
+                 lambda conn, cursor, statement, params, context, executemany: inserts.append(executemany))
+
+    writer = AuditWriter(audit_engine, batch_size=100, flush_interval=0.05, durability=durability)
+    threads = [
+        threading.Thread(target=lambda: [writer.record(audit_row(1, 'read')) for _ in range(50)])
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.close()
+
+    assert logged_rows(audit_engine) == 250
+    assert writer.stats['written'] == 250
+    assert writer.stats['batches'] < 250
+    assert any(inserts)
+
+def test_writer_backpressure_drops_when_full(audit_engine):
+    """Test that a full queue drops events instead of blocking the caller forever"""
+    writer = AuditWriter(audit_engine, maxsize=5, batch_size=5, overflow='drop')
+
+    # Stall the writer so the queue fills up
+    with writer._write_lock:
+        results = [writer.record(audit_row(1, 'read')) for _ in range(20)]
+
+    writer.close()
+
+    assert not all(results)
+    assert writer.stats['dropped'] == results.count(False)
+    assert logged_rows(audit_engine) == results.count(True)
+
+def test_requests_are_audited_without_commits(app, client, auth_headers, patient):
+    """Test that authenticated requests are audited by the background writer, off the request thread"""
+    app.config['AUDIT_REQUESTS'] = True
+    writer = get_audit_writer()
+    writer.flush_interval = 0.05
+    assert writer.running
+    
+    writes = []
+    
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if 'activity_logs' in statement:
+            writes.append(threading.current_thread().name)
+    
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get('/api/patients', headers=auth_headers)
+        assert response.status_code == 200
+        response = client.get('/api/appointments', headers=auth_headers)
+        assert response.status_code == 200
+        
+        deadline = time.monotonic() + 5
+        while writer.stats['written'] < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    
+    assert writes and set(writes) == {'audit-writer'}
+    assert writer.stats['written'] == 2
+    
+    app.config['AUDIT_REQUESTS'] = False
+    logs = client.get('/api/audit/logs', headers=auth_headers).get_json()['logs']
+    assert [log['action'] for log in logs] == ['read', 'read']
+    assert [log['entity_type'] for log in logs] == ['appointments', 'patients']
+    assert json.loads(logs[0]['details'])['status'] == 200
+
+def record_history(doctor):
+    """Write activity spread over three months straight into the partitions"""
+    rows = [
+        dict(audit_row(doctor.id, 'update', 'patient', entity_id), timestamp=datetime(2024, month, day, 12))
+        for month in (1, 2, 3) for day in (5, 20) for entity_id in (1, 2)
+    ]
+    writer = get_audit_writer()
+    for row in rows:
+        writer.record(row)
+    writer.flush()
+    
+    # A row added through the ORM lands in the default partition
+    db.session.add(ActivityLog(doctor_id=doctor.id, action='login', timestamp=datetime(2024, 1, 2)))
+    db.session.commit()
+
+def test_activity_is_partitioned_by_month(app, client, auth_headers, doctor):
+    """Test that audit rows are routed to monthly tables and queried across them by index"""
+    record_history(doctor)
+    
+    tables = inspect(db.engine).get_table_names()
+    assert {'activity_logs_202401', 'activity_logs_202402', 'activity_logs_202403'} <= set(tables)
+    
+    response = client.get('/api/audit/logs?entity_type=patient&entity_id=2&per_page=4', headers=auth_headers)
+    data = response.get_json()
+    assert response.status_code == 200
+    assert [log['timestamp'][:10] for log in data['logs']] == ['2024-03-20', '2024-03-05', '2024-02-20', '2024-02-05']
+    
+    response = client.get(f"/api/audit/logs?entity_type=patient&entity_id=2&cursor={data['pagination']['next_cursor']}",
+                          headers=auth_headers)
+    assert [log['timestamp'][:10] for log in response.get_json()['logs']] == ['2024-01-20', '2024-01-05']
+    
+    response = client.get('/api/audit/logs?start_date=2024-01-01&end_date=2024-01-31', headers=auth_headers)
+    logs = response.get_json()['logs']
+    assert len(logs) == 5
+    assert logs[-1]['action'] == 'login'
+    
+    # Every partition is read through an index
+    table = partition_table('activity_logs_202402')
+    for query in (select(table).where(table.c.doctor_id == doctor.id).order_by(table.c.timestamp.desc()),
+                  select(table).where(table.c.entity_type == 'patient', table.c.entity_id == 2)):
+        compiled = query.compile(db.engine, compile_kwargs={'literal_binds': True})
+        plan = [row[3] for row in db.session.execute(db.text(f'EXPLAIN QUERY PLAN {compiled}'))]
+        assert any(step.startswith('SEARCH activity_logs_202402 USING') for step in plan), plan
+
+def test_archive_old_partitions(app, client, auth_headers, doctor, tmp_path):
+    """Test that months before the cutoff are moved to compressed archives"""
+    record_history(doctor)
+    
+    archived = archive_activity_logs(datetime(2024, 3, 1), str(tmp_path))
+    
+    assert [(month.month, rows) for month, rows in archived] == [(1, 5), (2, 4)]
+    assert 'activity_logs_202401' not in inspect(db.engine).get_table_names()
+    with gzip.open(tmp_path / 'activity_logs_202401.jsonl.gz', 'rt') as archive:
+        rows = [json.loads(line) for line in archive]
+    assert len(rows) == 5
+    assert {row['action'] for row in rows} == {'update', 'login'}
+    
+    logs = client.get('/api/audit/logs', headers=auth_headers).get_json()['logs']
+    assert len(logs) == 4
+    assert all(log['timestamp'].startswith('2024-03') for log in logs)
+
+def test_failed_archive_leaves_no_rows_behind(app, doctor, tmp_path, monkeypatch):
+    """Test that an archive run rolled back before commit doesn't duplicate rows on re-run"""
+    record_history(doctor)
+    partitions = app.extensions['activity_log_partitions']
+    
+    def fail(connection, name):
+        raise RuntimeError("disk full")
+    
+    monkeypatch.setattr(partitions, 'drop', fail)
+    with pytest.raises(RuntimeError):
+        archive_activity_logs(datetime(2024, 3, 1), str(tmp_path))
+    assert list(tmp_path.iterdir()) == []
+    
+    monkeypatch.undo()
+    archive_activity_logs(datetime(2024, 3, 1), str(tmp_path))
+    with gzip.open(tmp_path / 'activity_logs_202401.jsonl.gz', 'rt') as archive:
+        assert len(archive.readlines()) == 5
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        'activity_logs_202401.jsonl.gz', 'activity_logs_202402.jsonl.gz'
+    ]
@@ -109,4 +109,118 @@ def test_patient_diagnoses(client, auth_headers, patient, diagnosis):
     # Delete patient diagnosis
     response = client.delete(f'/api/patients/diagnoses/{patient_diagnosis_id}', headers=auth_headers)
     
-    assert response.status_code == 200
\ No newline at end of file
+    assert response.status_code == 200
+
+def test_search_diagnoses_ranking(client, auth_headers, diagnosis):
+    """Test ICD code hits rank first and misspelled names still match"""
+    for name, icd_code, description in [
+        ('Type 2 diabetes mellitus', 'E11', 'Non-insulin-dependent diabetes'),
+        ('Type 2 diabetes mellitus with hyperglycemia', 'E11.65', None),
+        ('Essential hypertension', 'I10', 'High blood pressure'),
+        ('Elevated blood glucose', 'R73.9', 'Hyperglycemia, unspecified')
+    ]:
+        client.post('/api/diagnoses', json={
+            'name': name, 'icd_code': icd_code, 'description': description
+        }, headers=auth_headers)
+    
+    response = client.get('/api/diagnoses/search?q=E11', headers=auth_headers)
+    names = [result['name'] for result in response.get_json()['results']]
+    assert names[:2] == ['Type 2 diabetes mellitus', 'Type 2 diabetes mellitus with hyperglycemia']
+    
+    response = client.get('/api/diagnoses/search?q=diabetis', headers=auth_headers)
+    names = [result['name'] for result in response.get_json()['results']]
+    assert set(names) == {'Type 2 diabetes mellitus', 'Type 2 diabetes mellitus with hyperglycemia'}
+    
+    # Description matches are a fallback after name matches
+    response = client.get('/api/diagnoses?search=hyperglycemia', headers=auth_headers)
+    data = response.get_json()
+    assert [d['name'] for d in data['diagnoses']] == [
+        'Type 2 diabetes mellitus with hyperglycemia', 'Elevated blood glucose'
+    ]
+    assert data['pagination']['total'] == 2
+
+def test_search_diagnoses_reloads_after_ttl(app, client, auth_headers, diagnosis):
+    """Test diagnoses written outside this process show up once the index expires"""
+    from app.extensions import db
+    from app.models.models import Diagnosis
+    
+    client.get('/api/diagnoses/search?q=J45', headers=auth_headers)
+    db.session.execute(Diagnosis.__table__.insert().values(uuid='raw-diagnosis', name='Asthma', icd_code='J45'))
+    db.session.commit()
+    
+    response = client.get('/api/diagnoses/search?q=J45', headers=auth_headers)
+    assert response.get_json()['results'] == []
+    
+    app.config['DIAGNOSIS_SEARCH_INDEX_TTL'] = 0
+    response = client.get('/api/diagnoses/search?q=J45', headers=auth_headers)
+    assert [result['id'] for result in response.get_json()['results']] == ['raw-diagnosis']
+
+def test_medicine_recommendations_follow_prescriptions(app, client, auth_headers, doctor, patient, diagnosis):
+    """Test that co-occurrence counts track prescription writes and drive recommendations"""
+    from app.extensions import db
+    from app.models.models import (
+        Doctor, Patient, Medicine, Prescription, PrescriptionItem, PatientDiagnosis, DiagnosisMedicineStat
+    )
+    from app.services.cooccurrence import pair_counts, rebuild_pair_counts
+    
+    medicines = [Medicine(uuid=f'med-{n}', name=f'Medicine {n}') for n in range(3)]
+    other_doctor = Doctor(uuid='other-doctor', username='other', email='other@test.com',
+                          first_name='Other', last_name='Doctor', password_hash='x')
+    db.session.add_all(medicines + [other_doctor])
+    db.session.commit()
+    
+    def prescribe(*medicine_uuids):
+        response = client.post('/api/prescriptions', json={
+            'patient_id': patient.uuid,
+            'issue_date': '2024-05-01',
+            'items': [{'medicine_id': uuid, 'dosage': '1', 'frequency': 'daily'} for uuid in medicine_uuids],
+            'diagnoses': [{'diagnosis_id': diagnosis.uuid}]
+        }, headers=auth_headers)
+        assert response.status_code == 201
+        return response.get_json()['prescription']['id']
+    
+    first = prescribe('med-0', 'med-1')
+    prescribe('med-0')
+    
+    # Another doctor prescribes Medicine 2 a lot
+    other_patient = Patient(uuid='other-patient', doctor_id=other_doctor.id, first_name='Other',
+                            last_name='Patient', date_of_birth=patient.date_of_birth)
+    db.session.add(other_patient)
+    for n in range(3):
+        prescription = Prescription(uuid=f'other-{n}', doctor_id=other_doctor.id)
+        db.session.add(prescription)
+        prescription.patient = other_patient
+        prescription.items.append(PrescriptionItem(medicine_id=medicines[2].id, dosage='1', frequency='daily'))
+        prescription.diagnoses.append(PatientDiagnosis(patient=other_patient, diagnosis_id=diagnosis.id))
+    db.session.commit()
+    
+    def recommended(**params):
+        response = client.get(f'/api/diagnoses/{diagnosis.uuid}/medicines', query_string=params, headers=auth_headers)
+        assert response.status_code == 200
+        return [(result['id'], result['count']) for result in response.get_json()['results']]
+    
+    assert recommended(doctor_weight=0) == [('med-2', 3), ('med-0', 2), ('med-1', 1)]
+    assert recommended(doctor_weight=2) == [('med-0', 2), ('med-2', 3), ('med-1', 1)]
+    
+    # Weights are clamped to a finite, non-negative range
+    assert recommended(doctor_weight='inf') == [('med-0', 2), ('med-1', 1), ('med-2', 3)]
+    assert recommended(doctor_weight=-5) == recommended(doctor_weight=0)
+    response = client.get(f'/api/diagnoses/{diagnosis.uuid}/medicines?doctor_weight=nan', headers=auth_headers)
+    assert response.status_code == 400
+    
+    # Edits and deletes are reflected incrementally
+    response = client.put(f'/api/prescriptions/{first}', json={
+        'items': [{'medicine_id': 'med-1', 'dosage': '2', 'frequency': 'daily'}]
+    }, headers=auth_headers)
+    assert response.status_code == 200
+    assert recommended(doctor_weight=0) == [('med-2', 3), ('med-0', 1), ('med-1', 1)]
+    
+    response = client.delete(f'/api/prescriptions/{first}', headers=auth_headers)
+    assert response.status_code == 200
+    assert recommended(doctor_weight=0) == [('med-2', 3), ('med-0', 1)]
+    
+    # The incremental counts match a full recomputation
+    incremental = {(row.doctor_id, row.diagnosis_id, row.medicine_id): row.count
+                   for row in DiagnosisMedicineStat.query}
+    assert incremental == {key: count for key, (count, _) in pair_counts(db.session.connection()).items()}
+    assert rebuild_pair_counts() == 2
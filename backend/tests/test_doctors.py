@@ -78,4 +78,82 @@ def test_refresh_token(client, doctor):
     data = json.loads(response.data)
     
     assert response.status_code == 200
-    assert 'access_token' in data
\ No newline at end of file
+    assert 'access_token' in data
+
+def test_doctor_identity_is_cached(app, client, auth_headers, query_counter):
+    """Test that the doctor lookup is served from the identity cache"""
+    app.config['JWT_EMBED_DOCTOR_CLAIMS'] = False
+    client.get('/api/patients', headers=auth_headers)
+    query_counter.clear()
+    
+    response = client.get('/api/patients', headers=auth_headers)
+    
+    assert response.status_code == 200
+    assert not query_counter.reading('doctors')
+
+def test_doctor_identity_invalidated_on_profile_update(app, client, auth_headers, doctor):
+    """Test that updating the profile drops the cached identity"""
+    app.config['JWT_EMBED_DOCTOR_CLAIMS'] = False
+    client.get('/api/patients', headers=auth_headers)
+    cache = app.extensions['doctor_identity_cache']
+    assert cache.get(doctor.uuid) is not None
+    
+    client.put('/api/profile', json={'first_name': 'Changed'}, headers=auth_headers)
+    
+    assert cache.get(doctor.uuid) is None
+
+def test_cached_identity_skips_lookup(app, client, auth_headers, query_counter):
+    """Test that hot read paths need no doctor lookup once the identity is cached"""
+    app.extensions['doctor_identity_cache'].clear()
+    client.get('/api/calendar', headers=auth_headers)
+    query_counter.clear()
+    
+    response = client.get('/api/calendar', headers=auth_headers)
+    
+    assert response.status_code == 200
+    assert not query_counter.reading('doctors')
+
+def test_token_rejected_after_doctor_deleted(app, client, auth_headers, doctor):
+    """Test that tokens of a deleted doctor stop working, even in another process"""
+    from app.extensions import db
+    from app.models.models import Doctor
+    
+    assert client.get('/api/patients', headers=auth_headers).status_code == 200
+    
+    # Deleted by another worker: this process' cache only expires
+    db.session.execute(Doctor.__table__.delete().where(Doctor.id == doctor.id))
+    db.session.commit()
+    app.extensions['doctor_identity_cache'].clear()
+    
+    assert client.get('/api/patients', headers=auth_headers).status_code == 404
+    assert client.get('/api/calendar', headers=auth_headers).status_code == 404
+
+def test_token_rejected_for_inactive_doctor(app, client, doctor):
+    """Test that deactivated doctors and tokens signed as inactive are rejected"""
+    from app.extensions import db
+    from app.models.models import Doctor
+    from flask_jwt_extended import create_access_token
+    
+    inactive_token = create_access_token(identity=doctor.uuid, additional_claims={
+        'doctor_id': doctor.id, 'active': False
+    })
+    response = client.get('/api/patients', headers={'Authorization': f'Bearer {inactive_token}'})
+    assert response.status_code == 404
+    
+    login = client.post('/api/login', json={'username': 'testdoctor', 'password': 'password123'})
+    headers = {'Authorization': f"Bearer {login.get_json()['access_token']}"}
+    Doctor.query.filter_by(id=doctor.id).update({'active': False})
+    db.session.commit()
+    app.extensions['doctor_identity_cache'].clear()
+    
+    assert client.get('/api/patients', headers=headers).status_code == 404
+
+def test_profile_change_forces_lookup(client, auth_headers, query_counter):
+    """Test that a profile change evicts the cached identity so the next request re-reads it"""
+    client.put('/api/profile', json={'first_name': 'Changed'}, headers=auth_headers)
+    query_counter.clear()
+    
+    response = client.get('/api/patients', headers=auth_headers)
+    
+    assert response.status_code == 200
+    assert query_counter.reading('doctors')
@@ -0,0 +1,68 @@
+import pytest
+from datetime import date
+from sqlalchemy import text
+from app.extensions import db
+from app.models.models import (
+    Patient, Appointment, Prescription, PrescriptionItem, PatientDiagnosis, Note, NoteTag
+)
+
+def query_plan(query):
+    """SQLite EXPLAIN QUERY PLAN details for an ORM query"""
+    compiled = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    return [row[3] for row in db.session.execute(text(f'EXPLAIN QUERY PLAN {compiled}'))]
+
+def key_queries():
+    """The doctor- and patient-scoped access patterns of the routes, by name: (table, query)"""
+    start, end = date(2024, 1, 1), date(2024, 1, 31)
+    return {
+        'patient_listing': ('patients', Patient.query.filter_by(doctor_id=1).order_by(
+            Patient.last_name, Patient.first_name, Patient.id
+        )),
+        'appointment_listing': ('appointments', Appointment.query.filter_by(doctor_id=1).filter(
+            Appointment.date >= start, Appointment.date <= end
+        ).order_by(Appointment.date, Appointment.start_time, Appointment.id)),
+        'appointment_conflicts': ('appointments', Appointment.query.filter_by(doctor_id=1, date=start).filter(
+            Appointment.status != 'canceled'
+        )),
+        'prescription_listing': ('prescriptions', Prescription.query.filter_by(doctor_id=1).order_by(
+            Prescription.issue_date.desc(), Prescription.id.desc()
+        )),
+        'patient_prescriptions': ('prescriptions', Prescription.query.filter_by(patient_id=1, doctor_id=1).order_by(
+            Prescription.issue_date.desc()
+        )),
+        'prescription_items': ('prescription_items', PrescriptionItem.query.filter(
+            PrescriptionItem.prescription_id.in_([1, 2, 3])
+        )),
+        'patient_diagnoses': ('patient_diagnoses', PatientDiagnosis.query.filter_by(patient_id=1)),
+        'note_listing': ('notes', Note.query.filter_by(doctor_id=1).order_by(Note.created_at.desc(), Note.id.desc())),
+        'note_tags': ('note_tags', NoteTag.query.filter(NoteTag.note_id.in_([1, 2, 3])))
+    }
+
+@pytest.mark.parametrize('name', [
+    'patient_listing', 'appointment_listing', 'appointment_conflicts', 'prescription_listing',
+    'patient_prescriptions', 'prescription_items', 'patient_diagnoses', 'note_listing', 'note_tags'
+])
+def test_key_queries_use_indexes(app, name):
+    """Test that the key route queries search an index instead of scanning the table"""
+    table, query = key_queries()[name]
+    plan = query_plan(query)
+
+    assert any(step.startswith(f'SEARCH {table} USING') for step in plan), plan
+    assert not any(step.startswith(f'SCAN {table}') for step in plan), plan
+
+def test_listing_orders_come_from_indexes(app):
+    """Test that paginated listings are read in index order without a sort step"""
+    queries = key_queries()
+    for name in ('patient_listing', 'prescription_listing', 'note_listing'):
+        plan = query_plan(queries[name][1].limit(20))
+        assert not any('TEMP B-TREE' in step for step in plan), (name, plan)
+
+def test_ensure_indexes_command(app):
+    """Test that the ensure command recreates a dropped index"""
+    db.session.execute(text('DROP INDEX ix_notes_doctor_created_at'))
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['indexes', 'ensure'])
+
+    assert 'Created index ix_notes_doctor_created_at' in result.output
+    assert 'Created 1 missing indexes' in result.output
@@ -1,5 +1,7 @@
 import json
 import pytest
+from app.extensions import db
+from app.models.models import Medicine
 
 def test_get_medicines(client, auth_headers, medicine):
     """Test getting list of medicines"""
@@ -87,4 +89,43 @@ def test_search_medicines(client, auth_headers, medicine):
             found = True
             break
     
-    assert found, "Original medicine not found in search results"
\ No newline at end of file
+    assert found, "Original medicine not found in search results"
+
+def test_search_medicines_ranking(client, auth_headers, medicine):
+    """Test prefix matches rank ahead of substring matches"""
+    for name in ['Amoxicillin', 'Co-Amoxiclav', 'Ibuprofen']:
+        client.post('/api/medicines', json={'name': name}, headers=auth_headers)
+    
+    response = client.get('/api/medicines/search?q=amox', headers=auth_headers)
+    names = [result['name'] for result in response.get_json()['results']]
+    
+    assert names == ['Amoxicillin', 'Co-Amoxiclav']
+
+def test_search_medicines_follows_catalog_changes(client, auth_headers, medicine, query_counter):
+    """Test the search index is updated by create, update and delete without querying"""
+    response = client.post('/api/medicines', json={'name': 'Paracetamol'}, headers=auth_headers)
+    medicine_uuid = response.get_json()['medicine']['id']
+    
+    client.put(f'/api/medicines/{medicine_uuid}', json={'name': 'Paracetamol Forte'}, headers=auth_headers)
+    
+    query_counter.clear()
+    response = client.get('/api/medicines/search?q=forte', headers=auth_headers)
+    assert [result['id'] for result in response.get_json()['results']] == [medicine_uuid]
+    assert query_counter == []
+    
+    client.delete(f'/api/medicines/{medicine_uuid}', headers=auth_headers)
+    response = client.get('/api/medicines/search?q=para', headers=auth_headers)
+    assert response.get_json()['results'] == []
+
+def test_search_medicines_reloads_after_ttl(app, client, auth_headers, medicine):
+    """Test writes the index never saw (other workers, CLI, raw SQL) show up once it expires"""
+    client.get('/api/medicines/search?q=ibu', headers=auth_headers)
+    db.session.execute(Medicine.__table__.insert().values(uuid='raw-medicine', name='Ibuprofen'))
+    db.session.commit()
+    
+    response = client.get('/api/medicines/search?q=ibu', headers=auth_headers)
+    assert response.get_json()['results'] == []
+    
+    app.config['MEDICINE_SEARCH_INDEX_TTL'] = 0
+    response = client.get('/api/medicines/search?q=ibu', headers=auth_headers)
+    assert [result['id'] for result in response.get_json()['results']] == ['raw-medicine']
@@ -1,3 +1,4 @@
+import base64
 import json
 import pytest
 import uuid
@@ -123,4 +124,127 @@ def test_tags_crud(client, auth_headers):
             found = True
             break
     
-    assert found, "Created tag not found in tags list"
\ No newline at end of file
+    assert found, "Created tag not found in tags list"
+
+@pytest.fixture(scope='function')
+def tagged_notes(app, doctor, patient, appointment):
+    """Create a page worth of notes, each with a couple of tags."""
+    with app.app_context():
+        from app.models.models import Note, Tag, NoteTag
+        from app.extensions import db
+        
+        tags = [Tag(name=f'tag-{i}', color='#cccccc') for i in range(3)]
+        db.session.add_all(tags)
+        db.session.flush()
+        
+        note_uuids = []
+        for i in range(25):
+            note = Note(
+                uuid=str(uuid.uuid4()),
+                doctor_id=doctor.id,
+                patient_id=patient.id,
+                appointment_id=appointment.id,
+                title=f'Note {i}',
+                content=f'Content {i}',
+                category='clinical'
+            )
+            db.session.add(note)
+            db.session.flush()
+            db.session.add(NoteTag(note_id=note.id, tag_id=tags[i % 3].id))
+            db.session.add(NoteTag(note_id=note.id, tag_id=tags[(i + 1) % 3].id))
+            note_uuids.append(note.uuid)
+        
+        db.session.commit()
+        return note_uuids
+
+# count + page (with patients) + tags
+NOTES_PAGE_QUERY_BUDGET = 3
+
+def test_get_notes_query_budget(client, auth_headers, tagged_notes, query_counter):
+    """Test that listing notes does not issue per-note queries"""
+    data = query_counter.get(client, '/api/notes?per_page=25', headers=auth_headers).get_json()
+    
+    assert len(data['notes']) == 25
+    assert all(len(note['tags']) == 2 for note in data['notes'])
+    assert len(query_counter) <= NOTES_PAGE_QUERY_BUDGET
+
+def test_get_note_query_budget(client, auth_headers, tagged_notes, query_counter):
+    """Test that a single note loads its patient, appointment and tags eagerly"""
+    data = query_counter.get(client, f'/api/notes/{tagged_notes[0]}', headers=auth_headers).get_json()
+    
+    assert len(data['tags']) == 2
+    assert 'appointment' in data
+    assert len(query_counter) <= 2
+
+def test_search_notes_full_text(client, auth_headers, patient):
+    """Test ranked full-text note search with snippets and tag filters"""
+    tag = client.post('/api/tags', json={'name': 'cardiology'}, headers=auth_headers).get_json()['tag']
+    
+    response = client.post('/api/notes', json={
+        'patient_id': patient.uuid,
+        'title': 'Routine visit',
+        'content': 'Patient reports mild headaches. Blood pressure normal.'
+    }, headers=auth_headers)
+    routine_uuid = response.get_json()['note']['id']
+    response = client.post('/api/notes', json={
+        'patient_id': patient.uuid,
+        'title': 'Hypertension follow-up',
+        'content': 'Blood pressure elevated again, increase dosage. Recheck blood pressure in two weeks.',
+        'category': 'follow-up',
+        'tags': [tag['id']]
+    }, headers=auth_headers)
+    follow_up_uuid = response.get_json()['note']['id']
+    
+    response = client.get('/api/notes?search=blood pressure', headers=auth_headers)
+    data = response.get_json()
+    assert data['pagination']['total'] == 2
+    assert data['notes'][0]['id'] == follow_up_uuid
+    assert '<mark>' in data['notes'][0]['snippet']
+    
+    # Prefix match on the last word, filtered by category and tag in the same query
+    for filters in ['category=follow-up', f"tag_id={tag['id']}"]:
+        response = client.get(f'/api/notes?search=hypertens&{filters}', headers=auth_headers)
+        assert [note['id'] for note in response.get_json()['notes']] == [follow_up_uuid]
+    
+    # Index follows updates and deletes
+    client.put(f'/api/notes/{follow_up_uuid}', json={'content': 'Resolved.'}, headers=auth_headers)
+    response = client.get('/api/notes?search=dosage', headers=auth_headers)
+    assert response.get_json()['notes'] == []
+    
+    client.delete(f'/api/notes/{routine_uuid}', headers=auth_headers)
+    response = client.get('/api/notes?search=headaches', headers=auth_headers)
+    assert response.get_json()['notes'] == []
+    
+    # Note text is escaped, only the highlights are markup
+    client.post('/api/notes', json={
+        'patient_id': patient.uuid,
+        'content': 'Rash <img src=x onerror=alert(1)> on <script>arm</script>'
+    }, headers=auth_headers)
+    snippet = client.get('/api/notes?search=rash', headers=auth_headers).get_json()['notes'][0]['snippet']
+    assert '<img' not in snippet and '<script>' not in snippet
+    assert '&lt;img' in snippet and '<mark>Rash</mark>' in snippet
+
+def test_get_notes_cursor_pagination(client, auth_headers, tagged_notes, query_counter):
+    """Test walking notes with keyset cursors matches offset pagination and skips the count"""
+    response = client.get('/api/notes?per_page=25', headers=auth_headers)
+    expected = [note['id'] for note in response.get_json()['notes']]
+    
+    seen = []
+    cursor = ''
+    while True:
+        data = query_counter.get(client, f'/api/notes?per_page=10&cursor={cursor}', headers=auth_headers).get_json()
+        # page (with patients) + tags, no COUNT(*)
+        assert len(query_counter) <= NOTES_PAGE_QUERY_BUDGET - 1
+        assert 'total' not in data['pagination']
+        seen.extend(note['id'] for note in data['notes'])
+        if not data['pagination']['has_next']:
+            break
+        cursor = data['pagination']['next_cursor']
+    
+    assert seen == expected
+    
+    # Cursors whose values don't fit the sort columns are rejected
+    for values in ([[1], 2], [1, 2], [{'dt': '2024-01-01T00:00:00'}, 'x'], {'a': 1}, 'x', [1]):
+        crafted = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+        response = client.get(f'/api/notes?cursor={crafted}', headers=auth_headers)
+        assert response.status_code == 400
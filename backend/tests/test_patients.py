@@ -88,4 +88,313 @@ def test_search_patients(client, auth_headers, patient):
             found = True
             break
     
-    assert found, "Original patient not found in search results"
\ No newline at end of file
+    assert found, "Original patient not found in search results"
+
+def test_search_patients_by_phone_and_dob(client, auth_headers, patient):
+    """Test phone digits and date of birth prefix lookups"""
+    response = client.post('/api/patients', json={
+        'first_name': 'John',
+        'last_name': 'Smith',
+        'date_of_birth': '1980-04-12',
+        'phone': '(555) 123-4567'
+    }, headers=auth_headers)
+    smith_uuid = response.get_json()['patient']['id']
+    
+    for query in ['Smi', 'john sm', '555-12', '5551234', '1980-04', '1980-4']:
+        response = client.get(f'/api/patients/search?q={query}', headers=auth_headers)
+        ids = [result['id'] for result in response.get_json()['results']]
+        assert ids == [smith_uuid], query
+    
+    # Token index follows updates
+    client.put(f'/api/patients/{smith_uuid}', json={'last_name': 'Jones', 'phone': '555.999.0000'}, headers=auth_headers)
+    
+    response = client.get('/api/patients/search?q=Smi', headers=auth_headers)
+    assert response.get_json()['results'] == []
+    response = client.get('/api/patients/search?q=555999', headers=auth_headers)
+    assert [result['id'] for result in response.get_json()['results']] == [smith_uuid]
+    
+    response = client.get('/api/patients?search=jones', headers=auth_headers)
+    assert [p['id'] for p in response.get_json()['patients']] == [smith_uuid]
+
+def test_get_patients_cursor_pagination(client, auth_headers, patient):
+    """Test keyset pagination over the patient list"""
+    for first_name in ['Ada', 'Bea', 'Cy']:
+        client.post('/api/patients', json={
+            'first_name': first_name,
+            'last_name': 'Patient',
+            'date_of_birth': '1990-01-01'
+        }, headers=auth_headers)
+    
+    response = client.get('/api/patients?per_page=3&cursor=&include_total=true', headers=auth_headers)
+    data = response.get_json()
+    assert [p['first_name'] for p in data['patients']] == ['Ada', 'Bea', 'Cy']
+    assert data['pagination']['total'] == 4
+    assert data['pagination']['has_next']
+    
+    cursor = data['pagination']['next_cursor']
+    response = client.get(f'/api/patients?per_page=3&cursor={cursor}', headers=auth_headers)
+    data = response.get_json()
+    assert [p['first_name'] for p in data['patients']] == ['Test']
+    assert data['pagination'] == {"per_page": 3, "has_next": False, "next_cursor": None}
+    
+    response = client.get('/api/patients?cursor=not-a-cursor', headers=auth_headers)
+    assert response.status_code == 400
+
+def test_get_patients_cached_total(app, client, auth_headers, patient, query_counter):
+    """Test cached totals skip the COUNT(*) until the table is written"""
+    app.config['COUNT_STRATEGY'] = 'cached'
+    
+    def listing_total():
+        response = query_counter.get(client, '/api/patients', headers=auth_headers)
+        counted = any('count(*)' in statement.lower() for statement in query_counter)
+        return response.get_json()['pagination']['total'], counted
+    
+    assert listing_total() == (1, True)
+    assert listing_total() == (1, False)
+    
+    client.post('/api/patients', json={
+        'first_name': 'New',
+        'last_name': 'Patient',
+        'date_of_birth': '1990-01-01'
+    }, headers=auth_headers)
+    
+    assert listing_total() == (2, True)
+    
+    # Filters are part of the cache key
+    response = client.get('/api/patients?search=new', headers=auth_headers)
+    assert response.get_json()['pagination']['total'] == 1
+
+def test_similar_patients(client, auth_headers, doctor):
+    """Test TF-IDF similar-patient ranking and its incremental updates"""
+    from app.extensions import db
+    from app.models.models import Doctor, Patient, Diagnosis, PatientDiagnosis
+    from app.services.patient_similarity import get_patient_similarity
+    
+    diagnoses = {name: Diagnosis(uuid=f'diag-{name}', name=name) for name in ('common', 'rare', 'other')}
+    patients = {name: Patient(uuid=f'patient-{name}', doctor_id=doctor.id, first_name=name, last_name='Test',
+                              date_of_birth=date(1990, 1, 1)) for name in ('query', 'rare', 'common', 'bystander')}
+    db.session.add_all(list(diagnoses.values()) + list(patients.values()))
+    db.session.flush()
+    
+    links = {
+        'query': ('common', 'rare'),
+        'rare': ('rare',),
+        'common': ('common',),
+        'bystander': ('common', 'other')
+    }
+    for patient_name, diagnosis_names in links.items():
+        for diagnosis_name in diagnosis_names:
+            db.session.add(PatientDiagnosis(patient_id=patients[patient_name].id,
+                                            diagnosis_id=diagnoses[diagnosis_name].id))
+    db.session.commit()
+    
+    def similar(**params):
+        response = client.get('/api/patients/patient-query/similar', query_string=params, headers=auth_headers)
+        assert response.status_code == 200
+        return [result['first_name'] for result in response.get_json()['results']]
+    
+    # Sharing the rare diagnosis outweighs sharing the common one
+    assert similar() == ['rare', 'common', 'bystander']
+    assert similar(metric='jaccard') == ['rare', 'common', 'bystander']
+    
+    # Committed diagnosis changes update the loaded matrix
+    link = PatientDiagnosis.query.filter_by(patient_id=patients['rare'].id, diagnosis_id=diagnoses['rare'].id).first()
+    db.session.delete(link)
+    db.session.add(PatientDiagnosis(patient_id=patients['common'].id, diagnosis_id=diagnoses['rare'].id))
+    db.session.commit()
+    
+    assert similar(limit=2) == ['common', 'bystander']
+    
+    # Writes the engine never saw are picked up once the matrix expires
+    db.session.execute(PatientDiagnosis.__table__.delete().where(
+        PatientDiagnosis.patient_id == patients['bystander'].id
+    ))
+    db.session.commit()
+    assert similar(limit=2) == ['common', 'bystander']
+    get_patient_similarity().ttl = 0
+    assert similar(limit=2) == ['common']
+    
+    # Only the doctor's own patients are returned, even from a stale matrix
+    get_patient_similarity().ttl = 300
+    other_doctor = Doctor(uuid='other-doctor', username='other', email='other@test.com',
+                          first_name='Other', last_name='Doctor')
+    other_doctor.set_password('password123')
+    db.session.add(other_doctor)
+    db.session.commit()
+    db.session.execute(Patient.__table__.update().where(Patient.id == patients['common'].id).values(
+        doctor_id=other_doctor.id
+    ))
+    db.session.commit()
+    assert similar(limit=2) == []
+    
+    response = client.get('/api/patients/patient-query/similar?metric=euclid', headers=auth_headers)
+    assert response.status_code == 400
+
+def test_similarity_matrix_matches_brute_force():
+    """Test sparse top-k cosine and Jaccard scores against a dense brute-force computation"""
+    import math
+    import random
+    from app.services.patient_similarity import PatientDiagnosisMatrix
+    
+    generator = random.Random(7)
+    rows = {patient_id: set(generator.sample(range(30), generator.randint(1, 6))) for patient_id in range(200)}
+    matrix = PatientDiagnosisMatrix([(patient_id, diagnosis_id)
+                                     for patient_id, diagnoses in rows.items() for diagnosis_id in diagnoses])
+    
+    frequency = {diagnosis_id: sum(diagnosis_id in diagnoses for diagnoses in rows.values())
+                 for diagnosis_id in range(30)}
+    weight = {diagnosis_id: (math.log((1 + len(rows)) / (1 + count)) + 1) ** 2
+              for diagnosis_id, count in frequency.items()}
+    norm = {patient_id: math.sqrt(sum(weight[d] for d in diagnoses)) for patient_id, diagnoses in rows.items()}
+    
+    def brute_force(patient_id, metric):
+        scores = {}
+        for other, diagnoses in rows.items():
+            shared = rows[patient_id] & diagnoses
+            if other == patient_id or not shared:
+                continue
+            if metric == 'jaccard':
+                scores[other] = len(shared) / len(rows[patient_id] | diagnoses)
+            else:
+                scores[other] = sum(weight[d] for d in shared) / (norm[patient_id] * norm[other])
+        return scores
+    
+    for patient_id in range(0, 200, 10):
+        for metric in ('cosine', 'jaccard'):
+            expected = brute_force(patient_id, metric)
+            results = matrix.similar(patient_id, limit=10, metric=metric)
+            assert len(results) == min(10, len(expected))
+            
+            # Same scores, and nothing left out scores higher than the last result
+            for other, score, shared in results:
+                assert score == pytest.approx(expected[other])
+                assert shared == len(rows[patient_id] & rows[other])
+            if results:
+                cutoff = results[-1][1]
+                returned = {other for other, _, _ in results}
+                assert all(score <= cutoff + 1e-9 for other, score in expected.items() if other not in returned)
+
+def test_similarity_reload_runs_outside_the_lock(monkeypatch):
+    """Test matrices are loaded without holding the engine lock and reloaded if a commit lands meanwhile"""
+    import threading
+    from app.services.patient_similarity import PatientDiagnosisMatrix, PatientSimilarityEngine
+    
+    engine = PatientSimilarityEngine(ttl=300)
+    loads = []
+    
+    def load(doctor_id):
+        acquired = []
+        
+        def take_lock():
+            acquired.append(engine._lock.acquire(timeout=1))
+            if acquired[0]:
+                engine._lock.release()
+        
+        thread = threading.Thread(target=take_lock)
+        thread.start()
+        thread.join()
+        loads.append(acquired[0])
+        if len(loads) == 1:
+            engine.apply([('add', 1, 9)])
+        return [1, 2], PatientDiagnosisMatrix([(1, 5), (2, 5)])
+    
+    monkeypatch.setattr(engine, '_load', load)
+    
+    for _ in range(3):
+        assert engine.similar(7, 1, limit=1)[0][0] == 2
+    # The first snapshot raced a commit, so it was published already expired
+    assert loads == [True, True]
+
+def test_approximate_similar_patients(client, auth_headers, doctor):
+    """Test the MinHash/LSH index follows diagnosis changes and answers approximate lookups"""
+    from app.extensions import db
+    from app.models.models import Patient, Diagnosis, PatientDiagnosis, PatientSignature, PatientLSHBucket
+    from app.services.patient_lsh import NUM_BANDS, rebuild_patient_signatures
+    
+    diagnoses = [Diagnosis(uuid=f'diag-{n}', name=f'Condition {n}') for n in range(6)]
+    patients = {name: Patient(uuid=f'patient-{name}', doctor_id=doctor.id, first_name=name, last_name='Test',
+                              date_of_birth=date(1990, 1, 1)) for name in ('query', 'twin', 'partial', 'stranger')}
+    db.session.add_all(diagnoses + list(patients.values()))
+    db.session.flush()
+    
+    links = {'query': (0, 1, 2, 3), 'twin': (0, 1, 2, 3), 'partial': (0, 1, 2, 4), 'stranger': (5,)}
+    for patient_name, indexes in links.items():
+        for index in indexes:
+            db.session.add(PatientDiagnosis(patient_id=patients[patient_name].id, diagnosis_id=diagnoses[index].id))
+    db.session.commit()
+    
+    query_id = patients['query'].id
+    signature = db.session.get(PatientSignature, query_id).signature
+    assert PatientLSHBucket.query.filter_by(patient_id=query_id).count() == NUM_BANDS
+    
+    def similar():
+        response = client.get('/api/patients/patient-query/similar?approximate=true', headers=auth_headers)
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['approximate'] is True and data['metric'] == 'jaccard'
+        return [(result['first_name'], result['score']) for result in data['results']]
+    
+    # Identical diagnoses always collide; disjoint ones never do
+    results = similar()
+    assert results[0] == ('twin', 1.0)
+    assert 'stranger' not in [name for name, _ in results]
+    
+    # Flushed diagnosis changes update the signature and buckets
+    db.session.add(PatientDiagnosis(patient_id=query_id, diagnosis_id=diagnoses[5].id))
+    db.session.commit()
+    assert db.session.get(PatientSignature, query_id).signature != signature
+    assert similar()[0][0] == 'twin' and similar()[0][1] < 1.0
+    
+    PatientDiagnosis.query.filter_by(patient_id=query_id, diagnosis_id=diagnoses[5].id).delete()
+    db.session.commit()
+    rebuild_patient_signatures(doctor.id)
+    assert db.session.get(PatientSignature, query_id).signature == signature
+    
+    # Patients without diagnoses leave the index
+    twin_id = patients['twin'].id
+    for link in PatientDiagnosis.query.filter_by(patient_id=twin_id):
+        db.session.delete(link)
+    db.session.commit()
+    assert db.session.get(PatientSignature, twin_id) is None
+    assert PatientLSHBucket.query.filter_by(patient_id=twin_id).count() == 0
+    assert 'twin' not in [name for name, _ in similar()]
+    
+    # Rows indexed meanwhile by a concurrent transaction are overwritten, not a conflict
+    db.session.execute(PatientSignature.__table__.insert().values(
+        patient_id=twin_id, doctor_id=doctor.id, signature=signature
+    ))
+    db.session.execute(PatientLSHBucket.__table__.insert().values(
+        patient_id=twin_id, band=0, bucket=1, doctor_id=doctor.id
+    ))
+    db.session.add(PatientDiagnosis(patient_id=twin_id, diagnosis_id=diagnoses[5].id))
+    db.session.commit()
+    assert db.session.get(PatientSignature, twin_id).signature != signature
+    assert PatientLSHBucket.query.filter_by(patient_id=twin_id, band=0).one().bucket != 1
+
+def test_lsh_recall_on_clustered_patients(app, doctor):
+    """Test approximate lookups recall most of the exact Jaccard top-k"""
+    import random
+    from app.extensions import db
+    from app.models.models import Patient, Diagnosis, PatientDiagnosis
+    from app.services.patient_lsh import benchmark_lsh, rebuild_patient_signatures
+    
+    generator = random.Random(11)
+    diagnoses = [Diagnosis(uuid=f'diag-{n}', name=f'Condition {n}') for n in range(200)]
+    patients = [Patient(uuid=f'patient-{n}', doctor_id=doctor.id, first_name=f'Patient {n}', last_name='Test',
+                        date_of_birth=date(1990, 1, 1)) for n in range(300)]
+    db.session.add_all(diagnoses + patients)
+    db.session.flush()
+    
+    # Patients of a cluster share most of a 6-diagnosis profile plus some noise
+    profiles = [generator.sample(diagnoses, 6) for _ in range(20)]
+    for patient in patients:
+        profile = generator.choice(profiles)
+        chosen = set(generator.sample(profile, 5)) | set(generator.sample(diagnoses, 2))
+        db.session.add_all(PatientDiagnosis(patient_id=patient.id, diagnosis_id=diagnosis.id) for diagnosis in chosen)
+    db.session.commit()
+    
+    assert rebuild_patient_signatures(doctor.id) == 300
+    
+    result = benchmark_lsh(doctor.id, samples=50, limit=5)
+    assert result['patients'] == 300 and result['samples'] == 50
+    assert result['recall'] >= 0.8
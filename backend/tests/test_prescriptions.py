@@ -91,6 +91,60 @@ def test_create_prescription(client, auth_headers, patient, medicine):
     assert len(check_data['items']) == 1
     assert check_data['items'][0]['dosage'] == '2 tablets'
 
+def test_create_prescription_is_atomic(client, auth_headers, patient, medicine, diagnosis, query_counter):
+    """Test that prescriptions are validated up front and written with batched lookups"""
+    items = [
+        {'medicine_id': medicine.uuid, 'dosage': f'{n} tablets', 'frequency': 'daily'} for n in range(1, 11)
+    ]
+    payload = {
+        'patient_id': patient.uuid,
+        'items': items + [{'medicine_id': 'missing', 'dosage': '1 tablet', 'frequency': 'daily'}]
+    }
+    
+    # A bad item leaves nothing behind
+    response = client.post('/api/prescriptions', json=payload, headers=auth_headers)
+    assert response.status_code == 404
+    response = client.get('/api/prescriptions', headers=auth_headers)
+    assert response.get_json()['pagination']['total'] == 0
+    
+    query_counter.clear()
+    response = client.post('/api/prescriptions', json=dict(payload, items=items, diagnoses=[
+        {'diagnosis_id': diagnosis.uuid},
+        {'diagnosis_name': 'New Condition'},
+        {'diagnosis_name': 'new condition'}
+    ]), headers=auth_headers)
+    assert response.status_code == 201
+    
+    # patient + medicines + diagnoses + the patient's diagnoses for the
+    # similarity index, regardless of the number of items
+    assert len(query_counter.selects()) <= 4, query_counter.selects()
+    
+    check_data = client.get(f"/api/prescriptions/{response.get_json()['prescription']['id']}",
+                            headers=auth_headers).get_json()
+    assert len(check_data['items']) == 10
+    assert len(check_data['diagnoses']) == 3
+    assert len({entry['name'] for entry in check_data['diagnoses']}) == 2
+    
+    # Values of the wrong type are rejected, not a server error
+    for bad_payload in (
+        {'items': [{'medicine_id': [1], 'dosage': '1', 'frequency': 'daily'}]},
+        {'items': [{'medicine_id': 42, 'dosage': '1', 'frequency': 'daily'}]},
+        {'items': ['aspirin']},
+        {'items': [{'medicine_id': items[0]['medicine_id'], 'dosage': {'amount': 1}, 'frequency': 'daily'}]},
+        {'items': items, 'diagnoses': [{'diagnosis_name': {'name': 'x'}}]}
+    ):
+        response = client.post('/api/prescriptions', json=dict(bad_payload, patient_id=patient.uuid),
+                               headers=auth_headers)
+        assert response.status_code == 400
+    
+    response = client.put(f"/api/prescriptions/{check_data['id']}", json={'items': [{'id': [1]}]},
+                          headers=auth_headers)
+    assert response.status_code == 400
+    
+    response = client.put(f"/api/prescriptions/{check_data['id']}", json={'items': [{'frequency': 2}]},
+                          headers=auth_headers)
+    assert response.status_code == 400
+
 def test_update_prescription(client, auth_headers, prescription):
     """Test updating a prescription"""
     response = client.put(f'/api/prescriptions/{prescription.uuid}', json={
@@ -137,4 +191,65 @@ def test_patient_prescriptions(client, auth_headers, patient, prescription):
             found = True
             break
     
-    assert found, "Test prescription not found in patient prescriptions"
\ No newline at end of file
+    assert found, "Test prescription not found in patient prescriptions"
+
+@pytest.fixture(scope='function')
+def prescription_history(app, doctor, patient, appointment, diagnosis):
+    """Create a chronic patient's prescription history with several items each."""
+    with app.app_context():
+        from app.models.models import Prescription, PrescriptionItem, PatientDiagnosis, Medicine
+        from app.extensions import db
+        
+        medicines = [Medicine(uuid=str(uuid.uuid4()), name=f'History Medicine {i}') for i in range(4)]
+        db.session.add_all(medicines)
+        db.session.flush()
+        
+        prescription_uuids = []
+        for i in range(10):
+            prescription = Prescription(
+                uuid=str(uuid.uuid4()),
+                doctor_id=doctor.id,
+                patient_id=patient.id,
+                appointment_id=appointment.id,
+                issue_date=date.today() - timedelta(days=i * 30)
+            )
+            db.session.add(prescription)
+            db.session.flush()
+            
+            for medicine in medicines:
+                db.session.add(PrescriptionItem(
+                    prescription_id=prescription.id,
+                    medicine_id=medicine.id,
+                    dosage='1 tablet',
+                    frequency='daily'
+                ))
+            db.session.add(PatientDiagnosis(
+                patient_id=patient.id,
+                diagnosis_id=diagnosis.id,
+                prescription_id=prescription.id
+            ))
+            prescription_uuids.append(prescription.uuid)
+        
+        db.session.commit()
+        return prescription_uuids
+
+def test_prescription_reads_query_budget(client, auth_headers, patient, prescription_history, query_counter):
+    """Test that prescription read endpoints use a fixed number of queries"""
+    response = query_counter.get(client, '/api/prescriptions', headers=auth_headers)
+    assert all(p['medicines_count'] == 4 for p in response.get_json()['prescriptions'])
+    assert len(query_counter) <= 3
+    assert not any('medicines' in statement for statement in query_counter)
+    
+    response = query_counter.get(client, f'/api/patients/{patient.uuid}/prescriptions', headers=auth_headers)
+    assert all(len(p['medicines']) == 4 for p in response.get_json()['prescriptions'])
+    assert len(query_counter) <= 4
+    
+    data = query_counter.get(client, f'/api/prescriptions/{prescription_history[0]}', headers=auth_headers).get_json()
+    assert len(data['items']) == 4
+    assert len(data['diagnoses']) == 1
+    assert 'appointment' in data
+    assert len(query_counter) <= 3
+    
+    # The export placeholder only needs the prescription itself
+    query_counter.get(client, f'/api/prescriptions/export/{prescription_history[0]}', headers=auth_headers)
+    assert not query_counter.reading('prescription_items', 'patient_diagnoses')
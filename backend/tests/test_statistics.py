@@ -74,4 +74,96 @@ def test_get_prescription_statistics(client, auth_headers, prescription):
     assert 'top_medicines' in data
     
     # Verify our prescription is included in the stats
-    assert data['prescriptions']['total'] >= 1
\ No newline at end of file
+    assert data['prescriptions']['total'] >= 1
+
+def test_overview_statistics_aggregate_queries(client, auth_headers, patient, appointment, prescription, query_counter):
+    """Test that the overview is computed in a handful of aggregate queries"""
+    data = query_counter.get(client, '/api/stats/overview', headers=auth_headers).get_json()
+    
+    assert data['patients'] == {'total': 1, 'new_this_month': 1}
+    assert data['appointments']['today'] == 1
+    assert data['prescriptions'] == {'total': 1, 'this_month': 1}
+    assert len(query_counter) <= 4
+
+def test_patient_statistics_grouped_queries(client, auth_headers, patient, query_counter):
+    """Test that age groups and monthly signups each use a single grouped query"""
+    data = query_counter.get(client, '/api/stats/patients', headers=auth_headers).get_json()
+    
+    assert len(data['new_patients']) == 12
+    assert data['new_patients'][-1] == {'month': date.today().strftime('%Y-%m'), 'count': 1}
+    assert len(query_counter) <= 4
+
+def test_patient_statistics_custom_range(client, auth_headers, patient):
+    """Test the new patients histogram over a custom range"""
+    response = client.get('/api/stats/patients?months=3', headers=auth_headers)
+    assert len(response.get_json()['new_patients']) == 3
+    
+    response = client.get('/api/stats/patients?start_date=2020-01-15&end_date=2020-03-01', headers=auth_headers)
+    assert [m['month'] for m in response.get_json()['new_patients']] == ['2020-01', '2020-02', '2020-03']
+    
+    for params in ('months=0', 'months=999999999', 'start_date=0001-01-01&end_date=9999-12-31'):
+        response = client.get(f'/api/stats/patients?{params}', headers=auth_headers)
+        assert response.status_code == 400
+
+def test_prescription_statistics_by_month_range(client, auth_headers, prescription, query_counter):
+    """Test the monthly prescription series over a configurable range"""
+    data = query_counter.get(client, '/api/stats/prescriptions?months=36', headers=auth_headers).get_json()
+    
+    assert len(data['by_month']) == 36
+    assert data['by_month'][-1] == {'month': date.today().strftime('%Y-%m'), 'count': 1}
+    assert len(query_counter) <= 3
+    
+    response = client.get('/api/stats/prescriptions?start_date=2021-11-01&end_date=2022-02-10', headers=auth_headers)
+    data = json.loads(response.data)
+    assert [m['month'] for m in data['by_month']] == ['2021-11', '2021-12', '2022-01', '2022-02']
+    assert all(m['count'] == 0 for m in data['by_month'])
+
+def rollup_snapshot():
+    from app.models.models import DailyStatRollup
+    return sorted(
+        (r.doctor_id, r.metric, r.day, r.dimension, r.count)
+        for r in DailyStatRollup.query.all() if r.count
+    )
+
+def test_rollups_follow_writes(app, client, auth_headers, appointment, prescription, query_counter):
+    """Test that rollups track updates and deletes and are served without scanning fact tables"""
+    client.put(f'/api/appointments/{appointment.uuid}', json={'status': 'completed'}, headers=auth_headers)
+    client.delete(f'/api/prescriptions/{prescription.uuid}', headers=auth_headers)
+    query_counter.clear()
+    
+    response = client.get('/api/stats/overview', headers=auth_headers)
+    data = json.loads(response.data)
+    
+    assert data['appointments']['completed'] == 1
+    assert data['prescriptions']['total'] == 0
+    assert not query_counter.reading('appointments', 'prescriptions')
+
+def test_rebuild_rollups_command(app, appointment, prescription):
+    """Test that rebuilding the rollups reproduces the incrementally maintained rows"""
+    with app.app_context():
+        incremental = rollup_snapshot()
+    
+    result = app.test_cli_runner().invoke(args=['stats', 'rebuild-rollups'])
+    
+    assert result.exit_code == 0
+    with app.app_context():
+        assert rollup_snapshot() == incremental
+
+def test_export_statistics_csv(client, auth_headers, appointment, prescription):
+    """Test streaming CSV exports"""
+    # Streamed bodies are consumed and closed so each request context is popped in order
+    with client.get('/api/stats/export?type=prescriptions', headers=auth_headers) as response:
+        assert response.status_code == 200
+        assert response.mimetype == 'text/csv'
+        lines = response.get_data(as_text=True).strip().splitlines()
+    assert lines[0].startswith('id,issue_date')
+    assert len(lines) == 2
+    assert 'Test Medicine' in lines[1]
+    
+    for export_type in ('appointments', 'patients', 'diagnoses'):
+        with client.get(f'/api/stats/export?type={export_type}', headers=auth_headers) as response:
+            assert response.status_code == 200
+            assert response.get_data(as_text=True).splitlines()[0]
+    
+    response = client.get('/api/stats/export?type=unknown', headers=auth_headers)
+    assert response.status_code == 400